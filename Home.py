@@ -14,8 +14,13 @@ from mypylib.auth_utils import is_valid_phone_number
 from mypylib.azure_speech import speech_synthesis_get_available_voices
 from mypylib.constants import LANGUAGES
 from mypylib.db_interface import DbInterface
-from mypylib.db_model import PaymentStatus, UserRole, str_to_enum
-from mypylib.st_helper import check_and_force_logout, get_firestore_client, setup_logger
+from mypylib.db_model import PaymentStatus, UserRole, UserServiceInfo, str_to_enum
+from mypylib.st_helper import (
+    check_and_force_logout,
+    end_run,
+    get_firestore_client,
+    setup_logger,
+)
 
 # 创建或获取logger对象
 logger = logging.getLogger("streamlit")
@@ -87,10 +92,11 @@ check_and_force_logout(sidebar_status)
 
 def extend_service_period():
     # if is_logged_in:
-    db = st.session_state.dbi.db
     extend_time_btn_disabled = False
     # 获取用户的数据
-    user_dic = st.session_state.dbi.get_user(False)
+    user_dic = st.session_state.dbi.get_user(
+        False, UserServiceInfo, fields=["last_received_date"]
+    )
     # 获取用户角色
     user_role = str_to_enum(user_dic.get("user_role"), UserRole)
     # 定义角色范围
@@ -103,10 +109,10 @@ def extend_service_period():
     timezone = pytz.timezone(user_tz)
     # 获取当前的日期和时间
     current_datetime = datetime.now(timezone)
-    # 查询在服务期内，处于服务状态的支付记录
-    payment_record = st.session_state.dbi.get_last_active_payment()
+    # 服务到期时间冗余保存在用户文档中，无需查询支付记录
+    expiry_time = user_dic.get("service_expiry_time")
 
-    if not payment_record:
+    if not expiry_time or not user_dic.get("service_order_id"):
         return
 
     # 限制在正常时段才能领取
@@ -119,7 +125,7 @@ def extend_service_period():
     last_received_date = user_dic.get("last_received_date")
     # 检查 last_received_date 是否存在并且是 datetime 对象
     if last_received_date and isinstance(last_received_date, datetime):
-        if current_datetime.date() == last_received_date.date():
+        if current_datetime.date() == last_received_date.astimezone(timezone).date():
             extend_time_btn_disabled = True
 
     extend_time_btn = s_cols[2].button(
@@ -128,50 +134,23 @@ def extend_service_period():
         help="✨ 付费用户每天上午6点至下午8点打卡。奖励1小时。",
     )
 
-    if extend_time_btn and payment_record:
-        # 获取用户的到期时间
-        expiry_time = payment_record.get("expiry_time", datetime.now(timezone))
-
-        # 增加1小时
-        new_expiry_time = expiry_time + timedelta(hours=1)
-
-        # 更新用户的到期时间
-
-        # 获取订单号
-        order_id = payment_record.get("order_id")
-
-        # logger.info(f"订单号：{order_id}")
-
-        # 获取 payments 集合中的文档引用
-        doc_ref = db.collection("payments").document(order_id)
-
-        # 更新 expiry_time 字段
-        doc_ref.update({"expiry_time": new_expiry_time})
-
-        # 获取手机号码
-        phone_number = user_dic["phone_number"]
-
-        # 获取 users 集合中的文档引用
-        doc_ref = db.collection("users").document(phone_number)
-
-        # 更新 last_received_date 字段
-        doc_ref.update({"last_received_date": current_datetime})
+    if extend_time_btn:
+        # 在事务中同时更新订单与用户文档的到期时间，增加1小时
+        st.session_state.dbi.extend_service_time(timedelta(hours=1), current_datetime)
 
         # 重新刷新
         st.rerun()
 
-    if payment_record:
-        # 计算剩余的时间
-        expiry_time = payment_record.get("expiry_time", datetime.now(timezone))
-        remaining_time = (expiry_time - datetime.now(timezone)).total_seconds()
-        remaining_days = remaining_time // (24 * 60 * 60)
-        remaining_hours = (remaining_time - remaining_days * 24 * 60 * 60) // 3600
-        remaining_minutes = (
-            remaining_time - remaining_days * 24 * 60 * 60 - remaining_hours * 3600
-        ) // 60
-        sidebar_status.info(
-            f"剩余{remaining_days:.0f}天{remaining_hours:.0f}小时{remaining_minutes:.0f}分钟到期"
-        )
+    # 计算剩余的时间
+    remaining_time = (expiry_time - datetime.now(timezone)).total_seconds()
+    remaining_days = remaining_time // (24 * 60 * 60)
+    remaining_hours = (remaining_time - remaining_days * 24 * 60 * 60) // 3600
+    remaining_minutes = (
+        remaining_time - remaining_days * 24 * 60 * 60 - remaining_hours * 3600
+    ) // 60
+    sidebar_status.info(
+        f"剩余{remaining_days:.0f}天{remaining_hours:.0f}小时{remaining_minutes:.0f}分钟到期"
+    )
 
 
 # 登录用户才能使用免费功能
@@ -283,3 +262,6 @@ if is_logged_in:
         sidebar_status.success("已退出登录")
         time.sleep(1)
         st.rerun()
+
+# 提交本次运行中排队的写入，记录本次运行的 RPC 数量
+end_run()
@@ -0,0 +1,250 @@
+import asyncio
+import functools
+import threading
+from typing import Dict, List, Sequence, Type
+
+from google.cloud import firestore
+from google.cloud.firestore import FieldFilter
+from google.cloud.firestore_v1.field_path import render_field_path
+
+from .db_cache import MISSING, document_cache, normalize_field_mask
+from .db_interface import GET_ALL_CHUNK_SIZE, DbInterface, find_word_in_bundle
+from .db_model import PaymentStatus, User, UserTokenCount
+from .mini_dict_replica import get_running_replica
+
+# region 事件循环
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """
+    返回进程内共享的后台事件循环。
+
+    Streamlit 脚本运行在普通线程中，AsyncClient 的 gRPC 通道又与创建它的
+    事件循环绑定，因此所有异步调用都提交到同一个常驻线程中的事件循环执行。
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="async-firestore", daemon=True
+            ).start()
+        return _loop
+
+
+def run_in_background_loop(coro):
+    """在后台事件循环中运行协程并等待结果。"""
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop()).result()
+
+
+def run_concurrently(*coros) -> list:
+    """
+    并发运行多个协程，按传入顺序返回结果。
+
+    总耗时取决于最慢的调用，而不是各调用耗时之和。任一调用出错时抛出该异常。
+
+    Example:
+        user, payment = run_concurrently(adbi.get_user(), adbi.get_last_active_payment())
+    """
+
+    async def gather():
+        return await asyncio.gather(*coros)
+
+    return run_in_background_loop(gather())
+
+
+# endregion
+
+
+class AsyncDbInterface:
+    """
+    基于 Firestore AsyncClient 的 DbInterface 异步版本。
+
+    与同步的 DbInterface 共享会话缓存（登录信息、个人词库）及进程级文档缓存，
+    常用的读取方法直接使用 AsyncClient 实现；其余方法与 DbInterface 同名，
+    在线程池中调用同步实现，因此方法集合与 DbInterface 一致，调用时均需 await。
+    经由 AsyncClient 的读取不计入 rpc_stats 统计。
+    """
+
+    def __init__(self, async_client, dbi: DbInterface):
+        self.db = async_client
+        self.dbi = dbi
+        self.cache = dbi.cache
+
+    def __getattr__(self, name):
+        attr = getattr(self.dbi, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+
+        return wrapper
+
+    # region 文档缓存
+
+    async def _get_doc_dict(
+        self, collection: str, doc_id: str, refresh: bool = False, fields=None
+    ):
+        """异步读取文档并返回字典，与 DbInterface._get_doc_dict 共用文档缓存。"""
+        mask = normalize_field_mask(fields) if fields is not None else None
+        # 与 DbInterface 共用本次运行的标识映射
+        data = self.dbi._run_get(collection, doc_id, mask)
+        if data is not MISSING:
+            return data
+        if not refresh:
+            cached = document_cache.get(collection, doc_id, mask)
+            if cached is not MISSING:
+                self.dbi._run_set(collection, doc_id, cached, mask)
+                return cached
+        doc_ref = self.db.collection(collection).document(doc_id)
+        if mask is None:
+            doc = await doc_ref.get()
+        else:
+            doc = await doc_ref.get(
+                field_paths=[render_field_path(path) for path in mask]
+            )
+        data = doc.to_dict() if doc.exists else None
+        document_cache.set(collection, doc_id, data, mask)
+        self.dbi._run_set(collection, doc_id, data, mask)
+        return data
+
+    # endregion
+
+    # region 用户管理
+
+    async def get_user(
+        self,
+        return_object=True,
+        model: Type = User,
+        fields: Sequence[str] = (),
+    ):
+        """读取当前用户的文档，参数与 DbInterface.get_user 相同。"""
+        phone_number = self.cache.get("user_info", {}).get("phone_number", "")
+        if not phone_number:
+            return None
+        mask = None if model is User else [*model.field_mask, *fields]
+        user_data = await self._get_doc_dict("users", phone_number, fields=mask)
+        if user_data is None:
+            return None
+        user_data["phone_number"] = phone_number  # 添加手机号码
+        return model.from_doc(user_data) if return_object else user_data
+
+    async def get_token_count(self):
+        phone_number = self.cache["user_info"]["phone_number"]
+        user_data = await self._get_doc_dict(
+            "users", phone_number, fields=UserTokenCount.field_mask
+        )
+        return user_data.get("total_tokens", 0) if user_data is not None else 0
+
+    # endregion
+
+    # region 支付管理
+
+    async def get_last_active_payment(self):
+        phone_number = self.cache["user_info"]["phone_number"]
+        cache_key = ("last_active", phone_number)
+        cached = document_cache.get("payments", cache_key)
+        if cached is not MISSING:
+            return cached
+        query = (
+            self.db.collection("payments")
+            .where(filter=FieldFilter("phone_number", "==", phone_number))
+            .where(filter=FieldFilter("status", "==", PaymentStatus.IN_SERVICE))
+            .order_by("payment_time", direction=firestore.Query.DESCENDING)
+            .limit(1)
+        )
+        docs = await query.get()
+        payment = {"order_id": docs[0].id, **docs[0].to_dict()} if docs else {}
+        document_cache.set("payments", cache_key, payment)
+        return payment
+
+    # endregion
+
+    # region 单词管理
+
+    async def find_word(self, word, fields=None):
+        doc_name = word.replace("/", " or ")
+        doc_dict = find_word_in_bundle(doc_name, fields)
+        if doc_dict is not None:
+            return doc_dict
+        doc_dict = await self._get_doc_dict("words", doc_name, fields=fields)
+        return doc_dict if doc_dict is not None else {}
+
+    async def get_mini_dict_doc(self, word: str) -> dict:
+        doc_name = word.replace("/", " or ")
+        # 与 DbInterface 相同，优先使用进程内的本地副本
+        replica = get_running_replica(self.dbi.db)
+        doc_dict = replica.get(doc_name) if replica is not None else None
+        if doc_dict is None:
+            doc_dict = await self._get_doc_dict("mini_dict", doc_name)
+        return doc_dict if doc_dict is not None else {}
+
+    async def _get_all_mini_dict_docs(self, doc_names: List[str]) -> Dict[str, dict]:
+        collection = self.db.collection("mini_dict")
+        refs = [collection.document(name) for name in doc_names]
+        res = {name: None for name in doc_names}
+        async for doc in self.db.get_all(refs):
+            res[doc.id] = doc.to_dict() if doc.exists else None
+        for name, data in res.items():
+            document_cache.set("mini_dict", name, data)
+            self.dbi._run_set("mini_dict", name, data)
+        return res
+
+    async def get_mini_dict_docs(self, words: List[str]) -> Dict[str, dict]:
+        """批量获取简版词典文档，本地副本及缓存中没有的单词分批并发执行 get_all 请求。"""
+        doc_names = {word: word.replace("/", " or ") for word in words}
+        replica = get_running_replica(self.dbi.db)
+        found = (
+            replica.get_many(list(doc_names.values())) if replica is not None else {}
+        )
+        to_fetch = []
+        for name in dict.fromkeys(doc_names.values()):
+            if name in found:
+                continue
+            cached = self.dbi._run_get("mini_dict", name)
+            if cached is MISSING:
+                cached = document_cache.get("mini_dict", name)
+            if cached is MISSING:
+                to_fetch.append(name)
+            else:
+                found[name] = cached
+        results = await asyncio.gather(
+            *[
+                self._get_all_mini_dict_docs(to_fetch[i : i + GET_ALL_CHUNK_SIZE])
+                for i in range(0, len(to_fetch), GET_ALL_CHUNK_SIZE)
+            ]
+        )
+        for res in results:
+            found.update(res)
+        return {word: found.get(name) or {} for word, name in doc_names.items()}
+
+    async def word_has_image_urls(self, word: str) -> bool:
+        doc_dict = await self._get_doc_dict("mini_dict", word)
+        return doc_dict is not None and bool(doc_dict.get("image_urls"))
+
+    async def get_image_indices(self, doc_name):
+        doc_dict = await self._get_doc_dict("mini_dict", doc_name)
+        if doc_dict is not None and "image_indices" in doc_dict:
+            return doc_dict["image_indices"]
+        return []
+
+    async def word_has_image_indices(self, word: str) -> bool:
+        doc_dict = await self._get_doc_dict("mini_dict", word)
+        return doc_dict is not None and "image_indices" in doc_dict
+
+    async def find_docs_without_image_indices(self, doc_names):
+        docs = await asyncio.gather(
+            *[self._get_doc_dict("mini_dict", name) for name in doc_names]
+        )
+        return [
+            name
+            for name, doc_dict in zip(doc_names, docs)
+            if "image_indices" not in (doc_dict or {})
+        ]
+
+    # endregion
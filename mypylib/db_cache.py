@@ -0,0 +1,178 @@
+import copy
+import threading
+from typing import Any, Dict, Hashable, Iterable, Optional, Sequence, Set, Tuple, Union
+
+from cachetools import TTLCache
+
+# 各集合的缓存配置：(最大条目数, 有效期秒数)
+# users、payments 变化较频繁，有效期较短；words、mini_dict 基本为静态数据
+COLLECTION_CACHE_SETTINGS: Dict[str, Tuple[int, int]] = {
+    "users": (2000, 10 * 60),
+    "words": (20000, 24 * 60 * 60),
+    "mini_dict": (30000, 24 * 60 * 60),
+    "payments": (2000, 10 * 60),
+}
+
+# 用于区分“未缓存”与“已缓存但文档不存在”
+MISSING = object()
+
+# 字段掩码：字段路径的元组，每个路径为各级字段名组成的元组，例如 (("en-US", "noun"),)
+FieldMask = Tuple[Tuple[str, ...], ...]
+
+
+def normalize_field_mask(fields: Sequence[Union[str, Sequence[str]]]) -> FieldMask:
+    """
+    将字段列表规范为可作为缓存键的字段掩码。
+
+    Args:
+        fields: 顶层字段名，或由各级字段名组成的序列（用于嵌套字段）。
+    """
+    return tuple(
+        sorted({(f,) if isinstance(f, str) else tuple(f) for f in fields})
+    )
+
+
+def project_fields(data: dict, mask: FieldMask) -> dict:
+    """从完整文档中取出字段掩码包含的字段，结果与按掩码读取数据库一致。"""
+    result: dict = {}
+    for path in mask:
+        value = data
+        for name in path:
+            if not isinstance(value, dict) or name not in value:
+                break
+            value = value[name]
+        else:
+            target = result
+            for name in path[:-1]:
+                target = target.setdefault(name, {})
+            target[path[-1]] = value
+    return result
+
+
+class DocumentCache:
+    """
+    进程级文档缓存。
+
+    每个集合对应一个有容量上限的 LRU+TTL 缓存（cachetools.TTLCache）。
+    Streamlit 的各个会话运行在不同线程中，因此所有操作都在锁内完成。
+    缓存的值为文档的深拷贝，读取时也返回深拷贝，调用方原地修改嵌套的列表、字典
+    不会影响其他会话；文档不存在时缓存 None。
+
+    按字段掩码读取的部分文档以 `(文档名称, 掩码)` 为键另行缓存；已缓存完整文档时，
+    部分文档直接由完整文档投影得到。使文档失效时同时删除其所有部分文档。
+    """
+
+    def __init__(self, settings: Dict[str, Tuple[int, int]] = COLLECTION_CACHE_SETTINGS):
+        self._lock = threading.RLock()
+        self._caches: Dict[str, TTLCache] = {
+            name: TTLCache(maxsize=maxsize, ttl=ttl)
+            for name, (maxsize, ttl) in settings.items()
+        }
+        self._hits = {name: 0 for name in settings}
+        self._misses = {name: 0 for name in settings}
+        # 各文档已缓存的字段掩码，用于失效时删除部分文档
+        self._masks: Dict[str, Dict[Hashable, Set[FieldMask]]] = {
+            name: {} for name in settings
+        }
+
+    def get(
+        self, collection: str, key: Hashable, mask: Optional[FieldMask] = None
+    ) -> Any:
+        """返回缓存的值；未命中时返回 MISSING。指定 mask 时返回部分文档。"""
+        cache = self._caches.get(collection)
+        if cache is None:
+            return MISSING
+        with self._lock:
+            value = cache.get(key, MISSING)
+            if mask is not None:
+                if isinstance(value, dict):
+                    value = project_fields(value, mask)
+                elif value is MISSING:
+                    value = cache.get((key, mask), MISSING)
+            if value is MISSING:
+                self._misses[collection] += 1
+                return MISSING
+            self._hits[collection] += 1
+            return copy.deepcopy(value)
+
+    def set(
+        self,
+        collection: str,
+        key: Hashable,
+        value: Any,
+        mask: Optional[FieldMask] = None,
+    ):
+        cache = self._caches.get(collection)
+        if cache is None:
+            return
+        with self._lock:
+            value = copy.deepcopy(value)
+            if mask is None:
+                cache[key] = value
+            else:
+                cache[(key, mask)] = value
+                self._masks[collection].setdefault(key, set()).add(mask)
+
+    def _drop_masked(self, collection: str, key: Hashable):
+        cache = self._caches[collection]
+        for mask in self._masks[collection].pop(key, ()):
+            cache.pop((key, mask), None)
+
+    def update(self, collection: str, key: Hashable, fields: dict):
+        """将写入的字段合并到已缓存的文档中；未缓存时不做任何处理。"""
+        cache = self._caches.get(collection)
+        if cache is None:
+            return
+        with self._lock:
+            value = cache.get(key, MISSING)
+            if isinstance(value, dict):
+                value = {**value, **copy.deepcopy(fields)}
+                cache[key] = value
+            # 部分文档此后由完整文档投影或重新读取
+            self._drop_masked(collection, key)
+
+    def invalidate(self, collection: str, key: Hashable):
+        cache = self._caches.get(collection)
+        if cache is None:
+            return
+        with self._lock:
+            cache.pop(key, None)
+            self._drop_masked(collection, key)
+
+    def invalidate_many(self, collection: str, keys: Iterable[Hashable]):
+        cache = self._caches.get(collection)
+        if cache is None:
+            return
+        with self._lock:
+            for key in keys:
+                cache.pop(key, None)
+                self._drop_masked(collection, key)
+
+    def clear(self, collection: str | None = None):
+        with self._lock:
+            if collection is None:
+                for cache in self._caches.values():
+                    cache.clear()
+                for masks in self._masks.values():
+                    masks.clear()
+            elif collection in self._caches:
+                self._caches[collection].clear()
+                self._masks[collection].clear()
+
+    def stats(self) -> Dict[str, dict]:
+        """返回各集合的缓存统计信息，供管理页面显示。"""
+        with self._lock:
+            return {
+                name: {
+                    "size": len(cache),
+                    "maxsize": cache.maxsize,
+                    "ttl": cache.ttl,
+                    "hits": self._hits[name],
+                    "misses": self._misses[name],
+                }
+                for name, cache in self._caches.items()
+            }
+
+
+# 进程内所有 DbInterface 实例共享同一个缓存
+document_cache = DocumentCache()
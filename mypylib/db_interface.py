@@ -1,18 +1,44 @@
 import logging
 import random
 import string
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import List, Union
+from typing import Dict, List, Optional, Sequence, Type, Union
 
-# from cachetools import TTLCache
 from faker import Faker
+from google.api_core.exceptions import NotFound
 from google.cloud import firestore
 from google.cloud.firestore import FieldFilter
+from google.cloud.firestore_v1.field_path import render_field_path
 
 from .constants import FAKE_EMAIL_DOMAIN
-from .db_model import Payment, PaymentStatus, PurchaseType, TokenUsageRecord, User
+from .db_cache import MISSING, document_cache, normalize_field_mask, project_fields
+from .db_model import (
+    Payment,
+    PaymentStatus,
+    PurchaseType,
+    TokenUsageRecord,
+    User,
+    UserLoginInfo,
+    UserTokenCount,
+    UserVocabulary,
+)
+from .mini_dict_replica import get_running_replica, mini_dict_update_fields
+from .session_registry import get_session_registry
+from .srs import SrsScheduler
+from .token_rollups import get_token_usage
+from .token_writer import get_token_writer
+from .vocabulary_bitmap import (
+    VocabularyBitmap,
+    decode_vocabulary,
+    encode_vocabulary,
+    get_word_id_registry,
+    is_bitmap_vocabulary,
+)
+from .word_bundle import get_word_bundle
 
 # 创建或获取logger对象
 logger = logging.getLogger("streamlit")
@@ -27,24 +53,110 @@ PRICES = {
 }
 
 
+# 个人词库变更日志达到 CACHE_TRIGGER_SIZE 条时立即提交，
+# 否则在第一条变更记录后 MAX_TIME_INTERVAL 秒由定时器提交
 CACHE_TRIGGER_SIZE = 100
 MAX_TIME_INTERVAL = 10 * 60  # 10 分钟
 
+# 批量读取文档时每批次的文档数量及并发线程数
+GET_ALL_CHUNK_SIZE = 300
+GET_ALL_MAX_WORKERS = 8
+
+# 支付记录分页查询的默认每页条数
+PAYMENT_PAGE_SIZE = 50
+# 支付清单显示的字段，分页查询时只传输这些字段
+PAYMENT_LIST_FIELDS = [
+    "phone_number",
+    "payment_id",
+    "payment_time",
+    "registration_time",
+    "sales_representative",
+    "purchase_type",
+    "receivable",
+    "discount_rate",
+    "payment_method",
+    "payment_amount",
+    "is_approved",
+    "expiry_time",
+    "status",
+    "remark",
+]
+# 支持子串查询的支付记录字段，检索词保存在 search_tokens 数组字段中
+PAYMENT_SEARCH_FIELDS = ["payment_method", "remark"]
+# 检索词回填完成后写入的标记文档，此前的支付记录可能缺少 search_tokens
+PAYMENT_SEARCH_TOKENS_MARKER = ("system", "payment_search_tokens")
+# 回填标记一经写入即不再变化，进程内检查到后不再读取
+_payment_search_tokens_ready = False
+
+
+def normalize_email(email: str) -> str:
+    """唯一标记文档以规范化的邮箱为名称。"""
+    return email.strip().lower()
+
+
+def _unique_marker(phone_number: str) -> dict:
+    return {"phone_number": phone_number, "created_at": datetime.now(timezone.utc)}
+
+
+def _normalize_search_text(text: str) -> str:
+    return "".join(str(text).lower().split())
+
+
+def payment_search_tokens(payment_data: dict) -> List[str]:
+    """
+    生成支付记录的检索词。
+
+    对可模糊查询的字段，取规范化（小写、去空白）后文本的单字及相邻二字组合，
+    并加上字段名前缀，例如 `remark:张三`。任何长度不小于 2 的子串都包含某个二字组合，
+    查询时用 array_contains 先缩小范围，再在结果中核对完整子串。
+    """
+    tokens = set()
+    for field in PAYMENT_SEARCH_FIELDS:
+        text = _normalize_search_text(payment_data.get(field) or "")
+        tokens.update(f"{field}:{c}" for c in text)
+        tokens.update(f"{field}:{text[i:i + 2]}" for i in range(len(text) - 1))
+    return sorted(tokens)
+
+
+# 单词文档的字段掩码：音标
+WORD_PRONUNCIATION_FIELDS = ("us_written", "uk_written")
+
+
+def word_pos_fields(pos: str, languages=("en-US", "zh-CN")) -> List[tuple]:
+    """单词文档中某一词性的字段掩码，默认包含英文释义及中文译文。"""
+    return [(language, pos) for language in languages]
+
+
+def find_word_in_bundle(doc_name: str, fields=None) -> Optional[dict]:
+    """从离线词典包读取单词文档并按字段掩码取出字段；未部署离线包或未收录时返回 None。"""
+    bundle = get_word_bundle()
+    if bundle is None:
+        return None
+    data = bundle.get(doc_name)
+    if data is None or fields is None:
+        return data
+    return project_fields(data, normalize_field_mask(fields))
+
 
 class DbInterface:
     def __init__(self, firestore_client):
         self.faker = Faker("zh_CN")
         self.db = firestore_client
-        # self.cache = TTLCache(maxsize=1000, ttl=86400)  # 24 hours cache
+        # 会话级缓存：登录信息与个人词库
+        # 文档级缓存为进程共享，见 db_cache.document_cache
         self.cache = {
             "user_info": {},
-            "personal_vocabulary": {
-                "words": set(),
-                "last_commit_time": time.time(),
-                "to_add": [],
-                "to_delete": [],
-            },
+            "personal_vocabulary": self._new_personal_vocabulary_cache(),
+            # 间隔重复调度，首次使用时从 srs_states 加载
+            "srs": None,
         }
+        # 保护个人词库缓存及其变更日志，定时器在后台线程中提交
+        self._vocabulary_lock = threading.RLock()
+        self._vocabulary_timer = None
+        # 本次运行的工作单元：已读取的文档（标识映射）及排队的写入，见 begin_run
+        self._run_lock = threading.Lock()
+        self._run_docs: Dict[tuple, Optional[dict]] = {}
+        self._run_writes: List[tuple] = []
 
     def cache_user_login_info(self, user, session_id):
         phone_number = user.phone_number
@@ -58,19 +170,154 @@ class DbInterface:
             "session_id": session_id,
         }
 
+    # region 文档缓存
+
+    def _get_doc_dict(
+        self,
+        collection: str,
+        doc_id: str,
+        refresh: bool = False,
+        fields: Optional[Sequence[Union[str, Sequence[str]]]] = None,
+    ):
+        """
+        读取文档并返回字典，优先使用进程级文档缓存。
+
+        Args:
+            collection (str): 集合名称。
+            doc_id (str): 文档名称。
+            refresh (bool): 为 True 时跳过缓存及本次运行的标识映射，直接读取数据库并刷新两者。
+            fields: 可选，字段掩码。顶层字段名，或由各级字段名组成的序列（嵌套字段）。
+                指定时只读取这些字段，缓存键包含掩码。
+
+        Returns:
+            dict or None: 文档字典，文档不存在时返回 None。
+        """
+        mask = normalize_field_mask(fields) if fields is not None else None
+        if refresh:
+            # 跳过本次运行的标识映射，读取后以最新数据替换该文档的全部条目
+            self._invalidate(collection, doc_id)
+        else:
+            # 本次运行已读取的文档直接返回
+            data = self._run_get(collection, doc_id, mask)
+            if data is not MISSING:
+                return data
+            cached = document_cache.get(collection, doc_id, mask)
+            if cached is not MISSING:
+                self._run_set(collection, doc_id, cached, mask)
+                return cached
+        doc_ref = self.db.collection(collection).document(doc_id)
+        if mask is None:
+            doc = doc_ref.get()
+        else:
+            doc = doc_ref.get(field_paths=[render_field_path(path) for path in mask])
+        data = doc.to_dict() if doc.exists else None
+        document_cache.set(collection, doc_id, data, mask)
+        self._run_set(collection, doc_id, data, mask)
+        return data
+
+    # endregion
+
+    # region 工作单元
+
+    def begin_run(self):
+        """
+        开始一次脚本运行的工作单元。
+
+        各页面每次运行开始时调用（见 st_helper.check_and_force_logout）：
+        先提交上一次运行中未提交的写入（例如运行被 st.stop 或 st.rerun 中断），
+        再清空标识映射。此后同一文档在本次运行中至多读取一次。
+        """
+        self.commit_run()
+        with self._run_lock:
+            self._run_docs.clear()
+
+    def _run_get(self, collection: str, doc_id: str, mask=None):
+        """从标识映射中读取文档；已读取完整文档时，部分文档由其投影得到。"""
+        with self._run_lock:
+            data = self._run_docs.get((collection, doc_id, None), MISSING)
+            if data is MISSING and mask is not None:
+                data = self._run_docs.get((collection, doc_id, mask), MISSING)
+            elif isinstance(data, dict) and mask is not None:
+                data = project_fields(data, mask)
+        return data.copy() if isinstance(data, dict) else data
+
+    def _run_set(self, collection: str, doc_id: str, data, mask=None):
+        with self._run_lock:
+            self._run_docs[(collection, doc_id, mask)] = (
+                data.copy() if isinstance(data, dict) else data
+            )
+
+    def _invalidate(self, collection: str, doc_id):
+        """文档写入后使进程级缓存及本次运行的标识映射失效。"""
+        document_cache.invalidate(collection, doc_id)
+        with self._run_lock:
+            for key in [k for k in self._run_docs if k[:2] == (collection, doc_id)]:
+                del self._run_docs[key]
+
+    def queue_write(self, collection: str, doc_id: str, fields: dict, merge=True):
+        """
+        将写入加入本次运行的工作单元，由 `commit_run` 以 WriteBatch 一并提交。
+
+        排队的写入在提交前对读取不可见；提交后相应文档的缓存失效。
+        同一文档的多次合并写入合并为一次，同名字段以后一次为准。
+        """
+        with self._run_lock:
+            for i, (c, d, queued, m) in enumerate(self._run_writes):
+                if (c, d) == (collection, doc_id) and m and merge:
+                    self._run_writes[i] = (c, d, {**queued, **fields}, m)
+                    return
+            self._run_writes.append((collection, doc_id, fields, merge))
+
+    def commit_run(self) -> int:
+        """
+        提交本次运行中排队的写入。
+
+        Returns:
+            int: 提交的写入数量。
+        """
+        with self._run_lock:
+            writes, self._run_writes = self._run_writes, []
+        # 单个 WriteBatch 最多 500 次写入
+        for i in range(0, len(writes), 500):
+            batch = self.db.batch()
+            for collection, doc_id, fields, merge in writes[i : i + 500]:
+                batch.set(
+                    self.db.collection(collection).document(doc_id), fields, merge=merge
+                )
+            batch.commit()
+        for collection, doc_id, _, _ in writes:
+            self._invalidate(collection, doc_id)
+        return len(writes)
+
+    # endregion
+
     # region 用户管理
 
-    def get_user(self, return_object=True):
+    def get_user(
+        self,
+        return_object=True,
+        model: Type = User,
+        fields: Sequence[str] = (),
+    ):
+        """
+        读取当前用户的文档。
+
+        Args:
+            return_object (bool): 为 True 时返回模型实例，否则返回字典。
+            model: User 或由 `partial_user_model` 派生的部分模型。部分模型只读取其
+                `field_mask` 中的字段。
+            fields: 可选，额外读取的字段（不在模型中，只出现在返回的字典里）。
+        """
         phone_number = self.cache.get("user_info", {}).get("phone_number", "")
         if not phone_number:
             return None
-        doc_ref = self.db.collection("users").document(phone_number)
-        doc = doc_ref.get()
-        if doc.exists:
-            user_data = doc.to_dict()
-            user_data["phone_number"] = phone_number  # 添加手机号码
+        mask = None if model is User else [*model.field_mask, *fields]
+        user_data = self._get_doc_dict("users", phone_number, fields=mask)
+        if user_data is not None:
+            # 复制后再添加键，不修改缓存中的文档
+            user_data = {**user_data, "phone_number": phone_number}  # 添加手机号码
             if return_object:
-                return User.from_doc(user_data)
+                return model.from_doc(user_data)
             else:
                 return user_data
         else:
@@ -83,11 +330,51 @@ class DbInterface:
             del update_fields["phone_number"]  # 删除手机号码
         except KeyError:
             pass
-        doc_ref.update(update_fields)
+        if "email" in update_fields:
+            self._update_user_with_email(doc_ref, update_fields)
+        else:
+            doc_ref.update(update_fields)
+        self._invalidate("users", phone_number)
+
+    def _update_user_with_email(self, doc_ref, update_fields: dict):
+        """在事务中更新用户，同时将邮箱唯一标记移到新邮箱。"""
+        phone_number = doc_ref.id
+        new_email = normalize_email(update_fields["email"])
+        emails_ref = self.db.collection("unique_emails")
+
+        @firestore.transactional
+        def update_in_transaction(transaction):
+            user_doc = doc_ref.get(field_paths=["email"], transaction=transaction)
+            old_email = normalize_email((user_doc.to_dict() or {}).get("email") or "")
+            if old_email != new_email:
+                marker = emails_ref.document(new_email).get(transaction=transaction)
+                if marker.exists and marker.get("phone_number") != phone_number:
+                    raise ValueError("邮箱已被注册")
+                if old_email:
+                    transaction.delete(emails_ref.document(old_email))
+                transaction.set(
+                    emails_ref.document(new_email), _unique_marker(phone_number)
+                )
+            transaction.update(doc_ref, update_fields)
+
+        update_in_transaction(self.db.transaction())
 
     def register_user(self, user: User):
+        """
+        注册用户。
+
+        在同一事务中创建 `unique_phones/{手机号码}`、`unique_emails/{邮箱}` 唯一标记
+        及用户文档，重复检查只需按键读取标记文档，并发注册时也不会重复。
+
+        Raises:
+            ValueError: 手机号码或邮箱已被注册。
+        """
         phone_number = user.phone_number
         doc_ref = self.db.collection("users").document(phone_number)
+        phone_marker_ref = self.db.collection("unique_phones").document(phone_number)
+        email_marker_ref = self.db.collection("unique_emails").document(
+            normalize_email(user.email)
+        )
         # 为用户密码加密
         user.hash_password()
         user_data = user.model_dump()
@@ -95,7 +382,67 @@ class DbInterface:
             del user_data["phone_number"]  # 删除手机号码
         except KeyError:
             pass
-        doc_ref.set(user_data)
+
+        @firestore.transactional
+        def register_in_transaction(transaction):
+            # 旧用户可能尚未建立唯一标记，同时检查用户文档
+            phone_marker = phone_marker_ref.get(transaction=transaction)
+            user_doc = doc_ref.get(transaction=transaction)
+            email_marker = email_marker_ref.get(transaction=transaction)
+            if phone_marker.exists or user_doc.exists:
+                raise ValueError("电话号码已被注册")
+            if email_marker.exists:
+                raise ValueError("邮箱已被注册")
+            transaction.create(phone_marker_ref, _unique_marker(phone_number))
+            transaction.create(email_marker_ref, _unique_marker(phone_number))
+            transaction.set(doc_ref, user_data)
+
+        register_in_transaction(self.db.transaction())
+        self._invalidate("users", phone_number)
+
+    def backfill_unique_markers(self, progress_callback=None) -> List[str]:
+        """
+        为已有用户补建手机号码、邮箱唯一标记。
+
+        Args:
+            progress_callback (callable): 可选，参数为 (已处理数, 总数)。
+
+        Returns:
+            List[str]: 与其他用户重复、未能建立标记的邮箱。
+        """
+        docs = list(self.db.collection("users").select(["email"]).stream())
+        owners: Dict[str, str] = {}
+        duplicates = []
+        for doc in docs:
+            email = normalize_email(doc.to_dict().get("email") or "")
+            if not email:
+                continue
+            if email in owners:
+                duplicates.append(email)
+            else:
+                owners[email] = doc.id
+
+        phones_ref = self.db.collection("unique_phones")
+        emails_ref = self.db.collection("unique_emails")
+        batch = self.db.batch()
+        pending = 0
+        for i, doc in enumerate(docs):
+            batch.set(phones_ref.document(doc.id), _unique_marker(doc.id))
+            pending += 1
+            email = normalize_email(doc.to_dict().get("email") or "")
+            if email and owners.get(email) == doc.id:
+                batch.set(emails_ref.document(email), _unique_marker(doc.id))
+                pending += 1
+            # 单个 WriteBatch 最多 500 次写入，每个用户最多两次
+            if pending >= 498:
+                batch.commit()
+                batch = self.db.batch()
+                pending = 0
+            if progress_callback:
+                progress_callback(i + 1, len(docs))
+        if pending:
+            batch.commit()
+        return sorted(set(duplicates))
 
     # endregion
 
@@ -106,13 +453,20 @@ class DbInterface:
         session_id = str(uuid.uuid4())
         login_events_ref = self.db.collection("login_events")
         login_event_doc_ref = login_events_ref.document(session_id)
-        login_event_doc_ref.set(
+        # 登录事件与活动会话登记在同一次提交中写入，新会话登记后旧会话即失效
+        batch = self.db.batch()
+        batch.set(
+            login_event_doc_ref,
             {
                 "phone_number": phone_number,
                 "login_time": datetime.now(timezone.utc),
                 "logout_time": None,
-            }
+            },
         )
+        registry = get_session_registry(self.db)
+        registry.activate(phone_number, session_id, batch)
+        batch.commit()
+        registry.watch(phone_number)
         return session_id
 
     def is_logged_in(self):
@@ -122,33 +476,22 @@ class DbInterface:
         # 在缓存中查询是否已经正常登录
         if self.cache.get("user_info", {}).get("is_logged_in", False):
             return {"status": "warning", "message": "您已登录"}
-        # 检查用户的凭据
-        users_ref = self.db.collection("users")
-        user_doc_ref = users_ref.document(phone_number)
-        user_doc = user_doc_ref.get()
+        # 检查用户的凭据，登录时总是读取最新数据并刷新缓存，只读取登录需要的字段
+        user_data = self._get_doc_dict(
+            "users", phone_number, refresh=True, fields=UserLoginInfo.field_mask
+        )
 
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
-            user_data["phone_number"] = phone_number  # 添加手机号码
-            user = User.from_doc(user_data)
+        if user_data is not None:
+            # 复制后再添加键，不修改缓存中的文档
+            user_data = {**user_data, "phone_number": phone_number}  # 添加手机号码
+            user = UserLoginInfo.from_doc(user_data)
             # 验证密码
             if user.check_password(password):
-                # 验证服务活动状态
-                payments = (
-                    self.db.collection("payments")
-                    .where(filter=FieldFilter("phone_number", "==", phone_number))
-                    .stream()
+                # 验证服务活动状态，到期时间已冗余保存在用户文档中
+                expiry_time = self._get_service_expiry(phone_number, user_data)[0]
+                is_expired = expiry_time is None or expiry_time <= datetime.now(
+                    timezone.utc
                 )
-                now = datetime.now(timezone.utc)
-                is_expired = True
-                for payment in payments:
-                    payment_dict = payment.to_dict()
-                    expiry_time = payment_dict["expiry_time"].replace(
-                        tzinfo=timezone.utc
-                    )
-                    if payment_dict["is_approved"] and expiry_time > now:
-                        is_expired = False
-                        break
                 if not is_expired or (user.user_role in ("管理员", "超级成员")):
                     session_id = self.create_login_event(phone_number)
                     # 如果密码正确，将用户的登录状态存储到缓存中
@@ -175,8 +518,13 @@ class DbInterface:
 
     def logout(self):
         phone_number = self.cache["user_info"]["phone_number"]
+        # 退出前提交个人词库的变更日志
+        self._commit_personal_vocabulary_to_db()
         # 从缓存中删除用户的登录状态
         self.cache["user_info"] = {}
+        with self._vocabulary_lock:
+            self.cache["personal_vocabulary"] = self._new_personal_vocabulary_cache()
+        self.cache["srs"] = None
 
         login_events_ref = self.db.collection("login_events")
         login_events = (
@@ -187,8 +535,18 @@ class DbInterface:
             .stream()
         )
 
+        # 在一个 WriteBatch 中关闭所有未退出的登录事件
+        logout_time = datetime.now(tz=timezone.utc)
+        batch = self.db.batch()
         for login_event in login_events:
-            login_event.reference.update({"logout_time": datetime.now(tz=timezone.utc)})
+            batch.update(login_event.reference, {"logout_time": logout_time})
+        batch.commit()
+
+        get_session_registry(self.db).unwatch(phone_number)
+
+        # 写入尚在队列中的令牌使用记录及本次运行排队的写入
+        self.flush_token_records()
+        self.commit_run()
 
         return "Logout successful"
 
@@ -196,112 +554,247 @@ class DbInterface:
 
     # region 个人词库管理
 
+    @staticmethod
+    def _new_personal_vocabulary_cache():
+        return {
+            # 是否已从数据库加载
+            "loaded": False,
+            # 用户文档是否以位图方式存储个人词库，加载时确定
+            "bitmap": None,
+            "words": set(),
+            "last_commit_time": time.time(),
+            # 变更日志：尚未提交到数据库的添加、删除操作
+            "to_add": [],
+            "to_delete": [],
+        }
+
+    def get_personal_vocabulary_journal_depth(self) -> int:
+        """返回个人词库变更日志中尚未提交的操作数。"""
+        with self._vocabulary_lock:
+            vocabulary = self.cache["personal_vocabulary"]
+            return len(vocabulary["to_add"]) + len(vocabulary["to_delete"])
+
     def _commit_personal_vocabulary_to_db(self):
         """
-        将缓存中的个人词库提交到数据库。
+        将个人词库的变更日志提交到数据库。
+
+        不读取用户文档，只根据日志中涉及的单词在缓存中的最终状态，
+        在一个 WriteBatch 中执行 arrayUnion 与 arrayRemove，
+        读写成本只与变更数量有关，与个人词库大小无关。
         """
-        phone_number = self.cache["user_info"]["phone_number"]
-        # 获取用户文档的引用
-        user_doc_ref = self.db.collection("users").document(phone_number)
-        # 从数据库中读取个人词库
-        personal_vocabulary_in_db = (
-            user_doc_ref.get().to_dict().get("personal_vocabulary", [])
-        )
-        # 计算需要添加和删除的单词
-        words_to_add = list(
-            set(self.cache["personal_vocabulary"]["words"])
-            - set(personal_vocabulary_in_db)
-        )
-        words_to_delete = list(
-            set(personal_vocabulary_in_db)
-            - set(self.cache["personal_vocabulary"]["words"])
-        )
-        # 使用 arrayUnion 方法添加单词到数据库中的个人词库
-        if words_to_add:
-            user_doc_ref.update(
-                {"personal_vocabulary": firestore.ArrayUnion(words_to_add)}
+        with self._vocabulary_lock:
+            if self._vocabulary_timer is not None:
+                self._vocabulary_timer.cancel()
+                self._vocabulary_timer = None
+            vocabulary = self.cache["personal_vocabulary"]
+            phone_number = self.cache["user_info"].get("phone_number")
+            if not phone_number or not (vocabulary["to_add"] or vocabulary["to_delete"]):
+                return
+            # 同一单词可能先后被添加、删除，以缓存中的最终状态为准
+            changed = dict.fromkeys(vocabulary["to_add"] + vocabulary["to_delete"])
+            words_to_add = [w for w in changed if w in vocabulary["words"]]
+            words_to_delete = [w for w in changed if w not in vocabulary["words"]]
+
+            user_doc_ref = self.db.collection("users").document(phone_number)
+            if vocabulary["bitmap"] is None:
+                user_data = (
+                    self._get_doc_dict("users", phone_number, fields=["vocabulary_bitmap"])
+                    or {}
+                )
+                vocabulary["bitmap"] = is_bitmap_vocabulary(user_data)
+            if vocabulary["bitmap"]:
+                self._commit_bitmap_vocabulary(
+                    user_doc_ref, words_to_add, words_to_delete
+                )
+            else:
+                batch = self.db.batch()
+                # 使用 arrayUnion 方法添加单词到数据库中的个人词库
+                if words_to_add:
+                    batch.update(
+                        user_doc_ref,
+                        {"personal_vocabulary": firestore.ArrayUnion(words_to_add)},
+                    )
+                # 使用 arrayRemove 方法从数据库中的个人词库中移除单词
+                if words_to_delete:
+                    batch.update(
+                        user_doc_ref,
+                        {"personal_vocabulary": firestore.ArrayRemove(words_to_delete)},
+                    )
+                batch.commit()
+            self._invalidate("users", phone_number)
+            # 更新最后提交时间
+            vocabulary["last_commit_time"] = time.time()
+            # 清理 to_add 和 to_delete 列表
+            vocabulary["to_add"] = []
+            vocabulary["to_delete"] = []
+
+    def _commit_bitmap_vocabulary(self, user_doc_ref, words_to_add, words_to_delete):
+        """在事务中将变更应用到位图存储的个人词库。"""
+        registry = get_word_id_registry()
+        add_ids, add_unknown = registry.split(words_to_add)
+        delete_ids, delete_unknown = registry.split(words_to_delete)
+
+        @firestore.transactional
+        def update_bitmap(transaction):
+            doc = user_doc_ref.get(
+                field_paths=["vocabulary_bitmap", "vocabulary_overflow"],
+                transaction=transaction,
+            )
+            user_data = doc.to_dict() or {}
+            bitmap = VocabularyBitmap.from_bytes(
+                user_data.get("vocabulary_bitmap"), len(registry)
             )
-        # 使用 arrayRemove 方法从数据库中的个人词库中移除单词
-        if words_to_delete:
-            user_doc_ref.update(
-                {"personal_vocabulary": firestore.ArrayRemove(words_to_delete)}
+            bitmap.add(add_ids)
+            bitmap.discard(delete_ids)
+            overflow = set(user_data.get("vocabulary_overflow", []))
+            overflow.update(add_unknown)
+            overflow.difference_update(delete_unknown)
+            transaction.update(
+                user_doc_ref,
+                {
+                    "vocabulary_bitmap": bitmap.to_bytes(),
+                    "vocabulary_overflow": sorted(overflow),
+                },
             )
-        # 更新最后提交时间
-        self.cache["personal_vocabulary"]["last_commit_time"] = time.time()
-        # 清理 to_add 和 to_delete 列表
-        self.cache["personal_vocabulary"]["to_add"] = []
-        self.cache["personal_vocabulary"]["to_delete"] = []
 
-    def find_personal_dictionary(self):
-        # 如果缓存中存在个人词库，直接返回
-        if (
-            "personal_vocabulary" in self.cache
-            and self.cache["personal_vocabulary"]["words"]
-        ):
-            return list(self.cache["personal_vocabulary"]["words"])
+        update_bitmap(self.db.transaction())
 
-        phone_number = self.cache["user_info"]["phone_number"]
-        # 获取用户文档的引用
-        user_doc_ref = self.db.collection("users").document(phone_number)
-        user_doc = user_doc_ref.get()
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
-            # 从数据库中读取个人词库，并缓存
-            self.cache["personal_vocabulary"] = {
-                "words": set(user_data.get("personal_vocabulary", [])),
-                "last_commit_time": time.time(),
-                "to_add": [],
-                "to_delete": [],
-            }
-        else:
-            self.cache["personal_vocabulary"] = {
-                "words": set(),
-                "last_commit_time": time.time(),
-                "to_add": [],
-                "to_delete": [],
-            }
+    def _on_vocabulary_timer(self):
+        try:
+            self._commit_personal_vocabulary_to_db()
+        except Exception as e:
+            logger.error(f"定时提交个人词库失败：{e}")
 
-        return list(self.cache["personal_vocabulary"]["words"])
+    def _schedule_personal_vocabulary_commit(self):
+        """达到日志容量时立即提交，否则确保定时器已启动。"""
+        if self.get_personal_vocabulary_journal_depth() >= CACHE_TRIGGER_SIZE:
+            self._commit_personal_vocabulary_to_db()
+            return
+        with self._vocabulary_lock:
+            if self._vocabulary_timer is None:
+                self._vocabulary_timer = threading.Timer(
+                    MAX_TIME_INTERVAL, self._on_vocabulary_timer
+                )
+                self._vocabulary_timer.daemon = True
+                self._vocabulary_timer.start()
+
+    def find_personal_dictionary(self):
+        with self._vocabulary_lock:
+            vocabulary = self.cache["personal_vocabulary"]
+            # 如果缓存中存在个人词库，直接返回
+            if vocabulary["loaded"]:
+                return list(vocabulary["words"])
+
+            phone_number = self.cache["user_info"]["phone_number"]
+            user_data = (
+                self._get_doc_dict(
+                    "users", phone_number, fields=UserVocabulary.field_mask
+                )
+                or {}
+            )
+            # 从数据库中读取个人词库，并应用尚未提交的变更日志
+            vocabulary["bitmap"] = is_bitmap_vocabulary(user_data)
+            words = set(user_data.get("personal_vocabulary", []))
+            if vocabulary["bitmap"]:
+                words.update(decode_vocabulary(user_data, get_word_id_registry()))
+            words.update(vocabulary["to_add"])
+            words.difference_update(
+                w for w in vocabulary["to_delete"] if w not in vocabulary["words"]
+            )
+            vocabulary["words"] = words
+            vocabulary["loaded"] = True
+            return list(words)
 
     def add_words_to_personal_dictionary(self, word: Union[str, List[str]]):
         """
-        将单词添加到缓存中的个人词库。
+        将单词添加到缓存中的个人词库，并记录到变更日志。
         """
-        if isinstance(word, list):
-            self.cache["personal_vocabulary"]["words"].update(word)
-            self.cache["personal_vocabulary"]["to_add"].extend(word)
-        else:
-            self.cache["personal_vocabulary"]["words"].add(word)
-            self.cache["personal_vocabulary"]["to_add"].append(word)
-
-        if (
-            len(self.cache["personal_vocabulary"]["to_add"])
-            + len(self.cache["personal_vocabulary"]["to_delete"])
-            >= CACHE_TRIGGER_SIZE
-            or time.time() - self.cache["personal_vocabulary"]["last_commit_time"]
-            >= MAX_TIME_INTERVAL
-        ):
-            self._commit_personal_vocabulary_to_db()
+        with self._vocabulary_lock:
+            vocabulary = self.cache["personal_vocabulary"]
+            if isinstance(word, list):
+                vocabulary["words"].update(word)
+                vocabulary["to_add"].extend(word)
+            else:
+                vocabulary["words"].add(word)
+                vocabulary["to_add"].append(word)
+        self._schedule_personal_vocabulary_commit()
 
     def remove_words_from_personal_dictionary(self, word: Union[str, List[str]]):
         """
-        从缓存中的个人词库中移除单词。
+        从缓存中的个人词库中移除单词，并记录到变更日志。
         """
-        if isinstance(word, list):
-            self.cache["personal_vocabulary"]["words"].difference_update(word)
-            self.cache["personal_vocabulary"]["to_delete"].extend(word)
-        else:
-            self.cache["personal_vocabulary"]["words"].discard(word)
-            self.cache["personal_vocabulary"]["to_delete"].append(word)
+        with self._vocabulary_lock:
+            vocabulary = self.cache["personal_vocabulary"]
+            if isinstance(word, list):
+                vocabulary["words"].difference_update(word)
+                vocabulary["to_delete"].extend(word)
+            else:
+                vocabulary["words"].discard(word)
+                vocabulary["to_delete"].append(word)
+        self._schedule_personal_vocabulary_commit()
 
-        if (
-            len(self.cache["personal_vocabulary"]["to_add"])
-            + len(self.cache["personal_vocabulary"]["to_delete"])
-            >= CACHE_TRIGGER_SIZE
-            or time.time() - self.cache["personal_vocabulary"]["last_commit_time"]
-            >= MAX_TIME_INTERVAL
-        ):
-            self._commit_personal_vocabulary_to_db()
+    def migrate_personal_vocabulary_to_bitmap(self, phone_number: str) -> bool:
+        """
+        将用户文档中的个人词库数组迁移为位图存储，并删除原数组字段。
+
+        已是位图存储但仍残留数组字段的文档（迁移时用户在线）会合并两者。
+
+        Returns:
+            bool: 是否执行了迁移。
+        """
+        registry = get_word_id_registry()
+        user_doc_ref = self.db.collection("users").document(phone_number)
+
+        @firestore.transactional
+        def migrate(transaction):
+            doc = user_doc_ref.get(
+                field_paths=[
+                    "personal_vocabulary",
+                    "vocabulary_bitmap",
+                    "vocabulary_overflow",
+                ],
+                transaction=transaction,
+            )
+            if not doc.exists:
+                return False
+            user_data = doc.to_dict()
+            if is_bitmap_vocabulary(user_data) and "personal_vocabulary" not in user_data:
+                return False
+            words = set(user_data.get("personal_vocabulary", []))
+            if is_bitmap_vocabulary(user_data):
+                words.update(decode_vocabulary(user_data, registry))
+            transaction.update(
+                user_doc_ref,
+                {
+                    **encode_vocabulary(words, registry),
+                    "personal_vocabulary": firestore.DELETE_FIELD,
+                },
+            )
+            return True
+
+        migrated = migrate(self.db.transaction())
+        self._invalidate("users", phone_number)
+        return migrated
+
+    def migrate_all_personal_vocabularies(self, progress_callback=None) -> int:
+        """
+        批量将所有用户的个人词库迁移为位图存储。
+
+        Args:
+            progress_callback (callable): 可选，参数为 (已处理数, 总数)。
+
+        Returns:
+            int: 迁移的用户数量。
+        """
+        # 只需文档名称，投影到单个字段以减少传输量
+        docs = list(self.db.collection("users").select(["vocabulary_bitmap"]).stream())
+        migrated = 0
+        for i, doc in enumerate(docs):
+            if self.migrate_personal_vocabulary_to_bitmap(doc.id):
+                migrated += 1
+            if progress_callback:
+                progress_callback(i + 1, len(docs))
+        return migrated
 
     # endregion
 
@@ -309,16 +802,21 @@ class DbInterface:
 
     def get_token_count(self):
         phone_number = self.cache["user_info"]["phone_number"]
-        # 获取用户文档的引用
-        user_doc_ref = self.db.collection("users").document(phone_number)
-        user_doc = user_doc_ref.get()
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
+        user_data = self._get_doc_dict(
+            "users", phone_number, fields=UserTokenCount.field_mask
+        )
+        if user_data is not None:
             return user_data.get("total_tokens", 0)
         else:
             return 0
 
     def add_token_record(self, token_type, used_token_count):
+        """
+        记录一次令牌使用。
+
+        记录放入进程级写入队列后立即返回，由后台线程批量写入
+        `token_records` 集合并累加用户的 `total_tokens`。
+        """
         phone_number = self.cache["user_info"]["phone_number"]
         used_token = TokenUsageRecord(
             token_type=token_type,
@@ -326,38 +824,65 @@ class DbInterface:
             used_at=datetime.now(tz=timezone.utc),
             phone_number=phone_number,
         )
+        get_token_writer(self.db).add(used_token)
 
-        # 添加 token 记录到 'token_records' 集合
-        token_records_ref = self.db.collection("token_records")
-        token_records_ref.document().set(used_token.model_dump())
+    def flush_token_records(self):
+        """立即将队列中的令牌使用记录写入数据库。"""
+        get_token_writer(self.db).flush()
 
-        # 更新用户的 'total_tokens' 属性
-        user_doc_ref = self.db.collection("users").document(phone_number)
-        user_doc_ref.update({"total_tokens": firestore.Increment(used_token_count)})
+    def get_token_usage(self, period: str, count: int) -> List[dict]:
+        """
+        返回当前用户最近 count 个周期（"day" 或 "month"）的令牌用量汇总。
+
+        读取汇总文档而非 `token_records`，读取次数与历史长度无关。
+        """
+        phone_number = self.cache["user_info"]["phone_number"]
+        return get_token_usage(self.db, period, count, phone_number)
 
     # endregion
 
     # region 支付管理
 
     def get_last_active_payment(self):
+        phone_number = self.cache["user_info"]["phone_number"]
+        cache_key = ("last_active", phone_number)
+        cached = document_cache.get("payments", cache_key)
+        if cached is not MISSING:
+            return cached
         payments_ref = self.db.collection("payments")
         query = (
-            payments_ref.where(
-                filter=FieldFilter(
-                    "phone_number", "==", self.cache["user_info"]["phone_number"]
-                )
-            )
+            payments_ref.where(filter=FieldFilter("phone_number", "==", phone_number))
             .where(filter=FieldFilter("status", "==", PaymentStatus.IN_SERVICE))
             .order_by("payment_time", direction=firestore.Query.DESCENDING)
             .limit(1)
         )
         docs = query.get()
         if docs:
-            return {"order_id": docs[0].id, **docs[0].to_dict()}
+            payment = {"order_id": docs[0].id, **docs[0].to_dict()}
         else:
-            return {}
+            payment = {}
+        document_cache.set("payments", cache_key, payment)
+        return payment
+
+    def _payment_search_tokens_ready(self) -> bool:
+        """检索词回填是否已完成；未完成时子串条件只在结果中核对。"""
+        global _payment_search_tokens_ready
+        if not _payment_search_tokens_ready:
+            collection, doc_name = PAYMENT_SEARCH_TOKENS_MARKER
+            doc = self.db.collection(collection).document(doc_name).get()
+            _payment_search_tokens_ready = doc.exists
+        return _payment_search_tokens_ready
+
+    def _build_payment_query(self, query_dict: dict):
+        """
+        根据查询条件构建支付记录查询。
 
-    def query_payments(self, query_dict: dict):
+        检索词回填完成前，部分支付记录缺少 search_tokens，此时不添加
+        array_contains 条件，子串条件全部在结果中核对。
+
+        Returns:
+            tuple: (查询对象, 需要在结果中核对的子串条件字典)。
+        """
         # 检查所有的值是否有效
         invalid_keys = [key for key, value in query_dict.items() if value is None]
         if invalid_keys:
@@ -375,14 +900,6 @@ class DbInterface:
             if key in query_dict:
                 query = query.where(filter=FieldFilter(key, "==", query_dict[key]))
 
-        if "order_id" in query_dict:
-            doc_ref = self.db.collection("payments").document(query_dict["order_id"])
-            doc = doc_ref.get()
-            if doc.exists:
-                return [doc]
-            else:
-                return []
-
         for key in [
             "start_payment_time",
             "end_payment_time",
@@ -402,57 +919,170 @@ class DbInterface:
                             key.replace("end_", ""), "<=", query_dict[key]
                         )
                     )
-        results = query.stream()
-        if "remark" in query_dict:
-            results = [
-                doc
-                for doc in results
-                if query_dict["remark"] in doc.to_dict().get("remark", "")
-            ]
-        if "payment_method" in query_dict:
-            results = [
-                doc
-                for doc in results
-                if query_dict["payment_method"]
-                in doc.to_dict().get("payment_method", "")
-            ]
-        return results
+
+        substrings = {
+            field: _normalize_search_text(query_dict[field])
+            for field in PAYMENT_SEARCH_FIELDS
+            if query_dict.get(field)
+        }
+        if substrings and self._payment_search_tokens_ready():
+            # 每个查询只能有一个 array_contains 条件，用第一个子串条件的检索词缩小范围
+            field, text = next(iter(substrings.items()))
+            query = query.where(
+                filter=FieldFilter(
+                    "search_tokens", "array_contains", f"{field}:{text[:2]}"
+                )
+            )
+        return query, substrings
+
+    @staticmethod
+    def _match_substrings(docs, substrings: dict):
+        if not substrings:
+            return list(docs)
+        return [
+            doc
+            for doc in docs
+            if all(
+                text in _normalize_search_text(doc.to_dict().get(field) or "")
+                for field, text in substrings.items()
+            )
+        ]
+
+    def query_payments(self, query_dict: dict):
+        if "order_id" in query_dict:
+            doc_ref = self.db.collection("payments").document(query_dict["order_id"])
+            doc = doc_ref.get()
+            if doc.exists:
+                return [doc]
+            else:
+                return []
+
+        query, substrings = self._build_payment_query(query_dict)
+        return self._match_substrings(query.stream(), substrings)
+
+    def query_payments_page(
+        self,
+        query_dict: dict,
+        page_size: int = PAYMENT_PAGE_SIZE,
+        start_after=None,
+        fields: List[str] = PAYMENT_LIST_FIELDS,
+    ) -> dict:
+        """
+        分页查询支付记录。
+
+        按到期时间（含服务期间条件时）或支付时间倒序，只读取 `fields` 中的字段。
+        等值条件与排序字段组合需要在 Firestore 中建立对应的复合索引。
+
+        Args:
+            query_dict (dict): 查询条件，与 query_payments 相同。
+            page_size (int): 每页条数。
+            start_after (DocumentSnapshot): 上一页返回的游标，None 表示第一页。
+            fields (List[str]): 投影字段。
+
+        Returns:
+            dict: docs 为本页文档；cursor 为下一页游标，没有下一页时为 None；
+                total 为符合条件的记录数估计（仅第一页计算，其余页为 None）。
+                含子串条件时 total 为检索词（回填完成前为其余条件）匹配的记录数，
+                本页 docs 可能少于 page_size。
+        """
+        if "order_id" in query_dict:
+            docs = self.query_payments({"order_id": query_dict["order_id"]})
+            return {"docs": docs, "cursor": None, "total": len(docs)}
+
+        query, substrings = self._build_payment_query(query_dict)
+        total = None
+        if start_after is None:
+            total = query.count().get()[0][0].value
+
+        order_field = (
+            "expiry_time"
+            if "start_expiry_time" in query_dict or "end_expiry_time" in query_dict
+            else "payment_time"
+        )
+        page_query = (
+            query.order_by(order_field, direction=firestore.Query.DESCENDING)
+            .select(list(dict.fromkeys([*fields, order_field])))
+            .limit(page_size)
+        )
+        if start_after is not None:
+            page_query = page_query.start_after(start_after)
+        docs = list(page_query.stream())
+        return {
+            "docs": self._match_substrings(docs, substrings),
+            "cursor": docs[-1] if len(docs) == page_size else None,
+            "total": total,
+        }
 
     def update_payment(self, order_id, update_fields: dict):
-        payments_ref = self.db.collection("payments")
-        payment_doc_ref = payments_ref.document(order_id)
-        payment_doc_ref.update(update_fields)
+        """在事务中更新支付记录，并同步用户文档中的服务到期时间。"""
+        payment_doc_ref = self.db.collection("payments").document(order_id)
+
+        @firestore.transactional
+        def update_in_transaction(transaction):
+            doc = payment_doc_ref.get(transaction=transaction)
+            if not doc.exists:
+                raise NotFound(f"订单 {order_id} 不存在")
+            payment_data = {**doc.to_dict(), **update_fields}
+            phone_number = payment_data["phone_number"]
+            service_fields = self._compute_service_fields(
+                phone_number, transaction, order_id, payment_data
+            )
+            fields = dict(update_fields)
+            if any(field in update_fields for field in PAYMENT_SEARCH_FIELDS):
+                fields["search_tokens"] = payment_search_tokens(payment_data)
+            transaction.update(payment_doc_ref, fields)
+            transaction.set(
+                self.db.collection("users").document(phone_number),
+                service_fields,
+                merge=True,
+            )
+            return phone_number
 
-    def delete_payment(self, order_id):
-        payments_ref = self.db.collection("payments")
-        payment_doc_ref = payments_ref.document(order_id)
-        payment_doc_ref.delete()
+        phone_number = update_in_transaction(self.db.transaction())
+        # 无法确定订单所属用户，清除全部支付缓存
+        document_cache.clear("payments")
+        self._invalidate("users", phone_number)
 
-    def enable_service(self, payment: Payment):
-        # 查询用户的最后一个订阅记录
-        payments_ref = self.db.collection("payments")
-        payments_query = (
-            payments_ref.where(
-                filter=FieldFilter("phone_number", "==", payment.phone_number)
+    def delete_payment(self, order_id):
+        """在事务中删除支付记录，并同步用户文档中的服务到期时间。"""
+        payment_doc_ref = self.db.collection("payments").document(order_id)
+
+        @firestore.transactional
+        def delete_in_transaction(transaction):
+            doc = payment_doc_ref.get(transaction=transaction)
+            if not doc.exists:
+                return None
+            phone_number = doc.to_dict()["phone_number"]
+            service_fields = self._compute_service_fields(
+                phone_number, transaction, order_id, None
             )
-            .where(filter=FieldFilter("status", "==", PaymentStatus.IN_SERVICE))
-            .order_by("expiry_time", direction=firestore.Query.DESCENDING)
-        )
-        last_subscription_docs = payments_query.stream()
-        last_subscription = next(last_subscription_docs, None)
+            transaction.delete(payment_doc_ref)
+            transaction.set(
+                self.db.collection("users").document(phone_number),
+                service_fields,
+                merge=True,
+            )
+            return phone_number
+
+        phone_number = delete_in_transaction(self.db.transaction())
+        document_cache.clear("payments")
+        if phone_number:
+            self._invalidate("users", phone_number)
+
+    def enable_service(self, payment: Payment, current_expiry_time=None):
+        """
+        批准订单并计算其到期时间。
 
+        Args:
+            payment (Payment): 支付记录。
+            current_expiry_time (datetime): 用户当前的服务到期时间，未过期时以其为基准顺延。
+        """
         # 创建一个包含时区信息的 datetime 对象
         now = datetime.now(timezone.utc)
         base_time = now
         # 如果存在未过期的订阅，以其到期时间为基准
-        if last_subscription is not None:
-            last_subscription = last_subscription.to_dict()
-            # 将字符串转换为 datetime 对象
-            last_subscription_expiry_time = last_subscription["expiry_time"].replace(
-                tzinfo=timezone.utc
-            )
-            if last_subscription_expiry_time > now:
-                base_time = last_subscription_expiry_time
+        if current_expiry_time is not None and current_expiry_time > now:
+            base_time = current_expiry_time
 
         # 将字符串转换为 PurchaseType 枚举
         expiry_time = base_time + self.calculate_expiry(payment.purchase_type)  # type: ignore
@@ -478,35 +1108,295 @@ class DbInterface:
 
     def add_payment(self, payment: Payment):
         phone_number = payment.phone_number
-        users_ref = self.db.collection("users")
-        user_doc_ref = users_ref.document(phone_number)
-        user_doc = user_doc_ref.get()
-
-        if not user_doc.exists:
-            # 如果用户不存在，则创建一个新用户
-            new_user = User(
-                display_name=self.faker.user_name(),
-                email=f"{phone_number}@{FAKE_EMAIL_DOMAIN}",
-                phone_number=phone_number,
-                password=phone_number,
-                timezone="Asia/Shanghai",
-                country="中国",
-                province="上海",
-                registration_time=datetime.now(timezone.utc),
-                memo=f"订单号：{payment.order_id}",
-            )  # type: ignore
-            self.register_user(new_user)
-
-        if payment.is_approved or (payment.receivable == payment.payment_amount):
-            # 更新到期时间
-            self.enable_service(payment)
-        # 添加支付记录
-        payments_ref = self.db.collection("payments")
-        payment_data = payment.model_dump()
-        # 从数据中删除 order_id
-        del payment_data["order_id"]
-        payment_doc_ref = payments_ref.document(payment.order_id)
-        payment_doc_ref.set(payment_data, merge=True)
+        user_doc_ref = self.db.collection("users").document(phone_number)
+        payment_doc_ref = self.db.collection("payments").document(payment.order_id)
+        is_approved = payment.is_approved or (
+            payment.receivable == payment.payment_amount
+        )
+
+        @firestore.transactional
+        def add_in_transaction(transaction):
+            # 在事务中读取用户文档，以免覆盖已有用户
+            user_doc = user_doc_ref.get(transaction=transaction)
+            user_data = user_doc.to_dict() if user_doc.exists else None
+            if is_approved:
+                # 更新到期时间
+                current_expiry_time = self._get_service_expiry(
+                    phone_number, user_data, transaction
+                )[0]
+                self.enable_service(payment, current_expiry_time)
+
+            user_fields = {}
+            if user_data is None:
+                # 如果用户不存在，则创建一个新用户
+                new_user = User(
+                    display_name=self.faker.user_name(),
+                    email=f"{phone_number}@{FAKE_EMAIL_DOMAIN}",
+                    phone_number=phone_number,
+                    password=phone_number,
+                    timezone="Asia/Shanghai",
+                    country="中国",
+                    province="上海",
+                    registration_time=datetime.now(timezone.utc),
+                    memo=f"订单号：{payment.order_id}",
+                )  # type: ignore
+                new_user.hash_password()
+                user_fields = new_user.model_dump()
+                del user_fields["phone_number"]  # 删除手机号码
+            if is_approved:
+                # 新订单顺延自当前到期时间，因此总是最晚到期的订单
+                user_fields.update(
+                    {
+                        "service_expiry_time": payment.expiry_time,
+                        "service_order_id": payment.order_id,
+                    }
+                )
+
+            # 添加支付记录
+            payment_data = payment.model_dump()
+            # 从数据中删除 order_id
+            del payment_data["order_id"]
+            payment_data["search_tokens"] = payment_search_tokens(payment_data)
+            transaction.set(payment_doc_ref, payment_data, merge=True)
+            if user_fields:
+                transaction.set(user_doc_ref, user_fields, merge=user_data is not None)
+            if user_data is None:
+                # 自动注册的用户同样登记唯一标记
+                transaction.set(
+                    self.db.collection("unique_phones").document(phone_number),
+                    _unique_marker(phone_number),
+                )
+                transaction.set(
+                    self.db.collection("unique_emails").document(
+                        normalize_email(user_fields["email"])
+                    ),
+                    _unique_marker(phone_number),
+                )
+
+        add_in_transaction(self.db.transaction())
+        self._invalidate("payments", ("last_active", phone_number))
+        self._invalidate("users", phone_number)
+
+    def backfill_payment_search_tokens(self, progress_callback=None) -> int:
+        """
+        为所有支付记录重新生成检索词，完成后写入回填标记，此后子串查询才使用检索词。
+
+        Args:
+            progress_callback (callable): 可选，参数为 (已处理数, 总数)。
+
+        Returns:
+            int: 更新的支付记录数量。
+        """
+        docs = list(
+            self.db.collection("payments")
+            .select([*PAYMENT_SEARCH_FIELDS, "search_tokens"])
+            .stream()
+        )
+        batch = self.db.batch()
+        pending = 0
+        updated = 0
+        for i, doc in enumerate(docs):
+            data = doc.to_dict()
+            tokens = payment_search_tokens(data)
+            if data.get("search_tokens") != tokens:
+                batch.update(doc.reference, {"search_tokens": tokens})
+                pending += 1
+                updated += 1
+            # 单个 WriteBatch 最多 500 次写入
+            if pending == 500:
+                batch.commit()
+                batch = self.db.batch()
+                pending = 0
+            if progress_callback:
+                progress_callback(i + 1, len(docs))
+        if pending:
+            batch.commit()
+        # 此后写入的支付记录都由 add_payment、update_payment 生成检索词
+        collection, doc_name = PAYMENT_SEARCH_TOKENS_MARKER
+        self.db.collection(collection).document(doc_name).set(
+            {"backfilled_at": datetime.now(timezone.utc), "updated": updated}
+        )
+        return updated
+
+    # endregion
+
+    # region 服务期限
+
+    def _compute_service_fields(
+        self, phone_number: str, transaction=None, order_id=None, payment_data=None
+    ) -> dict:
+        """
+        从支付记录计算用户文档中的服务期限字段。
+
+        Args:
+            phone_number (str): 用户手机号码。
+            transaction: 可选，在事务中读取支付记录。
+            order_id (str): 可选，正在更新或删除的订单号。
+            payment_data (dict): order_id 对应订单更新后的数据，为 None 表示该订单已删除。
+
+        Returns:
+            dict: 包含 service_expiry_time 与 service_order_id 的字典。
+        """
+        query = (
+            self.db.collection("payments")
+            .where(filter=FieldFilter("phone_number", "==", phone_number))
+            .where(filter=FieldFilter("is_approved", "==", True))
+        )
+        payments = {
+            doc.id: doc.to_dict()
+            for doc in query.stream(transaction=transaction)
+            if doc.id != order_id
+        }
+        if order_id and payment_data is not None:
+            payments[order_id] = payment_data
+        service_expiry_time, service_order_id = None, ""
+        for doc_id, data in payments.items():
+            if not data.get("is_approved"):
+                continue
+            expiry_time = data["expiry_time"].replace(tzinfo=timezone.utc)
+            if service_expiry_time is None or expiry_time > service_expiry_time:
+                service_expiry_time, service_order_id = expiry_time, doc_id
+        return {
+            "service_expiry_time": service_expiry_time,
+            "service_order_id": service_order_id,
+        }
+
+    def _get_service_expiry(self, phone_number: str, user_data, transaction=None):
+        """
+        返回用户的服务到期时间及订单号。
+
+        用户文档中缺少冗余字段（旧文档）时从支付记录计算；不在事务中时顺便回填。
+        """
+        if user_data is not None and "service_expiry_time" in user_data:
+            expiry_time = user_data["service_expiry_time"]
+            if expiry_time is not None:
+                expiry_time = expiry_time.replace(tzinfo=timezone.utc)
+            return expiry_time, user_data.get("service_order_id", "")
+        fields = self._compute_service_fields(phone_number, transaction)
+        if transaction is None and user_data is not None:
+            self.db.collection("users").document(phone_number).update(fields)
+            self._invalidate("users", phone_number)
+        return fields["service_expiry_time"], fields["service_order_id"]
+
+    def extend_service_time(self, delta: timedelta, received_at: datetime):
+        """
+        每日奖励：在事务中同时延长当前订单及用户文档中的服务到期时间。
+
+        Args:
+            delta (timedelta): 延长的时长。
+            received_at (datetime): 领取时间（用户时区），同一天只能领取一次。
+
+        Returns:
+            datetime or None: 新的到期时间；没有服务中的订单或当天已领取时返回 None。
+        """
+        phone_number = self.cache["user_info"]["phone_number"]
+        user_doc_ref = self.db.collection("users").document(phone_number)
+
+        @firestore.transactional
+        def extend_in_transaction(transaction):
+            user_doc = user_doc_ref.get(
+                field_paths=[
+                    "last_received_date",
+                    "service_expiry_time",
+                    "service_order_id",
+                ],
+                transaction=transaction,
+            )
+            user_data = user_doc.to_dict()
+            last_received_date = user_data.get("last_received_date")
+            if (
+                last_received_date is not None
+                and last_received_date.astimezone(received_at.tzinfo).date()
+                == received_at.date()
+            ):
+                return None
+            expiry_time, order_id = self._get_service_expiry(
+                phone_number, user_data, transaction
+            )
+            if not order_id:
+                return None
+            new_expiry_time = expiry_time + delta
+            transaction.update(
+                self.db.collection("payments").document(order_id),
+                {"expiry_time": new_expiry_time},
+            )
+            transaction.update(
+                user_doc_ref,
+                {
+                    "service_expiry_time": new_expiry_time,
+                    "service_order_id": order_id,
+                    "last_received_date": received_at,
+                },
+            )
+            return new_expiry_time
+
+        new_expiry_time = extend_in_transaction(self.db.transaction())
+        self._invalidate("payments", ("last_active", phone_number))
+        self._invalidate("users", phone_number)
+        return new_expiry_time
+
+    def reconcile_service_expiry(self, progress_callback=None) -> int:
+        """
+        根据支付记录重建所有用户文档中的服务期限字段。
+
+        Args:
+            progress_callback (callable): 可选，参数为 (已处理数, 总数)。
+
+        Returns:
+            int: 字段被修正的用户数量。
+        """
+        expected: Dict[str, dict] = {}
+        payments = (
+            self.db.collection("payments")
+            .where(filter=FieldFilter("is_approved", "==", True))
+            .select(["phone_number", "expiry_time"])
+            .stream()
+        )
+        for doc in payments:
+            data = doc.to_dict()
+            expiry_time = data["expiry_time"].replace(tzinfo=timezone.utc)
+            current = expected.get(data["phone_number"])
+            if current is None or expiry_time > current["service_expiry_time"]:
+                expected[data["phone_number"]] = {
+                    "service_expiry_time": expiry_time,
+                    "service_order_id": doc.id,
+                }
+
+        users = list(
+            self.db.collection("users")
+            .select(["service_expiry_time", "service_order_id"])
+            .stream()
+        )
+        empty = {"service_expiry_time": None, "service_order_id": ""}
+        batch = self.db.batch()
+        pending = 0
+        fixed = 0
+        for i, doc in enumerate(users):
+            data = doc.to_dict()
+            fields = expected.get(doc.id, empty)
+            actual_expiry = data.get("service_expiry_time")
+            if actual_expiry is not None:
+                actual_expiry = actual_expiry.replace(tzinfo=timezone.utc)
+            if (
+                "service_expiry_time" not in data
+                or actual_expiry != fields["service_expiry_time"]
+                or data.get("service_order_id", "") != fields["service_order_id"]
+            ):
+                batch.update(doc.reference, fields)
+                pending += 1
+                fixed += 1
+            # 单个 WriteBatch 最多 500 次写入
+            if pending == 500:
+                batch.commit()
+                batch = self.db.batch()
+                pending = 0
+            if progress_callback:
+                progress_callback(i + 1, len(users))
+        if pending:
+            batch.commit()
+        document_cache.clear("users")
+        document_cache.clear("payments")
+        return fixed
 
     # endregion
 
@@ -524,6 +1414,7 @@ class DbInterface:
                 "verification_code_time": datetime.now(timezone.utc),
             }
         )
+        self._invalidate("users", phone_number)
         return verification_code
 
     def login_with_verification_code(self, phone_number: str, verification_code: str):
@@ -531,13 +1422,21 @@ class DbInterface:
         if self.cache.get("user_info", {}).get("is_logged_in", False):
             return {"status": "warning", "message": "您已登录"}
 
-        # 获取用户文档的引用
-        user_doc_ref = self.db.collection("users").document(phone_number)
-        user_doc = user_doc_ref.get()
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
-            user_data["phone_number"] = phone_number  # 添加手机号码
-            user = User.from_doc(user_data)
+        # 验证码随时可能更新，总是读取最新数据
+        user_data = self._get_doc_dict(
+            "users",
+            phone_number,
+            refresh=True,
+            fields=[
+                *UserLoginInfo.field_mask,
+                "verification_code",
+                "verification_code_time",
+            ],
+        )
+        if user_data is not None:
+            # 复制后再添加键，不修改缓存中的文档
+            user_data = {**user_data, "phone_number": phone_number}  # 添加手机号码
+            user = UserLoginInfo.from_doc(user_data)
             # 检查验证码是否正确
             if user_data.get("verification_code") == verification_code:
                 # 检查验证码是否在有效期内
@@ -589,6 +1488,19 @@ class DbInterface:
             return dicts[:-1]  # 返回除最后一个登录事件外的所有未退出的登录事件
         return []
 
+    def is_session_revoked(self):
+        """
+        当前会话是否已被同一账号在其他设备上的登录取代。
+
+        由进程级会话登记在内存中判断，稳定状态下不读取数据库。
+        """
+        user_info = self.cache.get("user_info", {})
+        if "session_id" not in user_info:
+            return False
+        return get_session_registry(self.db).is_revoked(
+            user_info["phone_number"], user_info["session_id"]
+        )
+
     def force_logout_session(self, phone_number: str, session_id: str):
         login_events_ref = self.db.collection("login_events")
         login_event_doc_ref = login_events_ref.document(session_id)
@@ -598,56 +1510,194 @@ class DbInterface:
             and login_event_doc.to_dict()["phone_number"] == phone_number
         ):
             login_event_doc_ref.update({"logout_time": datetime.now(timezone.utc)})
+        if session_id == self.cache.get("user_info", {}).get("session_id"):
+            get_session_registry(self.db).unwatch(phone_number)
+
+    # endregion
+
+    # region 间隔重复
+
+    def get_srs_scheduler(self) -> SrsScheduler:
+        """返回当前用户的间隔重复调度，每个会话只从数据库加载一次。"""
+        if self.cache["srs"] is None:
+            phone_number = self.cache["user_info"]["phone_number"]
+            data = self._get_doc_dict("srs_states", phone_number) or {}
+            self.cache["srs"] = SrsScheduler.from_bytes(data.get("state"))
+        return self.cache["srs"]
+
+    def record_review(self, word: str, correct: bool) -> bool:
+        """
+        记录一次单词复习结果（拼图、看图猜词、词意测试等）。
+
+        状态写入加入本次运行的工作单元，一次运行中的多次复习合并为一次写入。
+        只记录已登记编号的单词。
+
+        Returns:
+            bool: 是否记录。
+        """
+        word_id = get_word_id_registry().id_of(word)
+        if word_id is None:
+            return False
+        scheduler = self.get_srs_scheduler()
+        if not scheduler.review(word_id, correct):
+            return False
+        phone_number = self.cache["user_info"]["phone_number"]
+        self.queue_write(
+            "srs_states",
+            phone_number,
+            {
+                "state": scheduler.to_bytes(),
+                "word_count": len(scheduler),
+                "updated_at": datetime.now(timezone.utc),
+            },
+        )
+        return True
+
+    def get_due_words(self, k: int) -> List[str]:
+        """返回当前用户至多 k 个已到期的复习单词，按到期时间先后排列。"""
+        ids = self.get_srs_scheduler().due_ids(k)
+        return get_word_id_registry().words_of(ids)
 
     # endregion
 
     # region 单词管理
 
-    def find_word(self, word):
+    def find_word(self, word, fields=None):
+        """
+        获取单词文档。
+
+        Args:
+            word (str): 单词，其中的 "/" 会被替换为 " or "。
+            fields: 可选，字段掩码，例如 `WORD_PRONUNCIATION_FIELDS` 或
+                `word_pos_fields("noun")`。默认读取整个文档。
+        """
         # 将单词中的 "/" 字符替换为 " or "
         word = word.replace("/", " or ")
 
+        # 优先读取离线词典包，离线包中没有时才查询数据库
+        doc_dict = find_word_in_bundle(word, fields)
+        if doc_dict is not None:
+            return doc_dict
+
         # 获取指定 ID 的文档
-        doc = self.db.collection("words").document(word).get()
+        doc_dict = self._get_doc_dict("words", word, fields=fields)
+
+        # 如果文档存在，返回其字典，否则返回一个空字典
+        return doc_dict if doc_dict is not None else {}
+
+    def get_mini_dict_doc(self, word: str) -> dict:
+        """
+        获取简版词典中单词的文档。
 
-        # 如果文档存在，将其转换为字典，否则返回一个空字典
-        return doc.to_dict() if doc.exists else {}
+        Args:
+            word (str): 单词，其中的 "/" 会被替换为 " or "。
+
+        Returns:
+            dict: 文档字典，文档不存在时返回空字典。
+        """
+        doc_name = word.replace("/", " or ")
+        # 优先使用进程内的本地副本，副本中不存在时才查询数据库
+        replica = get_running_replica(self.db)
+        doc_dict = replica.get(doc_name) if replica is not None else None
+        if doc_dict is None:
+            doc_dict = self._get_doc_dict("mini_dict", doc_name)
+        return doc_dict if doc_dict is not None else {}
+
+    def _get_all_mini_dict_docs(self, doc_names: List[str]) -> Dict[str, dict]:
+        """使用一次 get_all 请求读取一批简版词典文档，并回填缓存。"""
+        collection = self.db.collection("mini_dict")
+        refs = [collection.document(name) for name in doc_names]
+        res = {name: None for name in doc_names}
+        for doc in self.db.get_all(refs):
+            res[doc.id] = doc.to_dict() if doc.exists else None
+        for name, data in res.items():
+            document_cache.set("mini_dict", name, data)
+            self._run_set("mini_dict", name, data)
+        return res
+
+    def get_mini_dict_docs(self, words: List[str]) -> Dict[str, dict]:
+        """
+        批量获取简版词典中单词的文档。
+
+        本地副本或缓存中已有的单词直接使用，其余单词按 GET_ALL_CHUNK_SIZE 分批，
+        在有界线程池中并发执行 get_all 请求，读取结果回填到文档缓存。
+
+        Args:
+            words (List[str]): 单词列表。
+
+        Returns:
+            Dict[str, dict]: 以单词为键的文档字典，文档不存在时值为空字典。
+        """
+        doc_names = {word: word.replace("/", " or ") for word in words}
+        replica = get_running_replica(self.db)
+        found = (
+            replica.get_many(list(doc_names.values())) if replica is not None else {}
+        )
+        to_fetch = []
+        for name in dict.fromkeys(doc_names.values()):
+            if name in found:
+                continue
+            cached = self._run_get("mini_dict", name)
+            if cached is MISSING:
+                cached = document_cache.get("mini_dict", name)
+            if cached is MISSING:
+                to_fetch.append(name)
+            else:
+                found[name] = cached
+
+        chunks = [
+            to_fetch[i : i + GET_ALL_CHUNK_SIZE]
+            for i in range(0, len(to_fetch), GET_ALL_CHUNK_SIZE)
+        ]
+        if len(chunks) == 1:
+            found.update(self._get_all_mini_dict_docs(chunks[0]))
+        elif chunks:
+            with ThreadPoolExecutor(
+                max_workers=min(GET_ALL_MAX_WORKERS, len(chunks))
+            ) as executor:
+                for res in executor.map(self._get_all_mini_dict_docs, chunks):
+                    found.update(res)
+
+        return {word: found.get(name) or {} for word, name in doc_names.items()}
 
     def word_has_image_urls(self, word: str) -> bool:
         # 获取文档
-        doc = self.db.collection("mini_dict").document(word).get()
+        doc_dict = self._get_doc_dict("mini_dict", word)
 
         # 如果文档不存在，返回 False
-        if not doc.exists:
+        if doc_dict is None:
             return False
 
-        # 将 DocumentSnapshot 对象转换为字典
-        doc_dict = doc.to_dict()
-
         # 检查 image_urls 字段是否存在且不为空
         return "image_urls" in doc_dict and bool(doc_dict["image_urls"])
 
-    def update_image_urls(self, word: str, urls: list):
+    def update_image_urls(self, word: str, urls: list, deferred: bool = False):
+        """
+        更新或添加单词的 image_urls 字段。
+
+        Args:
+            deferred (bool): 为 True 时加入本次运行的工作单元，在运行结束时与其他写入一并提交。
+        """
         # 将单词中的 "/" 字符替换为 " or "
         word = word.replace("/", " or ")
+        fields = mini_dict_update_fields({"image_urls": urls})
+        if deferred:
+            self.queue_write("mini_dict", word, fields)
+            return
 
-        # 更新或添加 image_urls 字段
-        self.db.collection("mini_dict").document(word).set(
-            {"image_urls": urls}, merge=True
-        )
+        self.db.collection("mini_dict").document(word).set(fields, merge=True)
+        # 文档可能此前并不存在，直接使缓存失效
+        self._invalidate("mini_dict", word)
 
     # TODO：废弃 image_indices
     def get_image_indices(self, doc_name):
-        # 获取 mini_dict 集合中的文档引用
-        doc_ref = self.db.collection("mini_dict").document(doc_name)
-
-        # 获取文档的数据
-        doc = doc_ref.get()
+        # 获取 mini_dict 集合中的文档数据
+        doc_dict = self._get_doc_dict("mini_dict", doc_name)
 
         # 如果文档存在并且包含 image_indices 字段，返回该字段的值
         # 否则，返回一个空列表
-        if doc.exists and "image_indices" in doc.to_dict():
-            return doc.to_dict()["image_indices"]
+        if doc_dict is not None and "image_indices" in doc_dict:
+            return doc_dict["image_indices"]
         else:
             return []
 
@@ -657,37 +1707,29 @@ class DbInterface:
 
         # 更新或添加 image_urls 字段
         self.db.collection("mini_dict").document(word).set(
-            {"image_indices": indices}, merge=True
+            mini_dict_update_fields({"image_indices": indices}), merge=True
         )
+        self._invalidate("mini_dict", word)
 
     def word_has_image_indices(self, word: str) -> bool:
         # 获取文档
-        doc = self.db.collection("mini_dict").document(word).get()
+        doc_dict = self._get_doc_dict("mini_dict", word)
 
         # 如果文档不存在，返回 False
-        if not doc.exists:
+        if doc_dict is None:
             return False
 
-        # 将 DocumentSnapshot 对象转换为字典
-        doc_dict = doc.to_dict()
-
         # 检查 image_urls 字段是否存在
         return "image_indices" in doc_dict
 
     def find_docs_without_image_indices(self, doc_names):
-        # 获取 "words" 集合
-        collection = self.db.collection("mini_dict")
-
         # 存储没有 "image_indices" 字段的文档的名称
         doc_names_without_image_indices = []
 
         # 遍历所有文档名称
         for doc_name in doc_names:
             # 获取文档
-            doc = collection.document(doc_name).get()
-
-            # 将 DocumentSnapshot 对象转换为字典
-            doc_dict = doc.to_dict()
+            doc_dict = self._get_doc_dict("mini_dict", doc_name) or {}
 
             # 检查 "image_indices" 字段是否存在
             if "image_indices" not in doc_dict:
@@ -1,8 +1,8 @@
 from datetime import datetime, timezone
 from enum import Enum
-from typing import List, Optional, Type, Union
+from typing import ClassVar, List, Optional, Sequence, Tuple, Type, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
 from werkzeug.security import check_password_hash, generate_password_hash
 
 
@@ -109,11 +109,17 @@ class User(BaseModel):
     target_level: str = Field("C2")
     password: str = Field("")
     personal_vocabulary: List[str] = Field(default_factory=list)
+    # 位图存储模式：已登记单词以压缩位图保存，未登记单词保存在 vocabulary_overflow
+    vocabulary_bitmap: Optional[bytes] = Field(None)
+    vocabulary_overflow: List[str] = Field(default_factory=list)
     user_role: UserRole = Field(default=UserRole.USER)
     registration_time: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc)
     )
     total_tokens: int = Field(default=0)
+    # 由支付记录派生：已批准订单中最晚的到期时间及其订单号，登录时无需查询支付记录
+    service_expiry_time: Optional[datetime] = Field(None)
+    service_order_id: str = Field("")
     # used_tokens: List[TokenUsageRecord] = Field(default=[])
     # payments: Optional[List[Payment]] = Field(default_factory=list)
     # login_events: Optional[List[LoginEvent]] = Field(default_factory=list)
@@ -129,3 +135,91 @@ class User(BaseModel):
     @classmethod
     def from_doc(cls, doc: dict):
         return cls(**doc)
+
+
+# region 部分用户模型
+
+# 用户文档不保存手机号码（文档名称即手机号码），字段掩码中不包含该字段
+_DOC_ID_FIELDS = ("phone_number",)
+
+
+class _PartialUser(BaseModel):
+    # 读取用户文档时使用的字段掩码
+    field_mask: ClassVar[Tuple[str, ...]] = ()
+
+    @classmethod
+    def from_doc(cls, doc: dict):
+        return cls(**doc)
+
+
+class _UserCredentials(_PartialUser):
+    def check_password(self, password):
+        return check_password_hash(self.password, password)  # type: ignore
+
+
+def partial_user_model(
+    name: str, fields: Sequence[str], base: Type[_PartialUser] = _PartialUser
+) -> Type[_PartialUser]:
+    """
+    由 User 的部分字段派生模型，字段类型及默认值与 User 相同。
+
+    派生模型的 `field_mask` 为读取用户文档时需要的字段，配合
+    `DbInterface.get_user(model=...)` 使用，只下载并解析这些字段。
+    """
+    model = create_model(
+        name,
+        __base__=base,
+        **{f: (User.model_fields[f].annotation, User.model_fields[f]) for f in fields},
+    )
+    model.field_mask = tuple(f for f in fields if f not in _DOC_ID_FIELDS)
+    return model
+
+
+# 登录：验证密码、服务期限并缓存登录信息
+UserLoginInfo = partial_user_model(
+    "UserLoginInfo",
+    [
+        "phone_number",
+        "display_name",
+        "email",
+        "user_role",
+        "timezone",
+        "password",
+        "service_expiry_time",
+        "service_order_id",
+    ],
+    base=_UserCredentials,
+)
+
+# 个人信息页面
+UserProfile = partial_user_model(
+    "UserProfile",
+    [
+        "phone_number",
+        "email",
+        "real_name",
+        "display_name",
+        "country",
+        "province",
+        "timezone",
+        "current_level",
+        "target_level",
+    ],
+)
+
+# 服务期限显示及每日奖励
+UserServiceInfo = partial_user_model(
+    "UserServiceInfo",
+    ["phone_number", "user_role", "timezone", "service_expiry_time", "service_order_id"],
+)
+
+# 令牌用量
+UserTokenCount = partial_user_model("UserTokenCount", ["total_tokens"])
+
+# 个人词库：数组或位图存储
+UserVocabulary = partial_user_model(
+    "UserVocabulary",
+    ["personal_vocabulary", "vocabulary_bitmap", "vocabulary_overflow"],
+)
+
+# endregion
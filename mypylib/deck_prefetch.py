@@ -0,0 +1,109 @@
+import logging
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from typing import Callable, Dict, List, Sequence
+
+logger = logging.getLogger("streamlit")
+
+# 进程内所有会话共享的预取线程数上限
+PREFETCH_MAX_WORKERS = 8
+
+
+def script_thread_only(func):
+    """
+    标记只能在脚本线程中运行的函数（读写 st.session_state 等），DeckPrefetcher 拒绝执行。
+    """
+    func.script_thread_only = True
+    return func
+
+
+def _is_script_thread_only(task) -> bool:
+    # functools.partial 检查其包装的函数
+    while task is not None:
+        if getattr(task, "script_thread_only", False):
+            return True
+        task = getattr(task, "func", None)
+    return False
+
+
+@lru_cache(maxsize=None)
+def get_prefetch_executor() -> ThreadPoolExecutor:
+    """返回进程内共享的有界线程池，任务按提交顺序执行。"""
+    return ThreadPoolExecutor(
+        max_workers=PREFETCH_MAX_WORKERS, thread_name_prefix="deck-prefetch"
+    )
+
+
+class DeckPrefetcher:
+    """
+    单词卡组的后台预取。
+
+    每个单词按卡组中的位置依次提交到共享线程池，逐个执行预取任务，结果写入
+    各任务自身使用的缓存（文档缓存、st.cache_data 等），本类只记录完成情况。
+    单个任务出错时记录日志并继续执行其余任务，浏览到该单词时再按原路径获取。
+
+    任务在没有 ScriptRunContext 的线程中运行，不能读写 st.session_state，
+    所需的会话对象（例如 DbInterface）应在创建任务时传入。以 `script_thread_only`
+    标记的函数不能作为任务。
+    """
+
+    def __init__(
+        self,
+        words: Sequence[str],
+        tasks: List[Callable[[str], object]],
+        executor: ThreadPoolExecutor = None,
+    ):
+        for task in tasks:
+            if _is_script_thread_only(task):
+                raise ValueError(f"{task} 只能在脚本线程中运行，不能用于后台预取")
+        self.words = list(words)
+        self._tasks = tasks
+        self._cancelled = threading.Event()
+        executor = executor or get_prefetch_executor()
+        self._futures: Dict[str, Future] = {}
+        for word in dict.fromkeys(self.words):
+            self._futures[word] = executor.submit(self._prefetch, word)
+
+    def _prefetch(self, word: str):
+        for task in self._tasks:
+            if self._cancelled.is_set():
+                return
+            try:
+                task(word)
+            except Exception as e:
+                logger.error(f"预取单词 {word} 失败：{e}")
+
+    def is_ready(self, word: str) -> bool:
+        future = self._futures.get(word)
+        return future is not None and future.done()
+
+    def wait(self, word: str, timeout: float = None) -> bool:
+        """
+        单词正在预取时等待其完成，避免脚本线程重复获取；尚未开始或已取消的单词不等待。
+
+        Returns:
+            bool: 该单词的预取是否已完成。
+        """
+        future = self._futures.get(word)
+        if future is None:
+            return False
+        if future.running():
+            try:
+                future.result(timeout)
+            except (CancelledError, FutureTimeoutError):
+                return False
+        return future.done() and not future.cancelled()
+
+    def ready_count(self) -> int:
+        return sum(future.done() for future in self._futures.values())
+
+    def __len__(self) -> int:
+        return len(self._futures)
+
+    def cancel(self):
+        """取消尚未开始的预取；正在执行的单词完成当前任务后停止。"""
+        self._cancelled.set()
+        for future in self._futures.values():
+            future.cancel()
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("streamlit")
+
+CURRENT_CWD: Path = Path(__file__).parent.parent
+EXERCISE_DIR = CURRENT_CWD / "resource" / "exercise"
+# 由练习题文件编译的索引，练习题文件变化（SHA-256 不同）时重新编译
+EXERCISE_INDEX_FP = CURRENT_CWD / "resource" / "exercise_index.json"
+
+_JSON_DECODER = json.JSONDecoder()
+_OPTION_LETTER_RE = re.compile(r"[A-Za-z]")
+
+
+def level_name(file_name: str) -> str:
+    """由文件名取得级别名称，例如 "00_语法入门练习题.json" -> "语法入门"。"""
+    stem = Path(file_name).stem.split("_", maxsplit=1)[-1]
+    return stem.removesuffix("练习题")
+
+
+def option_letter(text: str) -> str:
+    """返回选项或答案的字母，例如 " A. excess" 及 "A" 均为 "A"。"""
+    match = _OPTION_LETTER_RE.search(text or "")
+    return match.group().upper() if match else ""
+
+
+def _files_sha256(fps: List[Path]) -> str:
+    sha = hashlib.sha256()
+    for fp in fps:
+        sha.update(fp.name.encode("utf-8"))
+        with open(fp, "rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def scan_sections(fp: Path) -> List[dict]:
+    """
+    扫描练习题文件，返回各节的标题、在文件中的字节范围、题目数量及答案。
+
+    练习题文件为 `[{"header": ..., "questions": [...]}, ...]`，逐节解码以记录
+    每节的起止位置，之后可直接定位读取单独一节。
+    """
+    with open(fp, "r", encoding="utf-8") as f:
+        text = f.read()
+    sections = []
+    pos = text.index("[") + 1
+    byte_pos = len(text[:pos].encode("utf-8"))
+    while True:
+        # 跳过空白及逗号（均为单字节字符）
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+            byte_pos += 1
+        if pos >= len(text) or text[pos] == "]":
+            break
+        section, end = _JSON_DECODER.raw_decode(text, pos)
+        byte_end = byte_pos + len(text[pos:end].encode("utf-8"))
+        sections.append(
+            {
+                "header": section["header"].strip(),
+                "start": byte_pos,
+                "end": byte_end,
+                "count": len(section["questions"]),
+                # 只记录有标准答案的题目：题目序号 -> 选项字母
+                "answers": {
+                    i: option_letter(q["answer"])
+                    for i, q in enumerate(section["questions"])
+                    if q.get("answer")
+                },
+            }
+        )
+        pos, byte_pos = end, byte_end
+    return sections
+
+
+class ExerciseBank:
+    """
+    语法练习题库。
+
+    索引只记录各节所在的文件、标题、字节范围及题目数量，题目按文件、节的顺序
+    统一编号，同一级别的题目编号连续。按编号定位题目为 O(1)，随机抽题只在编号
+    范围内抽样；题目所在的节在首次访问时才从文件中读取并解码，进程内共享。
+    标准答案以选项字母保存在索引中，检查答案无需读取题目。
+    """
+
+    def __init__(self, exercise_dir: Path, files: List[str], sections: List[dict]):
+        self.exercise_dir = exercise_dir
+        self.files = files
+        self._sections = sections
+        self._section_starts: List[int] = []
+        # 题目编号 -> 所在节的序号
+        self._question_sections: List[int] = []
+        self._answers: Dict[int, str] = {}
+        self._level_ranges: Dict[str, tuple] = {}
+        for pos, section in enumerate(sections):
+            start = len(self._question_sections)
+            self._section_starts.append(start)
+            self._question_sections.extend([pos] * section["count"])
+            for i, letter in section["answers"].items():
+                self._answers[start + int(i)] = letter
+            level = level_name(files[section["file"]])
+            first, _ = self._level_ranges.get(level, (start, start))
+            self._level_ranges[level] = (first, start + section["count"])
+        self._loaded: Dict[int, list] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._question_sections)
+
+    # region 目录
+
+    def levels(self) -> List[str]:
+        return list(self._level_ranges)
+
+    def sections(self, level: str) -> List[dict]:
+        """返回级别中各节的序号、标题及题目数量。"""
+        return [
+            {"section": pos, "header": s["header"], "count": s["count"]}
+            for pos, s in enumerate(self._sections)
+            if level_name(self.files[s["file"]]) == level
+        ]
+
+    def _range(self, level: Optional[str], section: Optional[int]) -> range:
+        if section is not None:
+            start = self._section_starts[section]
+            return range(start, start + self._sections[section]["count"])
+        if level is not None:
+            return range(*self._level_ranges[level])
+        return range(len(self))
+
+    # endregion
+
+    # region 题目
+
+    def _load_section(self, pos: int) -> list:
+        questions = self._loaded.get(pos)
+        if questions is not None:
+            return questions
+        section = self._sections[pos]
+        with open(self.exercise_dir / self.files[section["file"]], "rb") as f:
+            f.seek(section["start"])
+            data = f.read(section["end"] - section["start"])
+        questions = json.loads(data.decode("utf-8"))["questions"]
+        with self._lock:
+            return self._loaded.setdefault(pos, questions)
+
+    def question(self, question_id: int) -> dict:
+        """
+        返回题目。
+
+        Returns:
+            dict: 题目字段（question、options、cn 等）及 id、level、header；
+                返回的字典为副本，其中的列表与其他会话共享，不得修改。
+        """
+        pos = self._question_sections[question_id]
+        section = self._sections[pos]
+        q = self._load_section(pos)[question_id - self._section_starts[pos]]
+        return {
+            **q,
+            "id": question_id,
+            "level": level_name(self.files[section["file"]]),
+            "header": section["header"],
+        }
+
+    def sample(
+        self,
+        n: int,
+        level: Optional[str] = None,
+        section: Optional[int] = None,
+        rng: random.Random = None,
+    ) -> List[int]:
+        """在级别或节中随机抽取至多 n 道题目，返回题目编号。"""
+        ids = self._range(level, section)
+        return (rng or random).sample(ids, min(n, len(ids)))
+
+    # endregion
+
+    # region 答案
+
+    def has_answer(self, question_id: int) -> bool:
+        return question_id in self._answers
+
+    def check_answer(self, question_id: int, choice: str) -> Optional[bool]:
+        """
+        检查所选选项是否正确。
+
+        Args:
+            choice (str): 所选选项，例如 "A. is" 或 "A"。
+
+        Returns:
+            bool or None: 题目没有标准答案时返回 None。
+        """
+        answer = self._answers.get(question_id)
+        if answer is None:
+            return None
+        return option_letter(choice) == answer
+
+    # endregion
+
+    # region 编译与加载
+
+    @classmethod
+    def build(cls, exercise_dir: Path = EXERCISE_DIR) -> "ExerciseBank":
+        files = sorted(fp.name for fp in exercise_dir.glob("*.json"))
+        sections = []
+        for i, name in enumerate(files):
+            for section in scan_sections(exercise_dir / name):
+                sections.append({"file": i, **section})
+        return cls(exercise_dir, files, sections)
+
+    def save(self, fp: Path, source_sha256: str):
+        tmp_fp = f"{fp}.{os.getpid()}.tmp"
+        with open(tmp_fp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "source_sha256": source_sha256,
+                    "files": self.files,
+                    "sections": self._sections,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_fp, fp)
+
+    @classmethod
+    def load(
+        cls, fp: Path, exercise_dir: Path, source_sha256: str
+    ) -> Optional["ExerciseBank"]:
+        """加载编译后的索引；文件不存在、无法读取或与 source_sha256 不符时返回 None。"""
+        if not os.path.exists(fp):
+            return None
+        try:
+            with open(fp, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取练习题索引 {fp} 失败：{e}")
+            return None
+        if data.get("source_sha256") != source_sha256:
+            return None
+        return cls(exercise_dir, data["files"], data["sections"])
+
+    # endregion
+
+
+def load_exercise_bank(
+    exercise_dir: Path = EXERCISE_DIR, index_fp: Path = EXERCISE_INDEX_FP
+) -> ExerciseBank:
+    """加载编译后的练习题索引；索引不存在或已过期时重新编译并保存。"""
+    source_sha256 = _files_sha256(sorted(exercise_dir.glob("*.json")))
+    bank = ExerciseBank.load(index_fp, exercise_dir, source_sha256)
+    if bank is not None:
+        return bank
+    bank = ExerciseBank.build(exercise_dir)
+    try:
+        bank.save(index_fp, source_sha256)
+        logger.info(f"已编译练习题索引：{index_fp}")
+    except OSError as e:
+        logger.warning(f"保存练习题索引 {index_fp} 失败：{e}")
+    return bank
+
+
+@lru_cache(maxsize=None)
+def get_exercise_bank() -> ExerciseBank:
+    """返回进程内共享的练习题库。"""
+    return load_exercise_bank()
@@ -1,6 +1,6 @@
 import json
 import time
-from typing import Callable, List
+from typing import Callable, List, Tuple
 
 import streamlit as st
 from vertexai.preview.generative_models import GenerationConfig, GenerativeModel, Part
@@ -44,7 +44,7 @@ def display_generated_content_and_update_token(
 
     placeholder.markdown(full_response)
 
-    # 添加记录到数据库
+    # 添加记录到写入队列，由后台线程批量写入数据库
     st.session_state.dbi.add_token_record(item_name, total_tokens)
     # 修改会话中的令牌数
     st.session_state.current_token_count = total_tokens
@@ -80,12 +80,37 @@ def parse_generated_content_and_update_token(
         full_response = responses.text
         total_tokens += responses._raw_response.usage_metadata.total_token_count
 
-    # 添加记录到数据库
+    record_token_usage(item_name, total_tokens)
+    return parser(full_response)
+
+
+def record_token_usage(item_name: str, total_tokens: int):
+    """记录令牌用量，须在脚本线程中调用。"""
+    # 添加记录到写入队列，由后台线程批量写入数据库
     st.session_state.dbi.add_token_record(item_name, total_tokens)
     # 修改会话中的令牌数
     st.session_state.current_token_count = total_tokens
     st.session_state.total_token_count += total_tokens
-    return parser(full_response)
+
+
+def generate_content_with_usage(
+    model: GenerativeModel,
+    contents: List[Part],
+    generation_config: GenerationConfig,
+    parser: Callable,
+) -> Tuple[object, int]:
+    """
+    生成内容并返回 (解析结果, 令牌数)，不读写 st.session_state，可在后台线程中调用。
+
+    令牌用量由调用方回到脚本线程后通过 `record_token_usage` 记录。
+    """
+    response = model.generate_content(
+        contents,
+        generation_config=generation_config,
+        safety_settings=DEFAULT_SAFETY_SETTINGS,
+    )
+    total_tokens = response._raw_response.usage_metadata.total_token_count
+    return parser(response.text), total_tokens
 
 
 WORD_IMAGE_PROMPT_TEMPLATE = """
@@ -122,17 +147,27 @@ def select_best_images_for_word(model, word, images: List[Part]):
     Returns:
         list: 以JSON格式输出的最佳图片序号列表。这些序号对应于输入的图片列表中的位置。如果没有合适的图片，则返回空列表。
     """
+    indices, total_tokens = rank_word_images(model, word, images)
+    record_token_usage("挑选图片", total_tokens)
+    return indices
+
+
+def rank_word_images(model, word, images: List[Part]) -> Tuple[list, int]:
+    """
+    与 `select_best_images_for_word` 相同，但不记录令牌用量，可在后台线程中调用。
+
+    Returns:
+        tuple: (最佳图片序号列表, 令牌数)。
+    """
     prompt = WORD_IMAGE_PROMPT_TEMPLATE.format(word=word)
     contents = [Part.from_text(prompt)] + images
     generation_config = GenerationConfig(
         max_output_tokens=2048, temperature=0.1, top_p=1, top_k=32
     )
-    return parse_generated_content_and_update_token(
-        "挑选图片",
+    return generate_content_with_usage(
         model,
         contents,
         generation_config,
-        stream=False,
         parser=lambda x: json.loads(x.replace("```python", "").replace("```", "")),
     )
 
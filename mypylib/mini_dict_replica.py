@@ -0,0 +1,287 @@
+import copy
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from google.cloud import firestore
+from google.cloud.firestore import FieldFilter
+
+logger = logging.getLogger("streamlit")
+
+CURRENT_CWD: Path = Path(__file__).parent.parent
+SNAPSHOT_FP = CURRENT_CWD / "resource" / "dictionary" / "mini_dict_snapshot.json.gz"
+
+# 增量同步间隔，超过二倍间隔未同步视为过时
+SYNC_INTERVAL = 5 * 60  # 5 分钟
+# 快照格式版本，格式不符的快照视为无效并全量同步
+SNAPSHOT_FORMAT = 2
+
+
+def _json_default(value):
+    # 快照中的时间字段标记类型，加载时还原为 datetime，与数据库返回的类型一致
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError(f"无法序列化 {type(value)}")
+
+
+def _json_object_hook(obj: dict):
+    if len(obj) == 1 and "$datetime" in obj:
+        return datetime.fromisoformat(obj["$datetime"])
+    return obj
+
+
+class MiniDictReplica:
+    """
+    简版词典（mini_dict）的进程内只读副本。
+
+    启动时从本地压缩快照文件加载，随后在后台线程中按 `updated_at`
+    游标增量查询数据库中变动的文档，并将结果写回快照文件。
+    写入 mini_dict 的代码必须同时设置 `updated_at` 字段，未设置该字段的
+    文档只能通过 `refresh(full=True)` 同步。
+    """
+
+    def __init__(
+        self,
+        db,
+        snapshot_fp: Path = SNAPSHOT_FP,
+        sync_interval: int = SYNC_INTERVAL,
+    ):
+        self.db = db
+        self.snapshot_fp = snapshot_fp
+        self.sync_interval = sync_interval
+        self._docs: Dict[str, dict] = {}
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # 副本变动时的回调，参数为 {文档名称: 文档字典}，已删除的文档为 None
+        self._listeners: List[Callable[[Dict[str, Optional[dict]]], None]] = []
+        # 副本版本：已同步文档中最大的 updated_at
+        self.version: Optional[datetime] = None
+        # 修订号：副本内容每次变动（包括本地写入）加一，用作派生数据的缓存键
+        self.revision = 0
+        self.synced_at: Optional[datetime] = None
+
+    # region 读取
+
+    def __contains__(self, doc_name: str) -> bool:
+        with self._lock:
+            return doc_name in self._docs
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._docs)
+
+    def get(self, doc_name: str) -> Optional[dict]:
+        """返回文档字典的深拷贝；副本中不存在时返回 None。"""
+        with self._lock:
+            return copy.deepcopy(self._docs.get(doc_name))
+
+    def get_many(self, doc_names: List[str]) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                name: copy.deepcopy(self._docs[name])
+                for name in doc_names
+                if name in self._docs
+            }
+
+    def records(self) -> List[dict]:
+        """返回 `{"word": 文档名称, **文档}` 形式的记录列表，用于生成 DataFrame。"""
+        with self._lock:
+            return [{"word": name, **doc} for name, doc in self._docs.items()]
+
+    def status(self) -> dict:
+        """返回副本的版本及过时状态。"""
+        with self._lock:
+            age = (
+                (datetime.now(timezone.utc) - self.synced_at).total_seconds()
+                if self.synced_at
+                else None
+            )
+            return {
+                "size": len(self._docs),
+                "version": self.version,
+                "synced_at": self.synced_at,
+                "age_seconds": age,
+                "is_stale": age is None or age > 2 * self.sync_interval,
+            }
+
+    # endregion
+
+    # region 本地快照
+
+    def load(self) -> bool:
+        """从本地快照文件加载副本。文件不存在或损坏时返回 False。"""
+        if not os.path.exists(self.snapshot_fp):
+            return False
+        try:
+            with gzip.open(self.snapshot_fp, "rt", encoding="utf-8") as f:
+                data = json.load(f, object_hook=_json_object_hook)
+        except (OSError, ValueError) as e:
+            logger.error(f"加载简版词典快照失败：{e}")
+            return False
+        if data.get("format") != SNAPSHOT_FORMAT:
+            logger.info("简版词典快照格式已过时，将全量同步")
+            return False
+        with self._lock:
+            self._docs = data["docs"]
+            self.revision += 1
+            self.version = (
+                datetime.fromisoformat(data["version"]) if data["version"] else None
+            )
+            self.synced_at = datetime.fromisoformat(data["synced_at"])
+        logger.info(f"已加载简版词典快照，文档数：{len(self._docs)}")
+        return True
+
+    def save(self):
+        """将副本写入本地快照文件（先写临时文件再替换，避免读到半个文件）。"""
+        with self._lock:
+            data = {
+                "format": SNAPSHOT_FORMAT,
+                "version": self.version.isoformat() if self.version else None,
+                "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+                "docs": self._docs,
+            }
+            tmp_fp = f"{self.snapshot_fp}.tmp"
+            with gzip.open(tmp_fp, "wt", encoding="utf-8") as f:
+                json.dump(
+                    data,
+                    f,
+                    ensure_ascii=False,
+                    separators=(",", ":"),
+                    default=_json_default,
+                )
+        os.replace(tmp_fp, self.snapshot_fp)
+
+    # endregion
+
+    # region 同步
+
+    def add_listener(self, callback: Callable[[Dict[str, Optional[dict]]], None]):
+        """注册副本变动回调，用于增量维护依赖副本的派生索引。"""
+        self._listeners.append(callback)
+
+    def _notify(self, docs: Dict[str, Optional[dict]]):
+        for callback in list(self._listeners):
+            try:
+                callback(docs)
+            except Exception as e:
+                logger.error(f"简版词典副本回调失败：{e}")
+
+    def _apply(self, doc_name: str, data: dict):
+        updated_at = data.pop("updated_at", None)
+        self._docs[doc_name] = data
+        if isinstance(updated_at, datetime) and (
+            self.version is None or updated_at > self.version
+        ):
+            self.version = updated_at
+
+    def apply_local_write(self, doc_name: str, fields: dict):
+        """将本进程写入数据库的字段合并到副本中，避免等待下一次同步。"""
+        with self._lock:
+            doc = dict(self._docs.get(doc_name, {}))
+            doc.update(copy.deepcopy(fields))
+            self._docs[doc_name] = doc
+            self.revision += 1
+        self._notify({doc_name: dict(doc)})
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        从数据库同步副本。
+
+        Args:
+            full (bool): 为 True 时读取整个集合，否则只读取 `updated_at`
+                晚于当前版本的文档。没有版本信息时总是全量同步。
+
+        Returns:
+            int: 本次同步的文档数量。
+        """
+        with self._sync_lock:
+            full = full or self.version is None
+            # 预留时钟误差，重复读取少量文档无害
+            started = datetime.now(timezone.utc) - timedelta(minutes=1)
+            collection = self.db.collection("mini_dict")
+            if full:
+                docs = collection.stream()
+            else:
+                docs = (
+                    collection.where(
+                        filter=FieldFilter("updated_at", ">", self.version)
+                    )
+                    .order_by("updated_at")
+                    .stream()
+                )
+            # 读取过程不持有锁，避免阻塞查询
+            changes = [(doc.id, doc.to_dict()) for doc in docs]
+            with self._lock:
+                previous = set(self._docs) if full else set()
+                if full:
+                    self._docs = {}
+                    self.version = None
+                for doc_name, data in changes:
+                    self._apply(doc_name, data)
+                # 全量同步后，以同步开始时间作为版本下限，避免缺少 updated_at
+                # 的旧文档导致后续每次都全量同步
+                if full and (self.version is None or self.version < started):
+                    self.version = started
+                self.synced_at = datetime.now(timezone.utc)
+                # 全量同步时，数据库中已删除的文档以 None 通知
+                changed = {name: None for name in previous - set(self._docs)}
+                changed.update((name, self._docs[name]) for name, _ in changes)
+                if changed or full:
+                    self.revision += 1
+            if changed:
+                self._notify(changed)
+            if changes or full:
+                try:
+                    self.save()
+                except OSError as e:
+                    logger.error(f"保存简版词典快照失败：{e}")
+            logger.info(f"简版词典副本同步完成，变动文档数：{len(changes)}")
+            return len(changes)
+
+    def _run(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"简版词典副本同步失败：{e}")
+
+    def start(self):
+        """加载快照并启动后台增量同步线程，同时登记为该客户端的进程级副本。"""
+        loaded = self.load()
+        try:
+            self.refresh(full=not loaded)
+        except Exception as e:
+            # 同步失败时仍使用已加载的快照，由后台线程重试
+            logger.error(f"简版词典副本同步失败：{e}")
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="mini-dict-replica", daemon=True
+            )
+            self._thread.start()
+        with _replicas_lock:
+            _replicas[id(self.db)] = self
+
+    # endregion
+
+
+_replicas: Dict[int, MiniDictReplica] = {}
+_replicas_lock = threading.Lock()
+
+
+def get_running_replica(db) -> Optional[MiniDictReplica]:
+    """返回与 Firestore 客户端对应的已启动副本；尚未启动时返回 None。"""
+    with _replicas_lock:
+        return _replicas.get(id(db))
+
+
+def mini_dict_update_fields(fields: dict) -> dict:
+    """为写入 mini_dict 的字段添加 `updated_at`，供副本增量同步使用。"""
+    return {**fields, "updated_at": firestore.SERVER_TIMESTAMP}
@@ -0,0 +1,125 @@
+import os
+import socket
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from google.cloud import firestore
+
+# 每次从数据库租用的订单号数量
+ORDER_ID_BLOCK_SIZE = 100
+# 订单号为 10 位数字，左侧补零
+ORDER_ID_WIDTH = 10
+
+
+def format_order_id(value: int) -> str:
+    return str(value).zfill(ORDER_ID_WIDTH)
+
+
+class OrderIdAllocator:
+    """
+    按块租用的订单号生成器。
+
+    每次通过一个事务将 `system/order_id_generator` 的 `last_order_id` 前移
+    `block_size`，并在其 `leases` 子集合中登记租约，之后在本进程内依次分配，
+    不再争用同一个文档。进程退出时未用完的订单号会留下空号，可用
+    `audit_order_id_gaps` 核对。
+    """
+
+    def __init__(self, db, block_size: int = ORDER_ID_BLOCK_SIZE):
+        self.db = db
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 1
+        self._end = 0
+
+    def _lease_block(self) -> Tuple[int, int]:
+        doc_ref = self.db.collection("system").document("order_id_generator")
+        block_size = self.block_size
+
+        @firestore.transactional
+        def lease(transaction):
+            doc = doc_ref.get(transaction=transaction)
+            last_order_id = int(doc.get("last_order_id")) if doc.exists else 0
+            start, end = last_order_id + 1, last_order_id + block_size
+            transaction.set(
+                doc_ref, {"last_order_id": format_order_id(end)}, merge=True
+            )
+            transaction.set(
+                doc_ref.collection("leases").document(format_order_id(start)),
+                {
+                    "start": start,
+                    "end": end,
+                    "leased_at": datetime.now(timezone.utc),
+                    "host": socket.gethostname(),
+                    "pid": os.getpid(),
+                },
+            )
+            return start, end
+
+        return lease(self.db.transaction())
+
+    def next_id(self) -> str:
+        """返回一个新的订单号，当前块用完时租用下一块。"""
+        with self._lock:
+            if self._next > self._end:
+                self._next, self._end = self._lease_block()
+            value = self._next
+            self._next += 1
+        return format_order_id(value)
+
+
+_allocators: Dict[int, OrderIdAllocator] = {}
+_allocators_lock = threading.Lock()
+
+
+def get_order_id_allocator(db) -> OrderIdAllocator:
+    """返回与 Firestore 客户端对应的进程级订单号生成器。"""
+    with _allocators_lock:
+        allocator = _allocators.get(id(db))
+        if allocator is None:
+            allocator = OrderIdAllocator(db)
+            _allocators[id(db)] = allocator
+        return allocator
+
+
+def _to_ranges(values: List[int]) -> str:
+    """将有序整数列表压缩为区间字符串，例如 `101-120, 125`。"""
+    ranges = []
+    for value in values:
+        if ranges and value == ranges[-1][1] + 1:
+            ranges[-1][1] = value
+        else:
+            ranges.append([value, value])
+    return ", ".join(f"{a}-{b}" if a != b else f"{a}" for a, b in ranges)
+
+
+def audit_order_id_gaps(db) -> List[dict]:
+    """
+    核对各租约中已使用与未使用的订单号。
+
+    Returns:
+        List[dict]: 每个租约一行，包含起止号、租用时间、进程、已用数量及空号区间。
+    """
+    used = set()
+    for doc in db.collection("payments").select(["phone_number"]).stream():
+        if doc.id.isdigit():
+            used.add(int(doc.id))
+
+    generator_ref = db.collection("system").document("order_id_generator")
+    rows = []
+    for doc in generator_ref.collection("leases").order_by("start").stream():
+        lease = doc.to_dict()
+        ids = range(lease["start"], lease["end"] + 1)
+        unused = [i for i in ids if i not in used]
+        rows.append(
+            {
+                "start": format_order_id(lease["start"]),
+                "end": format_order_id(lease["end"]),
+                "leased_at": lease["leased_at"],
+                "process": f"{lease.get('host', '')}:{lease.get('pid', '')}",
+                "used": len(ids) - len(unused),
+                "gaps": _to_ranges(unused),
+            }
+        )
+    return rows
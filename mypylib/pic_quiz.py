@@ -0,0 +1,84 @@
+import json
+import random
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+CURRENT_CWD: Path = Path(__file__).parent.parent
+PIC_QA_FP = CURRENT_CWD / "resource" / "quiz" / "quiz_image_qa.json"
+
+
+class PicQuizIndex:
+    """
+    看图猜词题库。
+
+    题目按 (类别, 级别) 排序后保存，每个类别及每个 (类别, 级别) 对应一段连续的
+    下标范围，抽题时只在范围内抽样，耗时与抽取的题目数量成正比。题目在进程内
+    共享且不可修改，抽题时为每道题生成新的字典及打乱后的选项列表。
+    """
+
+    def __init__(self, questions: List[dict]):
+        questions = sorted(questions, key=lambda q: (q["category"], q["level"]))
+        # 选项保存为元组，避免共享数据被原地修改
+        self._questions: List[dict] = [
+            {**q, "options": tuple(q["options"])} for q in questions
+        ]
+        self._categories: Dict[str, Tuple[int, int]] = {}
+        self._levels: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        for i, q in enumerate(self._questions):
+            for ranges, key in (
+                (self._categories, q["category"]),
+                (self._levels, (q["category"], q["level"])),
+            ):
+                start, _ = ranges.get(key, (i, i))
+                ranges[key] = (start, i + 1)
+
+    def __len__(self) -> int:
+        return len(self._questions)
+
+    def categories(self) -> List[str]:
+        return list(self._categories)
+
+    def levels(self, category: str) -> List[str]:
+        return [level for c, level in self._levels if c == category]
+
+    def count(self, category: str, level: Optional[str] = None) -> int:
+        start, end = self._range(category, level)
+        return end - start
+
+    def _range(self, category: str, level: Optional[str]) -> Tuple[int, int]:
+        if level is None:
+            return self._categories.get(category, (0, 0))
+        return self._levels.get((category, level), (0, 0))
+
+    def sample(
+        self,
+        category: str,
+        k: int,
+        level: Optional[str] = None,
+        rng: random.Random = None,
+    ) -> List[dict]:
+        """
+        随机抽取类别（及级别）中至多 k 道题目。
+
+        Returns:
+            List[dict]: 题目副本，`options` 为按本次抽题打乱顺序的新列表。
+        """
+        rng = rng or random
+        ids = range(*self._range(category, level))
+        result = []
+        for i in rng.sample(ids, min(k, len(ids))):
+            q = self._questions[i]
+            result.append({**q, "options": rng.sample(q["options"], len(q["options"]))})
+        return result
+
+    @classmethod
+    def load(cls, fp: Path = PIC_QA_FP) -> "PicQuizIndex":
+        with open(fp, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+
+@lru_cache(maxsize=None)
+def get_pic_quiz_index() -> PicQuizIndex:
+    """返回进程内共享的看图猜词题库。"""
+    return PicQuizIndex.load()
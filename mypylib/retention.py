@@ -0,0 +1,175 @@
+import gzip
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from google.cloud import firestore
+from google.cloud.firestore import FieldFilter
+
+logger = logging.getLogger("streamlit")
+
+CURRENT_CWD: Path = Path(__file__).parent.parent
+ARCHIVE_DIR = CURRENT_CWD / "archive"
+
+# 各集合的时间字段及默认保留天数
+RETENTION_SETTINGS: Dict[str, dict] = {
+    "login_events": {"time_field": "login_time", "days": 90},
+    "token_records": {"time_field": "used_at", "days": 180},
+}
+
+# 每次查询及删除的文档数量，单个 WriteBatch 最多 500 次写入
+ARCHIVE_PAGE_SIZE = 500
+
+
+def _to_json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _summarize(collection: str, data: dict, summary: dict):
+    """累加单个文档到当日汇总。"""
+    summary["count"] += 1
+    if collection == "token_records":
+        summary["used_token_count"] += data.get("used_token_count", 0)
+    summary["phone_numbers"].add(data.get("phone_number", ""))
+
+
+def _new_summary() -> dict:
+    return {"count": 0, "used_token_count": 0, "phone_numbers": set()}
+
+
+def _delete_chunks(records: List[tuple]):
+    """
+    将 (文档名称, 日期, 汇总字段) 记录分块，每块的删除数与涉及天数之和
+    不超过 ARCHIVE_PAGE_SIZE，使删除与当日汇总增量可以在同一个 WriteBatch 中提交。
+    """
+    chunk: List[tuple] = []
+    days = set()
+    for record in records:
+        if chunk and len(chunk) + len(days | {record[1]}) > ARCHIVE_PAGE_SIZE:
+            yield chunk
+            chunk, days = [], set()
+        chunk.append(record)
+        days.add(record[1])
+    if chunk:
+        yield chunk
+
+
+def archive_collection(
+    db,
+    collection: str,
+    days: Optional[int] = None,
+    container_client=None,
+    progress_callback=None,
+) -> dict:
+    """
+    将集合中早于保留期的文档归档为 gzip 压缩的 JSONL 文件，删除原文档并保留每日汇总。
+
+    分三步进行，确保删除前归档已完整保存：
+    1. 分页读取过期文档，写入本地归档文件并记录每日汇总所需的字段；
+    2. 若提供 `container_client`，将归档文件上传到 Azure Blob；
+    3. 按归档的文档名称分批删除，每批删除与该批文档的每日汇总增量
+       （写入 `daily_summaries`）在同一个 WriteBatch 中提交，删除的文档总会被计入汇总。
+
+    Args:
+        db: Firestore 客户端。
+        collection (str): 集合名称，须在 RETENTION_SETTINGS 中配置。
+        days (int): 保留天数，默认使用 RETENTION_SETTINGS 中的设置。
+        container_client: 可选，Azure Blob 容器客户端。
+        progress_callback (callable): 可选，参数为 (已删除数, 总数)。
+
+    Returns:
+        dict: 归档文件路径、归档文档数量及涉及的天数。
+    """
+    settings = RETENTION_SETTINGS[collection]
+    time_field = settings["time_field"]
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=days if days is not None else settings["days"])
+
+    os.makedirs(ARCHIVE_DIR / collection, exist_ok=True)
+    archive_fp = (
+        ARCHIVE_DIR
+        / collection
+        / f"{collection}_{cutoff:%Y%m%d}_{now:%Y%m%d%H%M%S}.jsonl.gz"
+    )
+    # (文档名称, 日期, 汇总所需字段)
+    records: List[tuple] = []
+
+    # 1. 归档到本地文件
+    query = (
+        db.collection(collection)
+        .where(filter=FieldFilter(time_field, "<", cutoff))
+        .order_by(time_field)
+        .limit(ARCHIVE_PAGE_SIZE)
+    )
+    with gzip.open(archive_fp, "wt", encoding="utf-8") as f:
+        last_doc = None
+        while True:
+            page_query = query.start_after(last_doc) if last_doc else query
+            docs = list(page_query.stream())
+            for doc in docs:
+                data = doc.to_dict()
+                record = {"_id": doc.id, **{k: _to_json_value(v) for k, v in data.items()}}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                day = data[time_field].astimezone(timezone.utc).strftime("%Y-%m-%d")
+                fields = {
+                    k: data[k]
+                    for k in ("used_token_count", "phone_number")
+                    if k in data
+                }
+                records.append((doc.id, day, fields))
+            if len(docs) < ARCHIVE_PAGE_SIZE:
+                break
+            last_doc = docs[-1]
+
+    if not records:
+        os.remove(archive_fp)
+        return {"archive": None, "count": 0, "days": 0}
+
+    # 2. 上传到 Azure Blob
+    archive_name = f"{collection}/{archive_fp.name}"
+    if container_client is not None:
+        with open(archive_fp, "rb") as data:
+            container_client.upload_blob(archive_name, data, overwrite=True)
+        os.remove(archive_fp)
+
+    # 3. 分批删除，同一批中写入这些文档的每日汇总增量
+    collection_ref = db.collection(collection)
+    summaries_ref = db.collection("daily_summaries")
+    deleted = 0
+    for chunk in _delete_chunks(records):
+        summaries: Dict[str, dict] = defaultdict(_new_summary)
+        batch = db.batch()
+        for name, day, data in chunk:
+            batch.delete(collection_ref.document(name))
+            _summarize(collection, data, summaries[day])
+        for day, summary in summaries.items():
+            fields = {
+                "collection": collection,
+                "date": day,
+                "count": firestore.Increment(summary["count"]),
+                # 同一天的文档可能分多批删除，用户数为各批之和，仅供参考
+                "user_count": firestore.Increment(len(summary["phone_numbers"])),
+                "archives": firestore.ArrayUnion([archive_name]),
+            }
+            if collection == "token_records":
+                fields["used_token_count"] = firestore.Increment(
+                    summary["used_token_count"]
+                )
+            batch.set(summaries_ref.document(f"{collection}_{day}"), fields, merge=True)
+        batch.commit()
+        deleted += len(chunk)
+        if progress_callback:
+            progress_callback(deleted, len(records))
+
+    logger.info(f"已归档 {collection} {len(records)} 个文档：{archive_name}")
+    return {
+        "archive": archive_name if container_client is not None else str(archive_fp),
+        "count": len(records),
+        "days": len({day for _, day, _ in records}),
+    }
@@ -0,0 +1,284 @@
+import logging
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+logger = logging.getLogger("streamlit")
+
+CURRENT_CWD: Path = Path(__file__).parent.parent
+PAGES_DIR = CURRENT_CWD / "pages"
+HOME_FP = CURRENT_CWD / "Home.py"
+
+# 统计的 GAPIC 方法
+READ_METHODS = ("batch_get_documents", "run_query", "run_aggregation_query")
+WRITE_METHODS = ("commit",)
+OTHER_METHODS = ("begin_transaction", "rollback", "list_documents")
+
+# 调用方识别时跳过的库文件路径片段
+_LIBRARY_MARKERS = ("site-packages", "dist-packages", "/google/", "/grpc/", "/lib/python")
+
+# 会话超过该秒数没有 RPC 视为已结束，其剩余的累计写入日志后移除
+SESSION_IDLE_SECONDS = 30 * 60
+
+# (页面, 调用方, 方法)
+Tag = Tuple[str, str, str]
+
+
+def _empty_counter() -> dict:
+    return {"calls": 0, "reads": 0, "writes": 0, "latency": 0.0}
+
+
+class RpcStats:
+    """
+    Firestore RPC 计数。
+
+    按 (页面, 调用方, 方法) 累计调用次数、读取文档数、写入次数及耗时。
+    进程级累计供管理页面显示；同时按 Streamlit 会话累计本次运行的数据，
+    在运行结束时写入日志。长时间没有 RPC 的会话视为已结束并移除。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[Tag, dict] = defaultdict(_empty_counter)
+        self._sessions: Dict[str, dict] = defaultdict(_empty_counter)
+        # 会话最后一次 RPC 的时间（time.monotonic）
+        self._last_seen: Dict[str, float] = {}
+
+    def record(self, tag: Tag, calls=0, reads=0, writes=0, latency=0.0):
+        session_id = _current_session_id()
+        with self._lock:
+            if session_id:
+                self._last_seen[session_id] = time.monotonic()
+            for counter in (
+                [self._totals[tag], self._sessions[session_id]]
+                if session_id
+                else [self._totals[tag]]
+            ):
+                counter["calls"] += calls
+                counter["reads"] += reads
+                counter["writes"] += writes
+                counter["latency"] += latency
+
+    def pop_session(self, session_id: str) -> Optional[dict]:
+        """取出并清零会话自上次调用以来的累计数据。"""
+        with self._lock:
+            self._last_seen.pop(session_id, None)
+            return self._sessions.pop(session_id, None)
+
+    def pop_idle_sessions(self, max_idle: float = SESSION_IDLE_SECONDS) -> Dict[str, dict]:
+        """取出超过 max_idle 秒没有 RPC 的会话的累计数据，并移除这些会话。"""
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                session_id
+                for session_id, last_seen in self._last_seen.items()
+                if now - last_seen > max_idle
+            ]
+            result = {}
+            for session_id in idle:
+                del self._last_seen[session_id]
+                counter = self._sessions.pop(session_id, None)
+                if counter is not None:
+                    result[session_id] = counter
+            return result
+
+    def rows(self) -> List[dict]:
+        """返回进程级累计数据，每个 (页面, 调用方, 方法) 一行。"""
+        with self._lock:
+            return [
+                {"page": page, "caller": caller, "method": method, **counter}
+                for (page, caller, method), counter in self._totals.items()
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+            self._sessions.clear()
+            self._last_seen.clear()
+
+
+rpc_stats = RpcStats()
+
+
+def _current_session_id() -> Optional[str]:
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+def _caller_tag() -> Tuple[str, str]:
+    """通过调用栈确定发起 RPC 的页面及函数，两者都找到后停止向上查找。"""
+    page = None
+    caller = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not any(marker in filename for marker in _LIBRARY_MARKERS) and (
+            filename != __file__
+        ):
+            path = Path(filename)
+            if caller is None:
+                # co_qualname 自 Python 3.11 起才有
+                code = frame.f_code
+                name = getattr(code, "co_qualname", code.co_name).split(".<locals>")[0]
+                # 跳过 _get_doc_dict 等内部辅助函数，记录其公开的调用方
+                if not name.rsplit(".", 1)[-1].startswith("_"):
+                    caller = name if "." in name else f"{path.stem}.{name}"
+            if path.parent == PAGES_DIR or path == HOME_FP:
+                page = path.stem
+            if page is not None and caller is not None:
+                break
+        frame = frame.f_back
+    if page is None:
+        page = f"[{threading.current_thread().name}]"
+    return page, caller or "<unknown>"
+
+
+def _request_writes(request) -> int:
+    writes = request.get("writes") if isinstance(request, dict) else request.writes
+    return len(writes or [])
+
+
+def _record(tag: Tag, **kwargs):
+    # 统计代码出错不能影响 RPC 本身
+    try:
+        rpc_stats.record(tag, **kwargs)
+    except Exception as e:
+        logger.error(f"记录 Firestore RPC 统计失败：{e}")
+
+
+def _rpc_tag(method: str) -> Tag:
+    try:
+        page, caller = _caller_tag()
+    except Exception as e:
+        logger.error(f"识别 Firestore RPC 调用方失败：{e}")
+        page, caller = "<unknown>", "<unknown>"
+    return page, caller, method
+
+
+class _CountingStream:
+    """包装流式响应，在读取过程中累计文档数及等待时间。"""
+
+    def __init__(self, stream, tag: Tag, count_item):
+        self._stream = stream
+        self._tag = tag
+        self._count_item = count_item
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self._stream)
+        except StopIteration:
+            _record(self._tag, latency=time.perf_counter() - start)
+            raise
+        latency = time.perf_counter() - start
+        try:
+            reads = self._count_item(item)
+        except Exception as e:
+            logger.error(f"统计 Firestore 流式响应失败：{e}")
+            reads = 0
+        _record(self._tag, reads=reads, latency=latency)
+        return item
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _count_batch_get(response) -> int:
+    # 不存在的文档（missing）同样按一次读取计费；只含事务 ID 的响应不计
+    return 1 if response.found or response.missing else 0
+
+
+def _count_run_query(response) -> int:
+    return 1 if response.document else 0
+
+
+def _count_aggregation(response) -> int:
+    return 1 if response.result else 0
+
+
+_STREAM_COUNTERS = {
+    "batch_get_documents": _count_batch_get,
+    "run_query": _count_run_query,
+    "run_aggregation_query": _count_aggregation,
+}
+
+
+class _InstrumentedFirestoreApi:
+    """GAPIC FirestoreClient 的代理，统计经过它的 RPC。"""
+
+    def __init__(self, api):
+        self._api = api
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if name not in READ_METHODS + WRITE_METHODS + OTHER_METHODS:
+            return attr
+
+        def wrapper(*args, **kwargs):
+            tag = _rpc_tag(name)
+            start = time.perf_counter()
+            result = attr(*args, **kwargs)
+            latency = time.perf_counter() - start
+            writes = 0
+            if name in WRITE_METHODS:
+                try:
+                    writes = _request_writes(
+                        kwargs.get("request", args[0] if args else {})
+                    )
+                except Exception as e:
+                    logger.error(f"统计 Firestore 写入次数失败：{e}")
+            _record(tag, calls=1, writes=writes, latency=latency)
+            if name in _STREAM_COUNTERS:
+                return _CountingStream(result, tag, _STREAM_COUNTERS[name])
+            return result
+
+        return wrapper
+
+
+def instrument_client(client):
+    """
+    为 Firestore 客户端安装 RPC 统计。
+
+    替换客户端内部缓存的 GAPIC 客户端（`_firestore_api_internal`），
+    因此所有经由该客户端的读写都会被统计，包括页面中直接使用 `db.collection(...)` 的调用。
+    该属性为 google-cloud-firestore 的内部实现，不存在时跳过统计并记录警告。
+    """
+    if not hasattr(client, "_firestore_api_internal"):
+        logger.warning("Firestore 客户端没有 _firestore_api_internal 属性，跳过 RPC 统计")
+        return client
+    api = client._firestore_api
+    if not isinstance(api, _InstrumentedFirestoreApi):
+        client._firestore_api_internal = _InstrumentedFirestoreApi(api)
+    return client
+
+
+def _log_counter(session_id: str, counter: Optional[dict], note: str = ""):
+    if counter and counter["calls"]:
+        logger.info(
+            f"Firestore RPC 会话 {session_id[:8]}{note}：调用 {counter['calls']} 次，"
+            f"读取 {counter['reads']} 个文档，写入 {counter['writes']} 次，"
+            f"耗时 {counter['latency'] * 1000:.0f} ms"
+        )
+
+
+def log_session_rpc_usage():
+    """
+    将当前会话尚未记录的 RPC 累计写入日志。
+
+    在页面运行结束时调用；以 st.stop、st.rerun 提前结束的运行没有执行到结尾，
+    其累计在下一次运行开始时记录。同时记录并移除长时间没有 RPC 的会话。
+    """
+    for idle_session_id, counter in rpc_stats.pop_idle_sessions().items():
+        _log_counter(idle_session_id, counter, "（已结束）")
+    session_id = _current_session_id()
+    if not session_id:
+        return
+    _log_counter(session_id, rpc_stats.pop_session(session_id))
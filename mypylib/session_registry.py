@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger("streamlit")
+
+# 监听不可用时，按租约间隔读取一次会话文档
+LEASE_INTERVAL = 60
+# 超过该时间未被查询的监听将被取消（例如浏览器直接关闭、未退出登录的会话）
+IDLE_TIMEOUT = 60 * 60
+
+
+class _Entry:
+    def __init__(self):
+        self.session_id: Optional[str] = None
+        self.refs = 0
+        self.watch = None
+        # 监听收到首个快照后才可信
+        self.listening = False
+        self.checked_at = 0.0
+        self.accessed_at = time.time()
+
+
+class SessionRegistry:
+    """
+    进程级的活动会话登记。
+
+    每个用户在 `active_sessions/{phone_number}` 文档中只保存最新登录的会话 ID，
+    新的登录覆盖该文档即可使旧会话失效。本进程对在线用户的文档建立
+    on_snapshot 监听，页面每次重新运行时只比较内存中的会话 ID，不读取数据库；
+    监听不可用时退化为按 `lease_interval` 间隔读取文档。
+    """
+
+    def __init__(self, db, lease_interval: int = LEASE_INTERVAL, use_listener=True):
+        self.db = db
+        self.lease_interval = lease_interval
+        self.use_listener = use_listener
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def _doc_ref(self, phone_number: str):
+        return self.db.collection("active_sessions").document(phone_number)
+
+    def activate(self, phone_number: str, session_id: str, batch=None):
+        """
+        将会话登记为用户的唯一活动会话，旧会话随之失效。
+
+        Args:
+            batch: 可选，传入 WriteBatch 时只加入批次，由调用方提交。
+        """
+        data = {"session_id": session_id, "login_time": datetime.now(timezone.utc)}
+        if batch is None:
+            self._doc_ref(phone_number).set(data)
+        else:
+            batch.set(self._doc_ref(phone_number), data)
+        with self._lock:
+            entry = self._entries.get(phone_number)
+            if entry is not None:
+                entry.session_id = session_id
+
+    def _on_snapshot(self, phone_number: str, docs):
+        with self._lock:
+            entry = self._entries.get(phone_number)
+            if entry is None:
+                return
+            doc = docs[0] if docs else None
+            entry.session_id = (
+                doc.to_dict().get("session_id") if doc is not None and doc.exists else None
+            )
+            entry.listening = True
+            entry.checked_at = time.time()
+
+    def watch(self, phone_number: str):
+        """开始跟踪用户的活动会话，与 `unwatch` 成对调用。"""
+        self._expire_idle()
+        with self._lock:
+            entry = self._entries.get(phone_number)
+            if entry is None:
+                entry = _Entry()
+                self._entries[phone_number] = entry
+            entry.refs += 1
+            entry.accessed_at = time.time()
+            if not self.use_listener or entry.watch is not None:
+                return
+            try:
+                entry.watch = self._doc_ref(phone_number).on_snapshot(
+                    lambda docs, changes, read_time: self._on_snapshot(
+                        phone_number, docs
+                    )
+                )
+            except Exception as e:
+                logger.error(f"监听活动会话失败，改为按租约间隔读取：{e}")
+
+    def unwatch(self, phone_number: str):
+        with self._lock:
+            entry = self._entries.get(phone_number)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs <= 0:
+                self._remove(phone_number)
+
+    def _remove(self, phone_number: str):
+        entry = self._entries.pop(phone_number)
+        if entry.watch is not None:
+            try:
+                entry.watch.unsubscribe()
+            except Exception as e:
+                logger.error(f"取消活动会话监听失败：{e}")
+
+    def _expire_idle(self):
+        now = time.time()
+        with self._lock:
+            for phone_number in [
+                p for p, e in self._entries.items() if now - e.accessed_at > IDLE_TIMEOUT
+            ]:
+                self._remove(phone_number)
+
+    def get_active_session_id(self, phone_number: str) -> Optional[str]:
+        """
+        返回用户最新登录的会话 ID；没有登记时返回 None。
+
+        监听正常时不读取数据库，否则每个租约间隔最多读取一次。
+        """
+        with self._lock:
+            entry = self._entries.get(phone_number)
+            if entry is None:
+                entry = _Entry()
+                self._entries[phone_number] = entry
+            entry.accessed_at = time.time()
+            if entry.listening or time.time() - entry.checked_at < self.lease_interval:
+                return entry.session_id
+        doc = self._doc_ref(phone_number).get()
+        session_id = doc.to_dict().get("session_id") if doc.exists else None
+        with self._lock:
+            entry.session_id = session_id
+            entry.checked_at = time.time()
+        return session_id
+
+    def is_revoked(self, phone_number: str, session_id: str) -> bool:
+        """会话是否已被同一用户更新的登录取代。"""
+        active_session_id = self.get_active_session_id(phone_number)
+        return active_session_id is not None and active_session_id != session_id
+
+
+_registries: Dict[int, SessionRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_session_registry(db) -> SessionRegistry:
+    """返回与 Firestore 客户端对应的进程级会话登记。"""
+    with _registries_lock:
+        registry = _registries.get(id(db))
+        if registry is None:
+            registry = SessionRegistry(db)
+            _registries[id(db)] = registry
+        return registry
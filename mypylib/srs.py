@@ -0,0 +1,147 @@
+import heapq
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 每个已复习单词的状态，按单词编号（WordIdRegistry）记录
+STATE_DTYPE = np.dtype(
+    [
+        ("word_id", "<i4"),
+        ("due", "<i8"),  # 下次复习时间（Unix 秒）
+        ("last", "<i8"),  # 上次复习时间（Unix 秒）
+        ("interval", "<f4"),  # 间隔天数
+        ("ease", "<f4"),  # 难度系数
+        ("reps", "<i2"),  # 连续答对次数
+        ("lapses", "<i2"),  # 遗忘次数
+    ]
+)
+
+DAY = 24 * 60 * 60
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+# 答错后 10 分钟再复习
+RELEARN_INTERVAL = 10 / (24 * 60)
+# 同一单词两次复习间隔小于该秒数时视为同一次（例如重复点击“检查”）
+MIN_REVIEW_GAP = 60
+
+
+class SrsScheduler:
+    """
+    基于 SM-2 的间隔重复调度。
+
+    状态为紧凑的结构化数组（每个单词 32 字节），另以最小堆按到期时间索引，
+    取前 k 个到期单词为 O(k log n)，不扫描整个词库。堆中过期的条目在弹出时
+    与状态数组比对后丢弃（惰性删除）。
+    """
+
+    def __init__(self, state: Optional[np.ndarray] = None):
+        state = state if state is not None else np.empty(0, dtype=STATE_DTYPE)
+        self._state = np.empty(max(len(state), 64), dtype=STATE_DTYPE)
+        self._state[: len(state)] = state
+        self._size = len(state)
+        self._rows: Dict[int, int] = {
+            int(word_id): i for i, word_id in enumerate(state["word_id"])
+        }
+        self._heap: List[Tuple[int, int]] = list(
+            zip(state["due"].tolist(), state["word_id"].tolist())
+        )
+        heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, word_id: int) -> bool:
+        return int(word_id) in self._rows
+
+    @property
+    def state(self) -> np.ndarray:
+        return self._state[: self._size]
+
+    def _row(self, word_id: int) -> int:
+        row = self._rows.get(word_id)
+        if row is None:
+            if self._size == len(self._state):
+                self._state = np.resize(self._state, len(self._state) * 2)
+            row = self._size
+            self._state[row] = (word_id, 0, 0, 0.0, INITIAL_EASE, 0, 0)
+            self._rows[word_id] = row
+            self._size += 1
+        return row
+
+    def review(self, word_id: int, correct: bool, now: Optional[float] = None) -> bool:
+        """
+        记录一次复习结果并安排下次复习。
+
+        答对按质量 4、答错按质量 1 计算（SM-2）。
+
+        Returns:
+            bool: 是否记录；与上次复习间隔过短时忽略并返回 False。
+        """
+        now = int(now if now is not None else time.time())
+        word_id = int(word_id)
+        row = self._row(word_id)
+        item = self._state[row]
+        if item["last"] and now - item["last"] < MIN_REVIEW_GAP:
+            return False
+        if correct:
+            reps = int(item["reps"]) + 1
+            if reps == 1:
+                interval = 1.0
+            elif reps == 2:
+                interval = 6.0
+            else:
+                interval = float(item["interval"]) * float(item["ease"])
+            # 质量为 4 时难度系数不变
+            ease = float(item["ease"])
+        else:
+            reps = 0
+            interval = RELEARN_INTERVAL
+            ease = max(MIN_EASE, float(item["ease"]) - 0.2)
+            item["lapses"] += 1
+        due = now + int(interval * DAY)
+        item["reps"] = reps
+        item["interval"] = interval
+        item["ease"] = ease
+        item["last"] = now
+        item["due"] = due
+        heapq.heappush(self._heap, (due, word_id))
+        return True
+
+    def due_ids(self, k: int, now: Optional[float] = None) -> List[int]:
+        """返回至多 k 个已到期单词的编号，按到期时间先后排列。"""
+        now = int(now if now is not None else time.time())
+        picked: List[Tuple[int, int]] = []
+        while self._heap and len(picked) < k:
+            due, word_id = self._heap[0]
+            if due > now:
+                break
+            heapq.heappop(self._heap)
+            row = self._rows.get(word_id)
+            # 该单词此后又被复习过，堆中条目已过期
+            if row is None or self._state[row]["due"] != due:
+                continue
+            picked.append((due, word_id))
+        # 仍然到期，放回堆中
+        for entry in picked:
+            heapq.heappush(self._heap, entry)
+        return [word_id for _, word_id in picked]
+
+    def due_count(self, now: Optional[float] = None) -> int:
+        now = int(now if now is not None else time.time())
+        return int(np.count_nonzero(self.state["due"] <= now))
+
+    def new_ids(self, candidates: np.ndarray) -> np.ndarray:
+        """返回候选编号中尚未复习过的单词。"""
+        candidates = np.asarray(candidates, dtype=np.int64)
+        return candidates[~np.isin(candidates, self.state["word_id"])]
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(self.state.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> "SrsScheduler":
+        if not data:
+            return cls()
+        return cls(np.frombuffer(zlib.decompress(data), dtype=STATE_DTYPE))
@@ -10,14 +10,20 @@ from google.cloud import firestore, translate
 from google.oauth2.service_account import Credentials
 from vertexai.preview.generative_models import GenerativeModel, Image
 
+from .async_db_interface import AsyncDbInterface, run_in_background_loop
 from .db_interface import DbInterface
-from .google_ai import select_best_images_for_word
+from .deck_prefetch import script_thread_only
+from .google_ai import rank_word_images, record_token_usage
 from .google_cloud_configuration import (
     LOCATION,
     PROJECT_ID,
     get_google_service_account_info,
     google_configure,
 )
+from .mini_dict_replica import MiniDictReplica
+from .rpc_stats import instrument_client, log_session_rpc_usage
+from .word_index import get_word_index
+from .word_search import WordSearchIndex
 from .word_utils import get_word_image_urls, load_image_bytes_from_url
 
 logger = logging.getLogger("streamlit")
@@ -40,6 +46,13 @@ def setup_logger(logger, level="INFO"):
 setup_logger(logger)
 
 
+def end_run():
+    """在页面脚本末尾调用：提交本次运行中排队的写入，并记录本次运行的 RPC 数量。"""
+    if "dbi" in st.session_state:
+        st.session_state.dbi.commit_run()
+    log_session_rpc_usage()
+
+
 def check_and_force_logout(status):
     """
     检查并强制退出用户重复登录。
@@ -51,21 +64,19 @@ def check_and_force_logout(status):
     Returns:
         None
     """
-    if "session_id" in st.session_state.dbi.cache.get("user_info", {}):
-        dbi = st.session_state.dbi
-        # 存在会话id，说明用户已经登录
-        phone_number = dbi.cache["user_info"]["phone_number"]
-        # 获取除最后一个登录事件外的所有未退出的登录事件
-        active_sessions = dbi.get_active_sessions()
-        for session in active_sessions:
-            if session["session_id"] == dbi.cache.get("user_info", {}).get(
-                "session_id", ""
-            ):
-                # 如果 st.session_state 中的会话ID在需要强制退出的列表中，处理强制退出
-                dbi.force_logout_session(phone_number, session["session_id"])
-                st.session_state.clear()
-                status.error("您的账号在其他设备上登录，您已被强制退出。")
-                st.stop()
+    # 记录上一次运行中未在结尾记录的 RPC 数量（例如以 st.stop 结束的运行）
+    log_session_rpc_usage()
+    dbi = st.session_state.dbi
+    # 开始本次运行的工作单元，同一文档在本次运行中至多读取一次
+    dbi.begin_run()
+    # 会话失效由进程级会话登记推送，稳定状态下不查询数据库
+    if dbi.is_session_revoked():
+        user_info = dbi.cache["user_info"]
+        # 当前会话已被更新的登录取代，处理强制退出
+        dbi.force_logout_session(user_info["phone_number"], user_info["session_id"])
+        st.session_state.clear()
+        status.error("您的账号在其他设备上登录，您已被强制退出。")
+        st.stop()
 
 
 @st.cache_resource
@@ -82,8 +93,52 @@ def get_firestore_client():
     service_account_info = get_google_service_account_info(st.secrets)
     # 创建凭据
     credentials = Credentials.from_service_account_info(service_account_info)
-    # 使用凭据初始化客户端
-    return firestore.Client(credentials=credentials, project=PROJECT_ID)
+    # 使用凭据初始化客户端，并统计经由该客户端的 RPC
+    return instrument_client(
+        firestore.Client(credentials=credentials, project=PROJECT_ID)
+    )
+
+
+@st.cache_resource
+def get_async_firestore_client():
+    service_account_info = get_google_service_account_info(st.secrets)
+    # 创建凭据
+    credentials = Credentials.from_service_account_info(service_account_info)
+
+    # 在后台事件循环中创建，使 gRPC 通道与该事件循环绑定
+    async def create_client():
+        return firestore.AsyncClient(credentials=credentials, project=PROJECT_ID)
+
+    return run_in_background_loop(create_client())
+
+
+def get_async_dbi() -> AsyncDbInterface:
+    """返回与当前会话 DbInterface 共享缓存的异步接口，配合 run_concurrently 使用。"""
+    adbi = st.session_state.get("async_dbi")
+    if adbi is None or adbi.dbi is not st.session_state.dbi:
+        adbi = AsyncDbInterface(get_async_firestore_client(), st.session_state.dbi)
+        st.session_state["async_dbi"] = adbi
+    return adbi
+
+
+@st.cache_resource(show_spinner="加载简版词典副本...")
+def get_mini_dict_replica():
+    # 每个进程只创建一个副本，并启动后台增量同步
+    replica = MiniDictReplica(get_firestore_client())
+    replica.start()
+    return replica
+
+
+@st.cache_resource(show_spinner="建立单词检索索引...")
+def get_word_search_index():
+    # 规范词库中的单词及简版词典副本中的译文，副本同步后增量更新
+    index = WordSearchIndex()
+    index.add_words(get_word_index().unique_words())
+    replica = get_mini_dict_replica()
+    # 先注册回调再载入现有文档，两者重叠的部分重复更新无害
+    replica.add_listener(index.update_docs)
+    index.update_docs({record.pop("word"): record for record in replica.records()})
+    return index
 
 
 @st.cache_resource
@@ -228,72 +283,105 @@ def view_stream_response(responses, placeholder):
 # region 单词
 
 
-@st.cache_resource(show_spinner="提取简版词典单词信息...", ttl=60 * 60 * 24)  # 缓存有效期为24小时
-def get_mini_dict_doc(word):
-    db = st.session_state.dbi.db
-    collection = db.collection("mini_dict")
-    w = word.replace("/", " or ")
-    # 从 Firestore 获取数据
-    doc = collection.document(w).get()
+def get_mini_dict_doc(word, dbi=None):
+    # 确保本进程的本地副本已启动，DbInterface 优先从副本读取
+    # 在后台线程中调用时须传入 dbi，不能读取 st.session_state
+    get_mini_dict_replica()
+    return (dbi or st.session_state.dbi).get_mini_dict_doc(word)
 
-    if doc.exists:
-        return doc.to_dict()
-    else:
-        return {}
 
+def get_mini_dict_docs(words, dbi=None):
+    """批量获取简版词典中单词的文档，返回以单词为键的字典。"""
+    get_mini_dict_replica()
+    return (dbi or st.session_state.dbi).get_mini_dict_docs(words)
 
-@st.cache_data(ttl=timedelta(hours=24), max_entries=10000, show_spinner="获取单词图片网址...")
-def select_word_image_urls(word: str):
+
+def fetch_and_select_image_urls(word: str, dbi):
     """
-    选择单词的图像URL列表。
+    获取单词的图像URL列表，不读写 st.session_state，可在后台预取线程中调用。
+
+    简版词典中已有 image_urls 时直接返回；否则调用 Serper 搜索图片并由 Gemini 挑选。
+    挑选结果由脚本线程通过 `select_word_image_urls` 写入数据库并记录令牌用量。
 
     参数：
     - word：要选择图像URL的单词（字符串类型）
+    - dbi：DbInterface
 
     返回值：
-    - urls：选择的图像URL列表（列表类型）
+    - (urls, token_usage)：token_usage 为挑选图片消耗的令牌数；已有网址时为 None
     """
+    urls = get_mini_dict_doc(word, dbi).get("image_urls", [])
+    if len(urls) > 0:
+        return urls, None
 
-    # 查找 image_urls
-    urls = get_mini_dict_doc(word).get("image_urls", [])
     model = load_vertex_model("gemini-pro-vision")
-    if len(urls) == 0:
-        images = []
-        full_urls = get_word_image_urls(word, st.secrets["SERPER_KEY"])
-        for i, url in enumerate(full_urls):
-            try:
-                image_bytes = load_image_bytes_from_url(url)
-                images.append(Image.from_bytes(image_bytes))
-            except Exception as e:
-                logger.error(f"加载单词{word}第{i+1}张图片时出错:{str(e)}")
-                continue
-
-        for _ in range(3):
-            # 生成 image_indices
-            image_indices = select_best_images_for_word(model, word, images)
-
-            # 检查 indices 是否为列表
-            if not isinstance(image_indices, list):
-                msg = f"{word} 序号必须是一个列表，但是得到的类型是 {type(image_indices)}"
-                logger.error(msg)
-                continue  # 如果检查不合格，跳过当前循环，重新获取
-
-            # 检查列表中的每个元素是否都是整数且小于 full_urls 的长度
-            if not all(
-                isinstance(i, int) and i < len(full_urls) for i in image_indices
-            ):
-                msg = f"{word} 序号列表中的每个元素都必须是整数且小于 full_urls 的长度，但是得到的类型是 {[type(i) for i in image_indices]} 或序号超过了 full_urls 的长度"
-                logger.error(msg)
-                continue  # 如果检查不合格，跳过当前循环，重新获取
-
-            break  # 如果所有检查都合格，跳出循环
-
-        else:  # 如果循环结束后还没有跳出，说明三次尝试都失败了
-            raise TypeError("三次尝试获取图像序号都失败了")
-
-        urls = [full_urls[i] for i in image_indices]
-        st.session_state.dbi.update_image_urls(word, urls)
+    images = []
+    full_urls = get_word_image_urls(word, st.secrets["SERPER_KEY"])
+    for i, url in enumerate(full_urls):
+        try:
+            image_bytes = load_image_bytes_from_url(url)
+            images.append(Image.from_bytes(image_bytes))
+        except Exception as e:
+            logger.error(f"加载单词{word}第{i+1}张图片时出错:{str(e)}")
+            continue
+
+    token_usage = 0
+    for _ in range(3):
+        # 生成 image_indices
+        image_indices, total_tokens = rank_word_images(model, word, images)
+        token_usage += total_tokens
+
+        # 检查 indices 是否为列表
+        if not isinstance(image_indices, list):
+            msg = f"{word} 序号必须是一个列表，但是得到的类型是 {type(image_indices)}"
+            logger.error(msg)
+            continue  # 如果检查不合格，跳过当前循环，重新获取
+
+        # 检查列表中的每个元素是否都是整数且小于 full_urls 的长度
+        if not all(isinstance(i, int) and i < len(full_urls) for i in image_indices):
+            msg = f"{word} 序号列表中的每个元素都必须是整数且小于 full_urls 的长度，但是得到的类型是 {[type(i) for i in image_indices]} 或序号超过了 full_urls 的长度"
+            logger.error(msg)
+            continue  # 如果检查不合格，跳过当前循环，重新获取
+
+        break  # 如果所有检查都合格，跳出循环
+
+    else:  # 如果循环结束后还没有跳出，说明三次尝试都失败了
+        raise TypeError("三次尝试获取图像序号都失败了")
+
+    return [full_urls[i] for i in image_indices], token_usage
+
+
+def prefetch_word_image_urls(word: str, dbi, results: dict):
+    """后台预取任务：挑选图片网址，结果存入 results，由脚本线程取用。"""
+    if word not in results:
+        results[word] = fetch_and_select_image_urls(word, dbi)
 
+
+# 记录令牌用量并写入 st.session_state.dbi，只能在脚本线程中调用
+@script_thread_only
+@st.cache_data(ttl=timedelta(hours=24), max_entries=10000, show_spinner="获取单词图片网址...")
+def select_word_image_urls(word: str, _prefetched: dict = None):
+    """
+    选择单词的图像URL列表。
+
+    参数：
+    - word：要选择图像URL的单词（字符串类型）
+    - _prefetched：可选，`prefetch_word_image_urls` 的结果字典，已预取的单词不再重新挑选
+
+    返回值：
+    - urls：选择的图像URL列表（列表类型）
+    """
+    result = _prefetched.pop(word, None) if _prefetched is not None else None
+    if result is None:
+        result = fetch_and_select_image_urls(word, st.session_state.dbi)
+    urls, token_usage = result
+    if token_usage is not None:
+        record_token_usage("挑选图片", token_usage)
+        # 在运行结束时与本次运行的其他写入一并提交
+        st.session_state.dbi.update_image_urls(word, urls, deferred=True)
+        get_mini_dict_replica().apply_local_write(
+            word.replace("/", " or "), {"image_urls": urls}
+        )
     return urls
 
 
@@ -0,0 +1,154 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import pytz
+from google.cloud import firestore
+
+# 按北京时间划分日、月
+ROLLUP_TIMEZONE = pytz.timezone("Asia/Shanghai")
+ROLLUPS_COLLECTION = "token_usage_rollups"
+# 汇总周期及日期格式
+PERIOD_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+
+
+def rollup_doc_id(period: str, date: str, phone_number: Optional[str] = None) -> str:
+    """汇总文档名称：用户汇总为 `user_{手机号码}_{周期}_{日期}`，全站汇总为 `all_{周期}_{日期}`。"""
+    scope = f"user_{phone_number}" if phone_number else "all"
+    return f"{scope}_{period}_{date}"
+
+
+def _new_rollup() -> dict:
+    return {"total_tokens": 0, "record_count": 0, "by_type": defaultdict(int)}
+
+
+def aggregate_token_records(records: Iterable[dict]) -> Dict[str, dict]:
+    """
+    将令牌使用记录汇总到各汇总文档。
+
+    每条记录计入用户与全站的日、月汇总，共四个文档。
+
+    Args:
+        records: 含 phone_number、token_type、used_token_count、used_at 的字典。
+
+    Returns:
+        Dict[str, dict]: 以汇总文档名称为键，值包含文档的标识字段及累计值。
+    """
+    rollups: Dict[str, dict] = {}
+    for record in records:
+        used_at = record["used_at"].astimezone(ROLLUP_TIMEZONE)
+        for period, fmt in PERIOD_FORMATS.items():
+            date = used_at.strftime(fmt)
+            for phone_number in (record["phone_number"], None):
+                doc_id = rollup_doc_id(period, date, phone_number)
+                if doc_id not in rollups:
+                    rollups[doc_id] = {
+                        "scope": "user" if phone_number else "all",
+                        "phone_number": phone_number or "",
+                        "period": period,
+                        "date": date,
+                        **_new_rollup(),
+                    }
+                rollup = rollups[doc_id]
+                rollup["total_tokens"] += record["used_token_count"]
+                rollup["record_count"] += 1
+                rollup["by_type"][record["token_type"]] += record["used_token_count"]
+    return rollups
+
+
+def increment_fields(rollup: dict) -> dict:
+    """将汇总值转换为以 Increment 累加的写入字段，配合 `set(..., merge=True)` 使用。"""
+    return {
+        "scope": rollup["scope"],
+        "phone_number": rollup["phone_number"],
+        "period": rollup["period"],
+        "date": rollup["date"],
+        "total_tokens": firestore.Increment(rollup["total_tokens"]),
+        "record_count": firestore.Increment(rollup["record_count"]),
+        "by_type": {
+            token_type: firestore.Increment(count)
+            for token_type, count in rollup["by_type"].items()
+        },
+    }
+
+
+def recent_dates(period: str, count: int, now: Optional[datetime] = None) -> List[str]:
+    """返回截至今天（本月）的最近 count 个日期，按时间先后排列。"""
+    now = (now or datetime.now(ROLLUP_TIMEZONE)).astimezone(ROLLUP_TIMEZONE)
+    if period == "day":
+        return [
+            (now - timedelta(days=i)).strftime(PERIOD_FORMATS["day"])
+            for i in reversed(range(count))
+        ]
+    dates = []
+    year, month = now.year, now.month
+    for _ in range(count):
+        dates.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return list(reversed(dates))
+
+
+def get_token_usage(
+    db, period: str, count: int, phone_number: Optional[str] = None
+) -> List[dict]:
+    """
+    读取最近 count 个周期的令牌用量汇总。
+
+    汇总文档名称可由日期直接得出，用一次 get_all 读取，不需要查询及索引。
+
+    Returns:
+        List[dict]: 按日期排列，每项包含 date、total_tokens、record_count、by_type。
+    """
+    dates = recent_dates(period, count)
+    collection = db.collection(ROLLUPS_COLLECTION)
+    refs = [collection.document(rollup_doc_id(period, d, phone_number)) for d in dates]
+    found = {doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists}
+    rows = []
+    for date, ref in zip(dates, refs):
+        data = found.get(ref.id, {})
+        rows.append(
+            {
+                "date": date,
+                "total_tokens": data.get("total_tokens", 0),
+                "record_count": data.get("record_count", 0),
+                "by_type": data.get("by_type", {}),
+            }
+        )
+    return rows
+
+
+def backfill_token_rollups(db, progress_callback=None) -> int:
+    """
+    根据 `token_records` 重新计算所有汇总文档。
+
+    汇总文档被整体覆盖，应在写入较少时运行。已归档（见 retention）的记录不在
+    `token_records` 中，没有剩余记录的周期保持原值；跨越归档截止时间的那一天会被
+    覆盖为剩余记录的汇总。
+
+    Args:
+        progress_callback (callable): 可选，参数为 (已写入数, 总数)。
+
+    Returns:
+        int: 写入的汇总文档数量。
+    """
+    records = (
+        doc.to_dict()
+        for doc in db.collection("token_records")
+        .select(["phone_number", "token_type", "used_token_count", "used_at"])
+        .stream()
+    )
+    rollups = aggregate_token_records(records)
+    collection = db.collection(ROLLUPS_COLLECTION)
+    doc_ids = list(rollups)
+    for i in range(0, len(doc_ids), 500):
+        batch = db.batch()
+        for doc_id in doc_ids[i : i + 500]:
+            rollup = rollups[doc_id]
+            batch.set(
+                collection.document(doc_id),
+                {**rollup, "by_type": dict(rollup["by_type"])},
+            )
+        batch.commit()
+        if progress_callback:
+            progress_callback(min(i + 500, len(doc_ids)), len(doc_ids))
+    return len(doc_ids)
@@ -0,0 +1,124 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List
+
+from google.cloud import firestore
+
+from .db_cache import document_cache
+from .db_model import TokenUsageRecord
+from .token_rollups import ROLLUPS_COLLECTION, aggregate_token_records, increment_fields
+
+logger = logging.getLogger("streamlit")
+
+# 队列中的记录数达到 FLUSH_SIZE 或距上次写入超过 FLUSH_INTERVAL 秒时写入数据库
+FLUSH_SIZE = 50
+FLUSH_INTERVAL = 5
+# 单个 WriteBatch 最多 500 次写入。每条记录最多另需用户 total_tokens 及
+# 用户日、月汇总三次写入，另有全站汇总（跨日时最多四个文档）
+RECORDS_PER_BATCH = 120
+
+
+class TokenRecordWriter:
+    """
+    令牌使用记录的后台批量写入器。
+
+    `add` 只将记录放入队列并立即返回，后台线程按数量或时间间隔将记录
+    以 WriteBatch 写入 `token_records` 集合，同一批次内每个用户的
+    `total_tokens` 累加合并为一次写入，并以增量更新用户及全站的日、月用量汇总
+    （见 `token_rollups`）。进程退出时写入剩余记录。
+    """
+
+    def __init__(
+        self,
+        db,
+        flush_size: int = FLUSH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.db = db
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._queue: List[TokenUsageRecord] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="token-record-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def add(self, record: TokenUsageRecord):
+        with self._cond:
+            self._queue.append(record)
+            if len(self._queue) >= self.flush_size:
+                self._cond.notify()
+
+    def pending(self) -> int:
+        """返回尚未写入数据库的记录数。"""
+        with self._cond:
+            return len(self._queue)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"写入令牌使用记录失败：{e}")
+
+    def _commit_chunk(self, records: List[TokenUsageRecord]):
+        batch = self.db.batch()
+        token_records_ref = self.db.collection("token_records")
+        for record in records:
+            batch.set(token_records_ref.document(), record.model_dump())
+        increments: Dict[str, int] = Counter()
+        for record in records:
+            increments[record.phone_number] += record.used_token_count
+        users_ref = self.db.collection("users")
+        for phone_number, count in increments.items():
+            batch.set(
+                users_ref.document(phone_number),
+                {"total_tokens": firestore.Increment(count)},
+                merge=True,
+            )
+        rollups = aggregate_token_records(record.model_dump() for record in records)
+        rollups_ref = self.db.collection(ROLLUPS_COLLECTION)
+        for doc_id, rollup in rollups.items():
+            batch.set(rollups_ref.document(doc_id), increment_fields(rollup), merge=True)
+        batch.commit()
+        document_cache.invalidate_many("users", increments.keys())
+
+    def flush(self):
+        """将队列中的全部记录写入数据库。写入失败的记录重新放回队列。"""
+        with self._flush_lock:
+            with self._cond:
+                records, self._queue = self._queue, []
+            if not records:
+                return
+            failed = []
+            for i in range(0, len(records), RECORDS_PER_BATCH):
+                chunk = records[i : i + RECORDS_PER_BATCH]
+                try:
+                    self._commit_chunk(chunk)
+                except Exception as e:
+                    logger.error(f"批量写入 {len(chunk)} 条令牌使用记录失败：{e}")
+                    failed.extend(chunk)
+            if failed:
+                with self._cond:
+                    self._queue[:0] = failed
+
+
+_writers: Dict[int, TokenRecordWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_token_writer(db) -> TokenRecordWriter:
+    """返回与 Firestore 客户端对应的进程级写入器。"""
+    with _writers_lock:
+        writer = _writers.get(id(db))
+        if writer is None:
+            writer = TokenRecordWriter(db)
+            _writers[id(db)] = writer
+        return writer
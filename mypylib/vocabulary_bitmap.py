@@ -0,0 +1,210 @@
+import json
+import os
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+CURRENT_CWD: Path = Path(__file__).parent.parent
+WORD_LISTS_FP = CURRENT_CWD / "resource" / "dictionary" / "word_lists_by_edition_grade.json"
+# 单词编号登记表：列表下标即单词编号。只允许在末尾追加，已分配的编号永不改变
+WORD_IDS_FP = CURRENT_CWD / "resource" / "dictionary" / "word_ids.json"
+
+
+class WordIdRegistry:
+    """
+    单词与稳定编号之间的双向映射。
+
+    编号来自登记表文件，登记表由规范词库（word_lists_by_edition_grade.json）
+    生成，新增单词只追加到末尾，因此已保存的位图在词库更新后仍然有效。
+    """
+
+    def __init__(self, words: List[str]):
+        self.words = list(words)
+        self._ids: Dict[str, int] = {word: i for i, word in enumerate(self.words)}
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._ids
+
+    def id_of(self, word: str) -> Optional[int]:
+        return self._ids.get(word)
+
+    def split(self, words: Iterable[str]) -> Tuple[np.ndarray, List[str]]:
+        """
+        将单词拆分为已登记单词的编号数组与未登记单词列表。
+
+        Returns:
+            Tuple[np.ndarray, List[str]]: (编号数组, 未登记单词列表)。
+        """
+        ids, unknown = [], []
+        for word in words:
+            word_id = self._ids.get(word)
+            if word_id is None:
+                unknown.append(word)
+            else:
+                ids.append(word_id)
+        return np.asarray(ids, dtype=np.int64), unknown
+
+    def words_of(self, ids: Iterable[int]) -> List[str]:
+        """返回编号对应的单词，忽略超出登记表范围的编号。"""
+        n = len(self.words)
+        return [self.words[i] for i in ids if i < n]
+
+    @classmethod
+    def load(cls, fp: Path = WORD_IDS_FP) -> "WordIdRegistry":
+        with open(fp, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+
+def update_word_ids_file(
+    word_lists_fp: Path = WORD_LISTS_FP, word_ids_fp: Path = WORD_IDS_FP
+) -> int:
+    """
+    将规范词库中尚未登记的单词按字母顺序追加到登记表末尾。
+
+    Returns:
+        int: 新登记的单词数量。
+    """
+    words = []
+    if os.path.exists(word_ids_fp):
+        with open(word_ids_fp, "r", encoding="utf-8") as f:
+            words = json.load(f)
+    with open(word_lists_fp, "r", encoding="utf-8") as f:
+        word_lists = json.load(f)
+    known = set(words)
+    new_words = sorted({w for ws in word_lists.values() for w in ws} - known)
+    if new_words:
+        with open(word_ids_fp, "w", encoding="utf-8") as f:
+            json.dump(words + new_words, f, ensure_ascii=False, indent=0)
+    return len(new_words)
+
+
+@lru_cache(maxsize=None)
+def get_word_id_registry() -> WordIdRegistry:
+    """返回进程内共享的单词编号登记表。"""
+    return WordIdRegistry.load()
+
+
+class VocabularyBitmap:
+    """
+    以单词编号为下标的位图。
+
+    成员判断为 O(1)，并集、差集等运算由 numpy 按数组整体完成。
+    序列化时按位打包后以 zlib 压缩，个人词库通常是若干连续或稀疏的编号，
+    压缩后只有几 KB，远小于等价的字符串数组。
+    """
+
+    def __init__(self, bits: np.ndarray):
+        self.bits = bits
+
+    @classmethod
+    def empty(cls, size: int) -> "VocabularyBitmap":
+        return cls(np.zeros(size, dtype=bool))
+
+    @classmethod
+    def from_ids(cls, ids: np.ndarray, size: int) -> "VocabularyBitmap":
+        bitmap = cls.empty(size)
+        bitmap.add(ids)
+        return bitmap
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes], size: int) -> "VocabularyBitmap":
+        """
+        从压缩数据恢复位图。
+
+        数据可能由登记表更长或更短的进程写入：较短时补零，较长时保留多出的位，
+        以免写回时丢失本进程尚不认识的单词。
+        """
+        if not data:
+            return cls.empty(size)
+        packed = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+        bits = np.unpackbits(packed).astype(bool)
+        if len(bits) < size:
+            bits = np.concatenate([bits, np.zeros(size - len(bits), dtype=bool)])
+        return cls(bits)
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(np.packbits(self.bits).tobytes(), 9)
+
+    def _grow(self, size: int):
+        if size > len(self.bits):
+            self.bits = np.concatenate(
+                [self.bits, np.zeros(size - len(self.bits), dtype=bool)]
+            )
+
+    def __contains__(self, word_id: int) -> bool:
+        return 0 <= word_id < len(self.bits) and bool(self.bits[word_id])
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.bits))
+
+    def add(self, ids: np.ndarray):
+        if len(ids):
+            self._grow(int(ids.max()) + 1)
+            self.bits[ids] = True
+
+    def discard(self, ids: np.ndarray):
+        ids = ids[ids < len(self.bits)]
+        self.bits[ids] = False
+
+    def ids(self) -> np.ndarray:
+        return np.flatnonzero(self.bits)
+
+    def _aligned(self, other: "VocabularyBitmap") -> Tuple[np.ndarray, np.ndarray]:
+        size = max(len(self.bits), len(other.bits))
+        a, b = VocabularyBitmap(self.bits.copy()), VocabularyBitmap(other.bits.copy())
+        a._grow(size)
+        b._grow(size)
+        return a.bits, b.bits
+
+    def __or__(self, other: "VocabularyBitmap") -> "VocabularyBitmap":
+        a, b = self._aligned(other)
+        return VocabularyBitmap(a | b)
+
+    def __and__(self, other: "VocabularyBitmap") -> "VocabularyBitmap":
+        a, b = self._aligned(other)
+        return VocabularyBitmap(a & b)
+
+    def __sub__(self, other: "VocabularyBitmap") -> "VocabularyBitmap":
+        a, b = self._aligned(other)
+        return VocabularyBitmap(a & ~b)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, VocabularyBitmap):
+            return NotImplemented
+        a, b = self._aligned(other)
+        return bool(np.array_equal(a, b))
+
+
+def encode_vocabulary(words: Iterable[str], registry: WordIdRegistry) -> dict:
+    """
+    将单词集合编码为用户文档中的位图字段。
+
+    未登记的单词（例如登记表更新前添加的单词）保存在 `vocabulary_overflow` 数组中。
+    """
+    ids, unknown = registry.split(words)
+    bitmap = VocabularyBitmap.from_ids(ids, len(registry))
+    return {
+        "vocabulary_bitmap": bitmap.to_bytes(),
+        "vocabulary_overflow": sorted(set(unknown)),
+    }
+
+
+def decode_vocabulary(user_data: dict, registry: WordIdRegistry) -> List[str]:
+    """从用户文档的位图字段解码单词列表。"""
+    bitmap = VocabularyBitmap.from_bytes(
+        user_data.get("vocabulary_bitmap"), len(registry)
+    )
+    return registry.words_of(bitmap.ids()) + list(
+        user_data.get("vocabulary_overflow", [])
+    )
+
+
+def is_bitmap_vocabulary(user_data: dict) -> bool:
+    """用户文档是否以位图方式存储个人词库。"""
+    return user_data.get("vocabulary_bitmap") is not None
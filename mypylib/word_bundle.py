@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger("streamlit")
+
+CURRENT_CWD: Path = Path(__file__).parent.parent
+# 由 `words` 集合导出的离线词典包，随部署发布
+WORD_BUNDLE_FP = CURRENT_CWD / "resource" / "dictionary" / "words_bundle.sqlite"
+
+# 离线包格式版本，格式变化时递增，旧版本的离线包不再使用
+BUNDLE_FORMAT = 1
+# 导出时每个事务写入的文档数量
+EXPORT_CHUNK_SIZE = 1000
+
+
+def _to_json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"无法序列化 {type(value)}")
+
+
+def encode_doc(data: dict) -> bytes:
+    return zlib.compress(
+        json.dumps(
+            data, ensure_ascii=False, separators=(",", ":"), default=_to_json_value
+        ).encode("utf-8")
+    )
+
+
+def decode_doc(blob: bytes) -> dict:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class WordBundle:
+    """
+    离线词典包的只读访问。
+
+    离线包为 SQLite 文件，`words` 表以文档名称为主键，每个文档单独以 zlib
+    压缩保存，查询时只解压命中的一条；`meta` 表记录格式版本、导出时间及文档数量。
+    连接以只读方式打开并在各会话线程间共享，所有查询在锁内完成。
+    """
+
+    def __init__(self, fp: Path):
+        self.fp = fp
+        self._conn = sqlite3.connect(
+            f"file:{fp}?mode=ro", uri=True, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        self.format = int(meta.get("format", 0))
+        self.version: str = meta.get("version", "")
+        self.count = int(meta.get("count", 0))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, doc_name: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM words WHERE doc_name = ?", (doc_name,)
+            ).fetchone()
+        return row is not None
+
+    def get(self, doc_name: str) -> Optional[dict]:
+        """返回文档字典；离线包中不存在时返回 None。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM words WHERE doc_name = ?", (doc_name,)
+            ).fetchone()
+        return decode_doc(row[0]) if row is not None else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @classmethod
+    def open(cls, fp: Path = WORD_BUNDLE_FP) -> Optional["WordBundle"]:
+        """
+        打开离线包。
+
+        Returns:
+            WordBundle or None: 文件不存在、无法读取或格式版本不符时返回 None。
+        """
+        if not os.path.exists(fp):
+            return None
+        try:
+            bundle = cls(fp)
+        except sqlite3.Error as e:
+            logger.warning(f"读取离线词典包 {fp} 失败：{e}")
+            return None
+        if bundle.format != BUNDLE_FORMAT:
+            logger.warning(f"离线词典包 {fp} 格式版本为 {bundle.format}，已忽略")
+            bundle.close()
+            return None
+        return bundle
+
+
+def export_words_bundle(
+    db, fp: Path = WORD_BUNDLE_FP, progress_callback=None
+) -> dict:
+    """
+    将 `words` 集合导出为离线词典包。
+
+    先写入临时文件，完成后再替换原文件，正在读取旧文件的进程不受影响。
+
+    Args:
+        db: Firestore 客户端。
+        fp (Path): 离线包路径。
+        progress_callback (callable): 可选，参数为 (已导出数, 总数)。
+
+    Returns:
+        dict: 离线包的版本（导出时间）及文档数量。
+    """
+    collection = db.collection("words")
+    total = collection.count().get()[0][0].value
+    version = datetime.now(timezone.utc).isoformat()
+    tmp_fp = f"{fp}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_fp):
+        os.remove(tmp_fp)
+    conn = sqlite3.connect(tmp_fp)
+    try:
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(
+            "CREATE TABLE words (doc_name TEXT PRIMARY KEY, data BLOB NOT NULL)"
+        )
+        count = 0
+        rows = []
+        for doc in collection.stream():
+            rows.append((doc.id, encode_doc(doc.to_dict())))
+            if len(rows) == EXPORT_CHUNK_SIZE:
+                conn.executemany("INSERT INTO words VALUES (?, ?)", rows)
+                conn.commit()
+                count += len(rows)
+                rows = []
+                if progress_callback:
+                    progress_callback(count, max(total, count))
+        conn.executemany("INSERT INTO words VALUES (?, ?)", rows)
+        count += len(rows)
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [("format", str(BUNDLE_FORMAT)), ("version", version), ("count", str(count))],
+        )
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_fp, fp)
+    if progress_callback:
+        progress_callback(count, count)
+    logger.info(f"已导出离线词典包：{fp}，文档数：{count}")
+    return {"version": version, "count": count}
+
+
+@lru_cache(maxsize=None)
+def get_word_bundle() -> Optional[WordBundle]:
+    """返回进程内共享的离线词典包，未部署离线包时返回 None。"""
+    return WordBundle.open()
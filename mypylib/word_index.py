@@ -0,0 +1,331 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .vocabulary_bitmap import WORD_LISTS_FP, WordIdRegistry, get_word_id_registry
+
+logger = logging.getLogger("streamlit")
+
+CURRENT_CWD: Path = Path(__file__).parent.parent
+# 由规范词库编译的索引文件，规范词库变化（SHA-256 不同）时重新编译
+WORD_INDEX_FP = CURRENT_CWD / "resource" / "dictionary" / "word_index.npz"
+
+CEFR_LEVELS = ["A1", "A2", "B1", "B2", "C1", "C2"]
+# 规范词库中 CEFR 分级词表的名称前缀，例如 "1-CEFR-A1"
+CEFR_LIST_PREFIX = "1-CEFR-"
+
+
+def _file_sha256(fp: Path) -> str:
+    with open(fp, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _encode_strings(strings: List[str]) -> np.ndarray:
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_strings(data: np.ndarray) -> List[str]:
+    text = data.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+class WordIndex:
+    """
+    规范词库（word_lists_by_edition_grade.json）的内存索引。
+
+    单词编号与个人词库位图使用的 WordIdRegistry 一致。词表以 CSR 形式保存为
+    编号数组，另按单词编号保存最低 CEFR 等级（-1 表示不在 CEFR 词表中），
+    单个单词的查询为 O(1)，批量查询由 numpy 按数组完成。
+    """
+
+    def __init__(
+        self,
+        words: List[str],
+        list_names: List[str],
+        list_indptr: np.ndarray,
+        list_ids: np.ndarray,
+        lowest_levels: np.ndarray,
+    ):
+        self.words = words
+        self.list_names = list_names
+        self._ids: Dict[str, int] = {word: i for i, word in enumerate(words)}
+        self._list_pos: Dict[str, int] = {name: i for i, name in enumerate(list_names)}
+        self._list_indptr = list_indptr
+        self._list_ids = list_ids
+        self._lowest_levels = lowest_levels
+        # 反向索引：每个单词所在的词表
+        owners = np.repeat(np.arange(len(list_names)), np.diff(list_indptr))
+        order = np.argsort(list_ids, kind="stable")
+        self._word_lists = owners[order]
+        self._word_indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(list_ids, minlength=len(words)))]
+        )
+        self._word_lists_cache: Optional[Dict[str, List[str]]] = None
+        # 过滤视图：(词表名称, 排除含 "/" 的单词, 排除短语) -> 编号数组
+        self._has_slash = np.array(["/" in w for w in words], dtype=bool)
+        self._is_phrase = np.array([" " in w for w in words], dtype=bool)
+        self._views: Dict[tuple, np.ndarray] = {}
+        self._views_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._ids
+
+    # region 单词
+
+    def id_of(self, word: str) -> Optional[int]:
+        return self._ids.get(word)
+
+    def ids_of(self, words: Iterable[str]) -> np.ndarray:
+        """批量返回单词编号，不在词库中的单词为 -1。"""
+        return np.fromiter((self._ids.get(w, -1) for w in words), dtype=np.int64)
+
+    def words_of(self, ids: Iterable[int]) -> List[str]:
+        return [self.words[i] for i in ids]
+
+    def lowest_level(self, word: str) -> Optional[str]:
+        """返回单词所在 CEFR 词表的最低等级，不在 CEFR 词表中时返回 None。"""
+        word_id = self._ids.get(word)
+        if word_id is None:
+            return None
+        level = self._lowest_levels[word_id]
+        return CEFR_LEVELS[level] if level >= 0 else None
+
+    def lowest_levels(self, ids: np.ndarray) -> np.ndarray:
+        """批量返回最低 CEFR 等级的序号（0 为 A1），未分级或编号为 -1 时为 -1。"""
+        ids = np.asarray(ids, dtype=np.int64)
+        levels = np.full(len(ids), -1, dtype=np.int8)
+        known = ids >= 0
+        levels[known] = self._lowest_levels[ids[known]]
+        return levels
+
+    def lists_of(self, word: str) -> List[str]:
+        """返回包含该单词的词表名称。"""
+        word_id = self._ids.get(word)
+        if word_id is None:
+            return []
+        start, end = self._word_indptr[word_id], self._word_indptr[word_id + 1]
+        return [self.list_names[i] for i in self._word_lists[start:end]]
+
+    # endregion
+
+    # region 词表
+
+    def list_ids(self, name: str) -> np.ndarray:
+        """返回词表中单词的编号数组，保持词表原有顺序。"""
+        pos = self._list_pos[name]
+        return self._list_ids[self._list_indptr[pos] : self._list_indptr[pos + 1]]
+
+    def list_words(self, name: str) -> List[str]:
+        return self.words_of(self.list_ids(name))
+
+    def level_ids(self, level: str) -> np.ndarray:
+        """返回 CEFR 等级词表中单词的编号数组。"""
+        return self.list_ids(f"{CEFR_LIST_PREFIX}{level}")
+
+    def view(
+        self, name: str, exclude_slash: bool = False, exclude_phrases: bool = False
+    ) -> np.ndarray:
+        """
+        返回词表的过滤视图（编号数组）。
+
+        视图在进程内计算一次后共享，调用方不得修改返回的数组。
+        """
+        key = (name, exclude_slash, exclude_phrases)
+        ids = self._views.get(key)
+        if ids is not None:
+            return ids
+        ids = self.list_ids(name)
+        keep = np.ones(len(ids), dtype=bool)
+        if exclude_slash:
+            keep &= ~self._has_slash[ids]
+        if exclude_phrases:
+            keep &= ~self._is_phrase[ids]
+        ids = ids if keep.all() else ids[keep]
+        ids.flags.writeable = False
+        with self._views_lock:
+            return self._views.setdefault(key, ids)
+
+    def in_list(self, ids: np.ndarray, name: str) -> np.ndarray:
+        """批量判断单词编号是否在词表中。"""
+        return np.isin(np.asarray(ids, dtype=np.int64), self.list_ids(name))
+
+    def word_lists(self) -> Dict[str, List[str]]:
+        """
+        以词表名称为键的单词列表，与规范词库文件的内容相同。
+
+        列表在进程内只构建一次；返回的字典为浅拷贝，调用方不得修改其中的列表。
+        """
+        if self._word_lists_cache is None:
+            self._word_lists_cache = {
+                name: self.list_words(name) for name in self.list_names
+            }
+        return dict(self._word_lists_cache)
+
+    def unique_words(self, include_phrases: bool = True) -> List[str]:
+        """返回出现在任一词表中的单词。"""
+        ids = np.flatnonzero(np.diff(self._word_indptr) > 0)
+        words = self.words_of(ids)
+        if include_phrases:
+            return words
+        return [w for w in words if " " not in w]
+
+    # endregion
+
+    # region 编译与加载
+
+    @classmethod
+    def build(
+        cls, word_lists: Dict[str, List[str]], registry: Optional[WordIdRegistry] = None
+    ) -> "WordIndex":
+        """由词表字典构建索引，单词编号优先使用 WordIdRegistry 中的编号。"""
+        if registry is None:
+            registry = get_word_id_registry()
+        words = list(registry.words)
+        known = set(words)
+        # 尚未登记的单词按字母顺序排在后面，与 update_word_ids_file 追加的顺序一致
+        words.extend(sorted({w for ws in word_lists.values() for w in ws} - known))
+        ids = {word: i for i, word in enumerate(words)}
+
+        list_names = list(word_lists)
+        list_ids = np.fromiter(
+            (ids[w] for name in list_names for w in word_lists[name]), dtype=np.int64
+        )
+        list_indptr = np.concatenate(
+            [[0], np.cumsum([len(word_lists[name]) for name in list_names])]
+        ).astype(np.int64)
+
+        lowest_levels = np.full(len(words), -1, dtype=np.int8)
+        # 从高到低依次覆盖，最后保留最低等级
+        for level_pos in reversed(range(len(CEFR_LEVELS))):
+            name = f"{CEFR_LIST_PREFIX}{CEFR_LEVELS[level_pos]}"
+            if name in word_lists:
+                lowest_levels[[ids[w] for w in word_lists[name]]] = level_pos
+        return cls(words, list_names, list_indptr, list_ids, lowest_levels)
+
+    def save(self, fp: Path, source_sha256: str):
+        """保存为未压缩的 npz 文件，先写入临时文件再替换，避免并发读取到不完整的文件。"""
+        tmp_fp = f"{fp}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_fp,
+            source_sha256=np.array(source_sha256),
+            words=_encode_strings(self.words),
+            list_names=_encode_strings(self.list_names),
+            list_indptr=self._list_indptr,
+            list_ids=self._list_ids,
+            lowest_levels=self._lowest_levels,
+        )
+        os.replace(tmp_fp, fp)
+
+    @classmethod
+    def load(cls, fp: Path, source_sha256: Optional[str] = None) -> Optional["WordIndex"]:
+        """
+        加载编译后的索引。
+
+        Returns:
+            WordIndex or None: 文件不存在、无法读取或与 source_sha256 不符时返回 None。
+        """
+        if not os.path.exists(fp):
+            return None
+        try:
+            with np.load(fp) as data:
+                if source_sha256 and str(data["source_sha256"]) != source_sha256:
+                    return None
+                return cls(
+                    _decode_strings(data["words"]),
+                    _decode_strings(data["list_names"]),
+                    data["list_indptr"],
+                    data["list_ids"],
+                    data["lowest_levels"],
+                )
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"读取单词索引 {fp} 失败：{e}")
+            return None
+
+    # endregion
+
+
+PERSONAL_LIST_NAME = "0-个人词库"
+
+
+class SessionWordLists:
+    """
+    会话的词表视图。
+
+    基础词表直接引用进程共享的 WordIndex，会话只保存个人词库这一小块覆盖层，
+    抽样在编号数组的下标上进行，不复制词表。
+    """
+
+    def __init__(self, index: WordIndex):
+        self.index = index
+        self._personal: Optional[List[str]] = None
+
+    def set_personal(self, words: Optional[List[str]]):
+        """设置个人词库；为空时移除个人词库。"""
+        self._personal = list(words) if words else None
+
+    def names(self) -> List[str]:
+        names = list(self.index.list_names)
+        if self._personal is not None:
+            names.append(PERSONAL_LIST_NAME)
+        return sorted(names)
+
+    def __contains__(self, name: str) -> bool:
+        if name == PERSONAL_LIST_NAME:
+            return self._personal is not None
+        return name in self.index.list_names
+
+    def count(self, name: str) -> int:
+        if name == PERSONAL_LIST_NAME:
+            return len(self._personal or [])
+        return len(self.index.list_ids(name))
+
+    def words(self, name: str) -> List[str]:
+        if name == PERSONAL_LIST_NAME:
+            return list(self._personal or [])
+        return self.index.list_words(name)
+
+    def sample(self, name: str, n: int, exclude_slash: bool = False) -> List[str]:
+        """随机抽取至多 n 个单词。"""
+        if name == PERSONAL_LIST_NAME:
+            words = self._personal or []
+            if exclude_slash:
+                words = [w for w in words if "/" not in w]
+            return random.sample(words, min(n, len(words)))
+        ids = self.index.view(name, exclude_slash=exclude_slash)
+        picked = random.sample(range(len(ids)), min(n, len(ids)))
+        return self.index.words_of(ids[picked])
+
+
+def load_word_index(
+    source_fp: Path = WORD_LISTS_FP, index_fp: Path = WORD_INDEX_FP
+) -> WordIndex:
+    """加载编译后的单词索引；索引不存在或已过期时由规范词库重新编译并保存。"""
+    source_sha256 = _file_sha256(source_fp)
+    index = WordIndex.load(index_fp, source_sha256)
+    if index is not None:
+        return index
+    with open(source_fp, "r", encoding="utf-8") as f:
+        index = WordIndex.build(json.load(f))
+    try:
+        index.save(index_fp, source_sha256)
+        logger.info(f"已编译单词索引：{index_fp}")
+    except OSError as e:
+        logger.warning(f"保存单词索引 {index_fp} 失败：{e}")
+    return index
+
+
+@lru_cache(maxsize=None)
+def get_word_index() -> WordIndex:
+    """返回进程内共享的单词索引。"""
+    return load_word_index()
@@ -0,0 +1,222 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Set
+
+# 近似匹配的最大编辑距离及建立删除索引所用的前缀长度（SymSpell）
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 5
+
+_CJK_RE = re.compile(r"[㐀-鿿]")
+
+
+def contains_chinese(text: str) -> bool:
+    return bool(_CJK_RE.search(text))
+
+
+def _normalize(word: str) -> str:
+    return word.strip().lower()
+
+
+def _deletes(key: str, max_distance: int) -> Set[str]:
+    """返回删除至多 max_distance 个字符得到的所有字符串（含自身）。"""
+    result = {key}
+    for n in range(1, min(max_distance, len(key)) + 1):
+        for positions in combinations(range(len(key)), n):
+            result.add("".join(c for i, c in enumerate(key) if i not in positions))
+    return result
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Damerau-Levenshtein（相邻交换计为一次编辑）距离。
+
+    超过 max_distance 时提前结束并返回 max_distance + 1。
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if (
+                i > 1
+                and j > 1
+                and a[i - 1] == b[j - 2]
+                and a[i - 2] == b[j - 1]
+            ):
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class WordSearchIndex:
+    """
+    单词检索索引：前缀、近似（拼写错误）及中文译文反查。
+
+    - 前缀：规范化后的单词保存在有序列表中，以二分查找定位；
+    - 近似：SymSpell 删除索引，只对单词前 PREFIX_LENGTH 个字符建立删除变体，
+      候选词再以编辑距离核对；
+    - 中文：译文中每个汉字到单词的倒排索引，查询时取各汉字的交集。
+
+    单词及译文均可增量更新，供简版词典副本同步后调用。所有操作在锁内完成。
+    """
+
+    def __init__(
+        self,
+        max_edit_distance: int = MAX_EDIT_DISTANCE,
+        prefix_length: int = PREFIX_LENGTH,
+    ):
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self._lock = threading.RLock()
+        # 规范化键 -> 原始单词（大小写等可能不同）
+        self._words: Dict[str, Set[str]] = defaultdict(set)
+        self._sorted_keys: List[str] = []
+        self._deletes: Dict[str, Set[str]] = defaultdict(set)
+        self._translations: Dict[str, str] = {}
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._words)
+
+    # region 更新
+
+    def add_words(self, words: Iterable[str]):
+        with self._lock:
+            for word in words:
+                key = _normalize(word)
+                if not key:
+                    continue
+                if key not in self._words:
+                    insort(self._sorted_keys, key)
+                    for delete in _deletes(
+                        key[: self.prefix_length], self.max_edit_distance
+                    ):
+                        self._deletes[delete].add(key)
+                self._words[key].add(word)
+
+    def set_translation(self, word: str, translation: Optional[str]):
+        """设置或清除单词的中文译文，同时更新倒排索引。"""
+        with self._lock:
+            old = self._translations.pop(word, None)
+            if old:
+                for char in set(_CJK_RE.findall(old)):
+                    postings = self._postings.get(char)
+                    if postings is not None:
+                        postings.discard(word)
+            if translation:
+                self.add_words([word])
+                self._translations[word] = translation
+                for char in set(_CJK_RE.findall(translation)):
+                    self._postings[char].add(word)
+
+    def update_docs(self, docs: Dict[str, Optional[dict]]):
+        """
+        根据简版词典文档增量更新索引。
+
+        Args:
+            docs: 以文档名称（单词中的 "/" 已替换为 " or "）为键，值为文档字典。
+        """
+        for doc_name, doc in docs.items():
+            word = doc_name.replace(" or ", "/")
+            self.set_translation(word, (doc or {}).get("translation"))
+
+    # endregion
+
+    # region 查询
+
+    def prefix(self, query: str, limit: int = 20) -> List[str]:
+        key = _normalize(query)
+        if not key:
+            return []
+        with self._lock:
+            start = bisect_left(self._sorted_keys, key)
+            result = []
+            for k in self._sorted_keys[start:]:
+                if not k.startswith(key) or len(result) >= limit:
+                    break
+                result.extend(sorted(self._words[k]))
+            return result[:limit]
+
+    def fuzzy(self, query: str, limit: int = 20) -> List[tuple]:
+        """
+        返回编辑距离不超过 max_edit_distance 的单词。
+
+        Returns:
+            List[tuple]: (单词, 编辑距离)，按距离、单词长度排列。
+        """
+        key = _normalize(query)
+        if not key:
+            return []
+        with self._lock:
+            candidates: Set[str] = set()
+            for delete in _deletes(key[: self.prefix_length], self.max_edit_distance):
+                candidates.update(self._deletes.get(delete, ()))
+            scored = []
+            for candidate in candidates:
+                distance = edit_distance(key, candidate, self.max_edit_distance)
+                if distance <= self.max_edit_distance:
+                    scored.extend((w, distance) for w in self._words[candidate])
+        scored.sort(key=lambda x: (x[1], len(x[0]), x[0]))
+        return scored[:limit]
+
+    def reverse(self, query: str, limit: int = 20) -> List[str]:
+        """按中文译文反查单词：译文须包含查询中的所有汉字，包含完整查询的优先。"""
+        chars = set(_CJK_RE.findall(query))
+        if not chars:
+            return []
+        with self._lock:
+            postings = sorted(
+                (self._postings.get(c, set()) for c in chars), key=len
+            )
+            words = set(postings[0]).intersection(*postings[1:])
+            translations = {w: self._translations[w] for w in words}
+        text = "".join(_CJK_RE.findall(query))
+        return sorted(
+            words,
+            key=lambda w: (text not in translations[w], len(translations[w]), w),
+        )[:limit]
+
+    def translation_of(self, word: str) -> str:
+        with self._lock:
+            return self._translations.get(word, "")
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        """
+        综合检索：含汉字时按译文反查，否则依次返回前缀匹配及近似匹配。
+
+        Returns:
+            List[dict]: 每项包含 word、translation、match（匹配方式）。
+        """
+        results: List[dict] = []
+        seen: Set[str] = set()
+
+        def add(words, match):
+            for word in words:
+                if word not in seen and len(results) < limit:
+                    seen.add(word)
+                    results.append(
+                        {
+                            "word": word,
+                            "translation": self.translation_of(word),
+                            "match": match,
+                        }
+                    )
+
+        if contains_chinese(query):
+            add(self.reverse(query, limit), "译文")
+            return results
+        add(self.prefix(query, limit), "前缀")
+        add((w for w, _ in self.fuzzy(query, limit)), "近似")
+        return results
+
+    # endregion
@@ -5,6 +5,7 @@ import json
 import os
 import random
 import string
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
 from typing import Union
@@ -15,11 +16,17 @@ from gtts import gTTS
 from PIL import Image
 
 from .azure_speech import synthesize_speech_to_file
+from .vocabulary_bitmap import WORD_LISTS_FP
+from .word_index import CEFR_LEVELS, get_word_index
 
 CURRENT_CWD: Path = Path(__file__).parent.parent
 
 
 def get_unique_words(word_file_path: str, include_phrases: bool) -> list:
+    # 规范词库使用进程内的单词索引，无需重新解析 JSON 文件
+    if Path(word_file_path).resolve() == WORD_LISTS_FP.resolve():
+        return get_word_index().unique_words(include_phrases)
+
     # 加载 JSON 文件
     with open(word_file_path, "r", encoding="utf-8") as f:
         data = json.load(f)
@@ -69,10 +76,16 @@ def hash_word(word: str):
     return hash_value
 
 
+@lru_cache(maxsize=None)
+def _load_word_cefr_map(fp: str) -> dict:
+    with open(fp, "r") as f:
+        return json.load(f)
+
+
 def get_word_cefr_map(name, fp):
     assert name in ("us", "uk"), "只支持`US、UK`二种发音。"
-    with open(os.path.join(fp, f"{name}_cefr.json"), "r") as f:
-        return json.load(f)
+    # 每个进程只读取一次，返回浅拷贝
+    return dict(_load_word_cefr_map(os.path.join(fp, f"{name}_cefr.json")))
 
 
 def audio_autoplay_elem(data: Union[bytes, str], controls: bool = False, fmt="mp3"):
@@ -132,17 +145,7 @@ def get_lowest_cefr_level(word):
     Returns:
     str or None: The lowest CEFR level of the word, or None if the word is not found in the CEFR dictionary.
     """
-    fp = os.path.join(
-        CURRENT_CWD, "resource", "dictionary", "word_lists_by_edition_grade.json"
-    )
-    levels = ["A1", "A2", "B1", "B2", "C1", "C2"]
-    with open(fp, "r") as f:
-        cefr = json.load(f)
-    for level in levels:
-        level_flag = f"1-CEFR-{level}"
-        if word in cefr[level_flag]:
-            return level
-    return None
+    return get_word_index().lowest_level(word)
 
 
 def sample_words(level, n):
@@ -156,15 +159,9 @@ def sample_words(level, n):
     Returns:
         list: A list of randomly sampled words from the specified CEFR level.
     """
-    levels = ["A1", "A2", "B1", "B2", "C1", "C2"]
-    assert level in levels, f"level must be one of {levels}"
-    fp = os.path.join(
-        CURRENT_CWD, "resource", "dictionary", "word_lists_by_edition_grade.json"
-    )
-    with open(fp, "r") as f:
-        cefr = json.load(f)
-    level_flag = f"1-CEFR-{level}"
-    return random.sample(cefr[level_flag], n)
+    assert level in CEFR_LEVELS, f"level must be one of {CEFR_LEVELS}"
+    index = get_word_index()
+    return index.words_of(random.sample(index.level_ids(level).tolist(), n))
 
 
 def get_or_create_and_return_audio_data(word: str, style: str, secrets: dict):
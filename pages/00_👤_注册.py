@@ -4,14 +4,13 @@ from pathlib import Path
 import pytz
 import streamlit as st
 from cryptography.fernet import Fernet
-from google.cloud.firestore import FieldFilter
 from PIL import Image
 
 from mypylib.auth_utils import is_valid_email, is_valid_phone_number
 from mypylib.constants import CEFR_LEVEL_MAPS, FAKE_EMAIL_DOMAIN, PROVINCES
 from mypylib.db_model import User
 from mypylib.db_interface import DbInterface
-from mypylib.st_helper import check_and_force_logout, get_firestore_client
+from mypylib.st_helper import check_and_force_logout, end_run, get_firestore_client
 
 CURRENT_CWD: Path = Path(__file__).parent.parent
 WXSKM_DIR = CURRENT_CWD / "resource" / "wxskm"
@@ -151,20 +150,7 @@ with st.form(key="registration_form"):
             registration_time=datetime.now(timezone.utc),
         )  # type: ignore
         try:
-            # 检查是否已经存在具有相同手机号码或电子邮件的用户
-            users_ref = st.session_state.dbi.db.collection("users")
-            existing_user = users_ref.where(
-                filter=FieldFilter("phone_number", "==", user.phone_number)
-            ).get()
-            if existing_user:
-                raise ValueError("电话号码已被注册")
-            existing_user = users_ref.where(
-                filter=FieldFilter("email", "==", user.email)
-            ).get()
-            if existing_user:
-                raise ValueError("邮箱已被注册")
-
-            # 如果没有找到现有的用户，那么注册新用户
+            # 注册时在同一事务中登记手机号码、邮箱唯一标记，已被注册时抛出 ValueError
             st.session_state.dbi.register_user(user)
         except ValueError as e:
             msg = str(e)
@@ -428,3 +414,6 @@ for col, tier in zip(cols, pricing_tiers):
     col.image(image, width=100)
 
 # endregion
+
+# 提交本次运行中排队的写入，记录本次运行的 RPC 数量
+end_run()
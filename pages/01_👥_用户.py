@@ -3,6 +3,7 @@ import time
 import uuid
 from pathlib import Path
 
+import pandas as pd
 import pytz
 import streamlit as st
 from azure.core.exceptions import ResourceNotFoundError
@@ -14,8 +15,13 @@ from PIL import Image
 from mypylib.auth_utils import is_valid_email
 from mypylib.constants import PROVINCES, CEFR_LEVEL_MAPS
 from mypylib.db_interface import DbInterface
-from mypylib.db_model import User
-from mypylib.st_helper import check_access, check_and_force_logout, setup_logger
+from mypylib.db_model import User, UserProfile
+from mypylib.st_helper import (
+    check_access,
+    check_and_force_logout,
+    end_run,
+    setup_logger,
+)
 
 CURRENT_CWD: Path = Path(__file__).parent.parent
 FEEDBACK_DIR = CURRENT_CWD / "resource" / "feedback"
@@ -60,7 +66,7 @@ with tabs[items.index(":arrows_counterclockwise: 更新信息")]:
     st.subheader(":arrows_counterclockwise: 更新个人信息")
     CEFR = list(CEFR_LEVEL_MAPS.keys())
     COUNTRIES = ["中国"]
-    user = st.session_state.dbi.get_user()
+    user = st.session_state.dbi.get_user(model=UserProfile)
     # user.set_secret_key(st.secrets["FERNET_KEY"])
 
     with st.form(key="update_form"):
@@ -142,6 +148,9 @@ with tabs[items.index(":arrows_counterclockwise: 更新信息")]:
                 st.session_state.dbi.update_user(update_fields)
                 st.toast(f"成功更新用户：{user.phone_number}的信息！")
                 st.rerun()
+            except ValueError as e:
+                status.error(str(e))
+                st.stop()
             except Exception as e:
                 st.error(e)
                 raise e
@@ -152,8 +161,8 @@ with tabs[items.index(":arrows_counterclockwise: 更新信息")]:
 
 with tabs[items.index(":key: 重置密码")]:
     st.subheader(":key: 重置密码")
-    user = st.session_state.dbi.get_user()
-    # user = User.from_doc(user_doc)
+    # 只需为新密码加密，不必读取用户文档
+    user = User()
     with st.form(key="secret_form", clear_on_submit=True):
         password_reg = st.text_input(
             "密码",
@@ -192,6 +201,25 @@ with tabs[items.index(":key: 重置密码")]:
 
 with tabs[items.index(":bar_chart: 统计报表")]:
     st.subheader(":bar_chart: 统计报表")
+    usage_period = st.radio(
+        "统计周期", ["按日", "按月"], horizontal=True, key="usage-period"
+    )
+    if usage_period == "按日":
+        usage_rows = st.session_state.dbi.get_token_usage("day", 30)
+    else:
+        usage_rows = st.session_state.dbi.get_token_usage("month", 12)
+    usage_df = pd.DataFrame(
+        [row["by_type"] for row in usage_rows],
+        index=[row["date"] for row in usage_rows],
+    ).fillna(0)
+    usage_cols = st.columns(3)
+    usage_cols[0].metric("累计令牌", st.session_state.dbi.get_token_count())
+    usage_cols[1].metric("期间令牌", sum(row["total_tokens"] for row in usage_rows))
+    usage_cols[2].metric("期间调用次数", sum(row["record_count"] for row in usage_rows))
+    if usage_df.empty:
+        st.info("期间内没有令牌使用记录")
+    else:
+        st.bar_chart(usage_df, height=300)
 
 # endregion
 
@@ -340,3 +368,6 @@ with tabs[items.index(":memo: 问题反馈")]:
 # - 反馈问题请尽量详细描述，以便系统及时处理。
 # """
 #     )
+
+# 提交本次运行中排队的写入，记录本次运行的 RPC 数量
+end_run()
@@ -4,6 +4,7 @@ import random
 import re
 import time
 from datetime import timedelta
+from functools import partial
 from pathlib import Path
 
 import pandas as pd
@@ -11,20 +12,30 @@ import streamlit as st
 import streamlit.components.v1 as components
 import PIL.Image
 
+from mypylib.async_db_interface import run_concurrently
 from mypylib.constants import CEFR_LEVEL_MAPS
+from mypylib.deck_prefetch import DeckPrefetcher
 from mypylib.google_ai import generate_word_test
+from mypylib.pic_quiz import get_pic_quiz_index
 from mypylib.st_helper import (
     TOEKN_HELP_INFO,
     check_access,
     check_and_force_logout,
     configure_google_apis,
+    end_run,
     format_token_count,
+    get_async_dbi,
     get_mini_dict_doc,
+    get_mini_dict_docs,
+    get_mini_dict_replica,
+    get_word_search_index,
     load_vertex_model,
+    prefetch_word_image_urls,
     select_word_image_urls,
     setup_logger,
     update_and_display_progress,
 )
+from mypylib.word_index import SessionWordLists, get_word_index
 from mypylib.word_utils import (
     audio_autoplay_elem,
     get_or_create_and_return_audio_data,
@@ -75,6 +86,25 @@ menu = st.sidebar.selectbox(
     help="在这里选择你想要进行的操作。",
 )
 
+word_search_query = st.sidebar.text_input(
+    "查词",
+    key="word-search-query",
+    placeholder="英文单词或中文释义",
+    help="✨ 输入英文时按前缀匹配，拼写有误时给出相近的单词；输入中文时按释义反查英文单词。",
+)
+if word_search_query.strip():
+    word_search_results = get_word_search_index().search(word_search_query, 10)
+    if word_search_results:
+        st.sidebar.dataframe(
+            pd.DataFrame(word_search_results).rename(
+                columns={"word": "单词", "translation": "释义", "match": "匹配"}
+            ),
+            hide_index=True,
+            use_container_width=True,
+        )
+    else:
+        st.sidebar.caption("未找到匹配的单词。")
+
 st.sidebar.divider()
 
 # endregion
@@ -89,6 +119,7 @@ VIDEO_DIR = CURRENT_CWD / "resource/video_tip"
 
 TIME_LIMIT = 10 * 60  # 10分钟
 OP_THRESHOLD = 10000  # 操作阈值
+FLASHCARD_IMAGE_WAIT_SECONDS = 30  # 等待后台挑选图片的最长时间
 
 
 # endregion
@@ -118,48 +149,76 @@ def is_answer_correct(user_answer, standard_answer):
     return user_answer_letter == standard_answer
 
 
-@st.cache_data(show_spinner="提取词典...", ttl=60 * 60 * 24)  # 缓存有效期为24小时
-def load_word_dict():
-    with open(
-        DICT_DIR / "word_lists_by_edition_grade.json", "r", encoding="utf-8"
-    ) as f:
-        return json.load(f)
-
-
 def generate_page_words(word_lib_name, num_words, key, exclude_slash=False):
-    # 获取选中的单词列表
-    words = st.session_state.word_dict[word_lib_name]
-    if exclude_slash:
-        words = [word for word in words if "/" not in word]
-    n = min(num_words, len(words))
-    # 随机选择单词
-    st.session_state[key] = random.sample(words, n)
+    words = []
+    if st.session_state.get("srs-review-first"):
+        # 到期的复习单词优先，不限词库
+        words = [
+            w
+            for w in st.session_state.dbi.get_due_words(num_words)
+            if not (exclude_slash and "/" in w)
+        ]
+    if len(words) < num_words:
+        # 在共享词表的过滤视图上随机选择单词，不复制词表
+        sampled = st.session_state.word_lists.sample(
+            word_lib_name, num_words, exclude_slash
+        )
+        chosen = set(words)
+        words += [w for w in sampled if w not in chosen][: num_words - len(words)]
+    st.session_state[key] = words
     name = word_lib_name.split("-", maxsplit=1)[1]
     st.toast(f"当前单词列表名称：{name} 单词数量: {len(st.session_state[key])}")
 
 
 def add_personal_dictionary(include):
     # 从集合中提取个人词库，添加到word_lists中
-    personal_word_list = st.session_state.dbi.find_personal_dictionary()
     if include:
-        if len(personal_word_list) > 0:
-            st.session_state.word_dict["0-个人词库"] = personal_word_list
+        personal_word_list = st.session_state.dbi.find_personal_dictionary()
+        st.session_state.word_lists.set_personal(personal_word_list)
     else:
-        if "0-个人词库" in st.session_state.word_dict:
-            del st.session_state.word_dict["0-个人词库"]
+        st.session_state.word_lists.set_personal(None)
 
 
 @st.cache_data(ttl=timedelta(hours=24), max_entries=10000, show_spinner="获取单词信息...")
-def get_word_info(word):
-    return st.session_state.dbi.find_word(word)
+def get_word_info(word, fields=None, _dbi=None):
+    # 后台预取时传入 _dbi，该参数不参与缓存键
+    return (_dbi or st.session_state.dbi).find_word(word, fields)
 
 
 def word_lib_format_func(word_lib_name):
     name = word_lib_name.split("-", maxsplit=1)[1]
-    num = len(st.session_state.word_dict[word_lib_name])
+    num = st.session_state.word_lists.count(word_lib_name)
     return f"{name} ({num})"
 
 
+def srs_review_first_checkbox():
+    due_count = st.session_state.dbi.get_srs_scheduler().due_count()
+    st.sidebar.checkbox(
+        f"优先复习到期单词（{due_count}）",
+        key="srs-review-first",
+        help="✨ 按间隔重复安排，先选取已到期的复习单词（不限词库），不足部分从所选词库随机选取。",
+    )
+
+
+def record_review_once(test_key, question_key, word, correct):
+    """
+    记录测验中一道题的复习结果。
+
+    答案界面每次渲染都会核对答案，同一次测验中每道题只记录一次，
+    避免重复点击“检查”时重复计入间隔重复调度。
+    """
+    recorded = st.session_state.setdefault(f"{test_key}-srs-recorded", set())
+    if question_key in recorded:
+        return
+    recorded.add(question_key)
+    st.session_state.dbi.record_review(word, correct)
+
+
+def reset_recorded_reviews(test_key):
+    # 开始新的测验
+    st.session_state[f"{test_key}-srs-recorded"] = set()
+
+
 def on_include_cb_change():
     # st.write("on_include_cb_change", st.session_state["include-personal-dictionary"])
     # 更新个人词库
@@ -167,7 +226,13 @@ def on_include_cb_change():
 
 
 def display_word_images(word, container):
-    urls = select_word_image_urls(word)
+    # 正在后台挑选该单词的图片时等待其完成，避免重复调用 AI
+    prefetcher = st.session_state.get("flashcard_prefetcher")
+    if prefetcher is not None:
+        prefetcher.wait(word, timeout=FLASHCARD_IMAGE_WAIT_SECONDS)
+    urls = select_word_image_urls(
+        word, st.session_state.get("flashcard_image_urls")
+    )
     cols = container.columns(len(urls))
     caption = [f"图片 {i+1}" for i in range(len(urls))]
     for i, col in enumerate(cols):
@@ -191,6 +256,14 @@ if "flashcard_display_state" not in st.session_state:
 if "flashcard_idx" not in st.session_state:
     st.session_state["flashcard_idx"] = -1
 
+# 当前卡组的后台预取
+if "flashcard_prefetcher" not in st.session_state:
+    st.session_state["flashcard_prefetcher"] = None
+
+# 后台挑选的图片网址及令牌用量，浏览时由脚本线程取用
+if "flashcard_image_urls" not in st.session_state:
+    st.session_state["flashcard_image_urls"] = {}
+
 # endregion
 
 # region 闪卡辅助函数
@@ -200,10 +273,42 @@ def reset_flashcard_word(clear=True):
     # 恢复初始显示状态
     if clear:
         st.session_state.flashcard_words = []
+        if st.session_state.get("flashcard_prefetcher") is not None:
+            st.session_state.flashcard_prefetcher.cancel()
+            st.session_state.flashcard_prefetcher = None
     st.session_state.flashcard_display_state = "全部"
     st.session_state["flashcard_idx"] = -1
 
 
+def start_flashcard_prefetch(words, voice_style):
+    """
+    按卡组顺序在后台预取简版词典文档、单词详情、音频及图片网址。
+
+    尚无图片网址的单词在后台调用 Serper 及 Gemini 挑选图片，结果存入
+    `flashcard_image_urls`，浏览时在脚本线程中记录令牌用量并写入数据库。
+    """
+    if st.session_state.flashcard_prefetcher is not None:
+        st.session_state.flashcard_prefetcher.cancel()
+    st.session_state.flashcard_prefetcher = None
+    st.session_state.flashcard_image_urls = {}
+    if not words:
+        return
+    # 预取线程中没有会话上下文，DbInterface 及结果字典须在此取出后传入
+    dbi = st.session_state.dbi
+    tasks = [
+        # 简版词典副本中没有的单词读取数据库，进入文档缓存
+        partial(get_mini_dict_doc, dbi=dbi),
+        partial(get_word_info, _dbi=dbi),
+        partial(get_audio_html, voice_style=voice_style),
+        partial(
+            prefetch_word_image_urls,
+            dbi=dbi,
+            results=st.session_state.flashcard_image_urls,
+        ),
+    ]
+    st.session_state.flashcard_prefetcher = DeckPrefetcher(words, tasks)
+
+
 def on_prev_btn_click():
     st.session_state["flashcard_idx"] -= 1
 
@@ -304,7 +409,14 @@ def view_flash_word(container):
 
     word = st.session_state.flashcard_words[st.session_state.flashcard_idx]
     if word not in st.session_state.flashcard_word_info:
-        st.session_state.flashcard_word_info[word] = get_word_info(word)
+        if word.replace("/", " or ") in get_mini_dict_replica():
+            st.session_state.flashcard_word_info[word] = get_word_info(word)
+        else:
+            # 简版词典副本中没有该单词时，与单词详情并发读取，结果进入文档缓存
+            adbi = get_async_dbi()
+            st.session_state.flashcard_word_info[word], _ = run_concurrently(
+                adbi.find_word(word), adbi.get_mini_dict_doc(word)
+            )
 
     word_info = st.session_state.flashcard_word_info.get(word, {})
     if not word_info:
@@ -368,12 +480,14 @@ def reset_puzzle_word():
     st.session_state.puzzle_idx = -1
     st.session_state["puzzle_view_word"] = []
     st.session_state["puzzle_test_score"] = {}
+    reset_recorded_reviews("puzzle")
     # st.session_state.puzzle_answer_value = ""
     st.session_state.puzzle_answer = ""
 
 
 def get_word_definition(word):
-    word_info = get_word_info(word)
+    # 只需英文释义
+    word_info = get_word_info(word, ("en-US",))
     definition = ""
     en = word_info.get("en-US", {})
     for k, v in en.items():
@@ -470,6 +584,8 @@ def handle_puzzle_input():
         else:
             st.write(f"对不起，您回答错误。正确的单词应该为：{word}")
             st.session_state.puzzle_test_score[word] = False
+        if user_input:
+            record_review_once("puzzle", word, word, user_input == word)
 
         score = (
             sum(st.session_state.puzzle_test_score.values())
@@ -507,6 +623,10 @@ if "pic_tests" not in st.session_state:
 if "user_pic_answer" not in st.session_state:
     st.session_state["user_pic_answer"] = {}
 
+# 用户实际选择过答案的题目序号；浏览题目时 user_pic_answer 会填入默认选项
+if "pic_answered" not in st.session_state:
+    st.session_state["pic_answered"] = set()
+
 
 def on_prev_pic_btn_click():
     st.session_state["pic_idx"] -= 1
@@ -553,32 +673,20 @@ def get_pic_categories():
     return sorted([d.name for d in pic_dir.iterdir() if d.is_dir()])
 
 
-@st.cache_data(ttl=timedelta(hours=24))
-def load_pic_tests(category, num):
-    pic_qa_path = CURRENT_CWD / "resource/quiz/quiz_image_qa.json"
-    pic_qa = {}
-    with open(pic_qa_path, "r", encoding="utf-8") as f:
-        pic_qa = json.load(f)
-    qa_filtered = [v for v in pic_qa if v["category"].startswith(category)]
-    random.shuffle(qa_filtered)
-    # 重置
-    data = qa_filtered[:num]
-    for d in data:
-        random.shuffle(d["options"])
-    return data
-
-
 def pic_word_test_reset(category, num):
     st.session_state.user_pic_answer = {}
+    st.session_state.pic_answered = set()
     st.session_state.pic_idx = -1
-    data = load_pic_tests(category, num)
-    st.session_state["pic_tests"] = data
+    reset_recorded_reviews("pic")
+    # 每次从进程共享的题库中重新抽题，选项顺序按会话打乱
+    st.session_state["pic_tests"] = get_pic_quiz_index().sample(category, num)
 
 
 def on_pic_radio_change(idx):
     # 保存用户答案
     current = st.session_state["pic_options"]
     st.session_state.user_pic_answer[idx] = current
+    st.session_state.pic_answered.add(idx)
 
 
 def view_pic_question(container):
@@ -643,12 +751,16 @@ def check_pic_answer(container):
             key=f"pic_options_{idx}",
         )
         msg = ""
-        if user_answer.strip().endswith(answer.strip()):
+        correct = user_answer.strip().endswith(answer.strip())
+        if correct:
             score += 1
             msg = f"正确答案：{answer} :white_check_mark:"
         else:
             msg = f"正确答案：{answer} :x:"
         container.markdown(msg)
+        # 未作答的题目显示的是默认选项，不计入复习
+        if idx in st.session_state.pic_answered:
+            record_review_once("pic", idx, answer.strip(), correct)
     percentage = score / n * 100
     if percentage >= 75:
         st.balloons()
@@ -679,6 +791,7 @@ def reset_test_words():
     st.session_state.word_test_idx = -1
     st.session_state.word_tests = []
     st.session_state.user_answer = []
+    reset_recorded_reviews("word-test")
 
 
 def on_prev_test_btn_click():
@@ -718,12 +831,15 @@ def check_word_test_answer(container):
         )
         msg = ""
         # 用户答案是选项序号，而提供的标准答案是A、B、C、D
-        if is_answer_correct(user_answer_idx, answer):
+        correct = is_answer_correct(user_answer_idx, answer)
+        if correct:
             score += 1
             msg = f"正确答案：{answer} :white_check_mark:"
         else:
             msg = f"正确答案：{answer} :x:"
         container.markdown(msg)
+        if user_answer_idx is not None:
+            record_review_once("word-test", idx, word, correct)
         container.markdown(f"解释：{explanation}")
     percentage = score / n * 100
     if percentage >= 75:
@@ -766,12 +882,12 @@ def view_test_word(container):
 # region 个人词库辅助
 
 
-@st.cache_data(ttl=timedelta(hours=24), max_entries=100, show_spinner="获取基础词库...")
-def gen_base_lib(word_lib):
-    words = st.session_state.word_dict[word_lib]
+def _gen_word_lib_dataframe(words):
+    # 一次性批量读取简版词典，避免逐词请求数据库
+    infos = get_mini_dict_docs(words)
     data = []
     for word in words:
-        info = get_mini_dict_doc(word)
+        info = infos.get(word, {})
         data.append(
             {
                 "单词": word,
@@ -782,29 +898,25 @@ def gen_base_lib(word_lib):
     return pd.DataFrame.from_records(data)
 
 
+@st.cache_data(ttl=timedelta(hours=24), max_entries=100, show_spinner="获取基础词库...")
+def gen_base_lib(word_lib):
+    words = st.session_state.word_lists.words(word_lib)
+    return _gen_word_lib_dataframe(words)
+
+
 def get_my_word_lib():
     # 返回实时的个人词库
     my_words = st.session_state.dbi.find_personal_dictionary()
-    data = []
-    for word in my_words:
-        info = get_mini_dict_doc(word)
-        data.append(
-            {
-                "单词": word,
-                "CEFR最低分级": info.get("level", "") if info else "",
-                "翻译": info.get("translation", "") if info else "",
-            }
-        )
-    return pd.DataFrame.from_records(data)
+    return _gen_word_lib_dataframe(my_words)
 
 
 # endregion
 
 # region 加载数据
 
-if "word_dict" not in st.session_state:
-    # 注意要使用副本
-    st.session_state["word_dict"] = load_word_dict().copy()
+if "word_lists" not in st.session_state:
+    # 基础词表为进程共享，会话只保存个人词库
+    st.session_state["word_lists"] = SessionWordLists(get_word_index())
 
 with open(CURRENT_CWD / "resource/voices.json", "r", encoding="utf-8") as f:
     voice_style_options = json.load(f)
@@ -828,10 +940,11 @@ if menu and menu.endswith("闪卡记忆"):
         key="include-personal-dictionary",
         on_change=on_include_cb_change,
     )
+    srs_review_first_checkbox()
     # 在侧边栏添加一个选项卡让用户选择一个单词列表
     word_lib = st.sidebar.selectbox(
         "词库",
-        sorted(list(st.session_state.word_dict.keys())),
+        st.session_state.word_lists.names(),
         key="flashcard-selected",
         on_change=reset_flashcard_word,
         format_func=word_lib_format_func,
@@ -863,7 +976,12 @@ if menu and menu.endswith("闪卡记忆"):
         if len(st.session_state.flashcard_words) != 0
         else 1,
         st.empty(),
-        f"\t 当前单词：{st.session_state.flashcard_words[st.session_state.flashcard_idx] if st.session_state.flashcard_idx != -1 else ''}",
+        f"\t 当前单词：{st.session_state.flashcard_words[st.session_state.flashcard_idx] if st.session_state.flashcard_idx != -1 else ''}"
+        + (
+            f"\t 已就绪：{st.session_state.flashcard_prefetcher.ready_count()}/{len(st.session_state.flashcard_prefetcher)}"
+            if st.session_state.flashcard_prefetcher is not None
+            else ""
+        ),
     )
 
     btn_cols = st.columns(8)
@@ -936,6 +1054,7 @@ if menu and menu.endswith("闪卡记忆"):
 
     if refresh_btn:
         reset_flashcard_word(False)
+        start_flashcard_prefetch(st.session_state.flashcard_words, voice_style)
         st.rerun()
 
     if play_btn:
@@ -951,7 +1070,7 @@ if menu and menu.endswith("闪卡记忆"):
 
     if del_btn:
         word = st.session_state.flashcard_words[st.session_state.flashcard_idx]
-        st.session_state.dbi.delete_words_from_personal_dictionary([word])
+        st.session_state.dbi.remove_words_from_personal_dictionary([word])
         st.toast(f"从个人词库中删除单词：{word}。")
 
     if st.session_state.flashcard_idx != -1:
@@ -969,10 +1088,11 @@ elif menu and menu.endswith("拼图游戏"):
         value=False,
         on_change=on_include_cb_change,
     )
+    srs_review_first_checkbox()
     # 在侧边栏添加一个选项卡让用户选择一个单词列表
     word_lib = st.sidebar.selectbox(
         "词库",
-        sorted(list(st.session_state.word_dict.keys())),
+        st.session_state.word_lists.names(),
         key="puzzle-selected",
         on_change=reset_puzzle_word,
         format_func=word_lib_format_func,
@@ -1058,7 +1178,7 @@ elif menu and menu.endswith("拼图游戏"):
 
     if del_btn:
         word = st.session_state.puzzle_words[st.session_state.puzzle_idx]
-        st.session_state.dbi.delete_words_from_personal_dictionary([word])
+        st.session_state.dbi.remove_words_from_personal_dictionary([word])
         st.toast(f"从个人词库中删除单词：{word}。")
 
     if st.session_state.puzzle_idx != -1:
@@ -1169,7 +1289,7 @@ elif menu and menu.endswith("看图猜词"):
         tests = st.session_state.pic_tests
         idx = st.session_state.pic_idx
         word = tests[idx]["answer"]
-        st.session_state.dbi.delete_words_from_personal_dictionary([word])
+        st.session_state.dbi.remove_words_from_personal_dictionary([word])
         st.toast(f"从个人词库中删除单词：{word}。")
 
 # endregion
@@ -1193,10 +1313,11 @@ elif menu and menu.endswith("词意测试"):
         value=False,
         on_change=on_include_cb_change,
     )
+    srs_review_first_checkbox()
     # 在侧边栏添加一个选项卡让用户选择一个单词列表
     word_lib = st.sidebar.selectbox(
         "词库",
-        sorted(list(st.session_state.word_dict.keys())),
+        st.session_state.word_lists.names(),
         key="test-word-selected",
         on_change=reset_test_words,
         format_func=word_lib_format_func,
@@ -1327,7 +1448,7 @@ elif menu and menu.endswith("词意测试"):
 
     if del_btn:
         word = st.session_state.words_for_test[st.session_state.word_test_idx]
-        st.session_state.dbi.delete_words_from_personal_dictionary([word])
+        st.session_state.dbi.remove_words_from_personal_dictionary([word])
         st.toast(f"从个人词库中删除单词：{word}。")
 
 # endregion
@@ -1338,7 +1459,7 @@ elif menu and menu.endswith("词库管理"):
     add_personal_dictionary(False)
     word_lib = st.sidebar.selectbox(
         "词库",
-        sorted(list(st.session_state.word_dict.keys())),
+        st.session_state.word_lists.names(),
         key="lib-selected",
         format_func=word_lib_format_func,
         help="✨ 选择一个基准词库，用于生成个人词库。",
@@ -1430,6 +1551,10 @@ elif menu and menu.endswith("词库管理"):
         )
         view_placeholder.dataframe(df, height=500)
 
+    journal_depth = st.session_state.dbi.get_personal_vocabulary_journal_depth()
+    if journal_depth:
+        status_elem.caption(f"有 {journal_depth} 项变更待同步到云端，退出登录时将自动保存。")
+
     with st.expander(":bulb: 如何给个人词库添加一个或多个单词？", expanded=False):
         vfp = VIDEO_DIR / "单词" / "个人词库逐词添加.mp4"
         st.video(str(vfp))
@@ -1458,3 +1583,6 @@ elif menu and menu.endswith("词库管理"):
         )
 
 # endregion
+
+# 提交本次运行中排队的写入，记录本次运行的 RPC 数量
+end_run()
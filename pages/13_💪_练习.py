@@ -1,9 +1,11 @@
 import streamlit as st
 
+from mypylib.exercise_bank import get_exercise_bank
 from mypylib.st_helper import (
     check_access,
     check_and_force_logout,
     configure_google_apis,
+    end_run,
 )
 
 # region 配置
@@ -23,3 +25,99 @@ menu = st.sidebar.selectbox("菜单", menu_items, help="选择你要练习的项
 st.sidebar.divider()
 sidebar_status = st.sidebar.empty()
 check_and_force_logout(sidebar_status)
+
+# region 语法练习
+
+if menu == "语法练习":
+    bank = get_exercise_bank()
+
+    def reset_grammar_exercise():
+        st.session_state["grammar-exercise-ids"] = []
+        st.session_state["grammar-exercise-checked"] = False
+
+    if "grammar-exercise-ids" not in st.session_state:
+        reset_grammar_exercise()
+
+    level = st.sidebar.selectbox(
+        "级别", bank.levels(), key="grammar-level", on_change=reset_grammar_exercise
+    )
+    sections = bank.sections(level)
+    section = st.sidebar.selectbox(
+        "练习",
+        [None] + [s["section"] for s in sections],
+        key="grammar-section",
+        format_func=lambda pos: "全部"
+        if pos is None
+        else next(s["header"] for s in sections if s["section"] == pos),
+        on_change=reset_grammar_exercise,
+        help="✨ 选择一组练习，或从该级别的全部题目中抽题。",
+    )
+    num_questions = st.sidebar.slider(
+        "题目数量",
+        5,
+        20,
+        value=10,
+        step=5,
+        key="grammar-num-questions",
+        on_change=reset_grammar_exercise,
+    )
+
+    st.subheader(":memo: 语法练习", divider="rainbow", anchor=False)
+
+    btn_cols = st.columns(8)
+    if btn_cols[0].button(
+        "刷新[:arrows_counterclockwise:]",
+        key="grammar-refresh",
+        help="✨ 点击按钮，随机抽取题目，开始或重新开始练习。",
+    ):
+        for key in [k for k in st.session_state if str(k).startswith("grammar-q-")]:
+            del st.session_state[key]
+        st.session_state["grammar-exercise-ids"] = bank.sample(
+            num_questions, level, section
+        )
+        st.session_state["grammar-exercise-checked"] = False
+    if btn_cols[1].button(
+        "检查[:mag:]",
+        key="grammar-check",
+        help="✨ 点击按钮，检查答案。",
+        disabled=not st.session_state["grammar-exercise-ids"],
+    ):
+        st.session_state["grammar-exercise-checked"] = True
+
+    checked = st.session_state["grammar-exercise-checked"]
+    score = 0
+    gradable = 0
+    for n, question_id in enumerate(st.session_state["grammar-exercise-ids"]):
+        q = bank.question(question_id)
+        st.markdown(f"**{n + 1}.** {q['question'].strip()}")
+        choice = st.radio(
+            "选项",
+            q["options"],
+            index=None,
+            key=f"grammar-q-{question_id}",
+            label_visibility="collapsed",
+            disabled=checked,
+        )
+        if not checked:
+            continue
+        correct = bank.check_answer(question_id, choice or "")
+        if correct is None:
+            st.info(f"本题暂无标准答案。参考译文：{q.get('cn', '无')}")
+            continue
+        gradable += 1
+        if correct:
+            score += 1
+            st.success("回答正确")
+        else:
+            st.error(f"回答错误，正确答案：{q['answer'].strip()}")
+        if q.get("explanation"):
+            st.caption(q["explanation"])
+
+    if checked and gradable:
+        st.divider()
+        st.markdown(f"得分：:rainbow[{score}/{gradable}]（仅计有标准答案的题目）")
+
+# endregion
+
+# 提交本次运行中排队的写入，记录本次运行的 RPC 数量
+end_run()
@@ -4,6 +4,7 @@ from mypylib.st_helper import (
     check_access,
     check_and_force_logout,
     configure_google_apis,
+    end_run,
 )
 
 # region 配置
@@ -23,3 +24,6 @@ menu = st.sidebar.selectbox("菜单", menu_items, help="选择你要练习的项
 st.sidebar.divider()
 sidebar_status = st.sidebar.empty()
 check_and_force_logout(sidebar_status)
+
+# 提交本次运行中排队的写入，记录本次运行的 RPC 数量
+end_run()
@@ -14,6 +14,7 @@ from mypylib.st_helper import (
     check_access,
     check_and_force_logout,
     configure_google_apis,
+    end_run,
     format_token_count,
     load_vertex_model,
     setup_logger,
@@ -1993,3 +1994,6 @@ $$ b(4) = -405 $$
 # endregion
 
 # endregion
+
+# 提交本次运行中排队的写入，记录本次运行的 RPC 数量
+end_run()
@@ -13,20 +13,28 @@ from typing import List
 import pandas as pd
 import pytz
 import streamlit as st
-from google.cloud import firestore
 from vertexai.preview.generative_models import GenerationConfig, Image, Part
 
 from mypylib.constants import CEFR_LEVEL_MAPS
+from mypylib.db_cache import document_cache
 from mypylib.db_interface import PRICES
 from mypylib.db_model import Payment, PaymentStatus, PurchaseType, str_to_enum
 from mypylib.google_ai import select_best_images_for_word
 from mypylib.google_cloud_configuration import PROJECT_ID
+from mypylib.mini_dict_replica import mini_dict_update_fields
+from mypylib.order_ids import audit_order_id_gaps, get_order_id_allocator
+from mypylib.retention import RETENTION_SETTINGS, archive_collection
+from mypylib.rpc_stats import rpc_stats
+from mypylib.token_rollups import backfill_token_rollups, get_token_usage
+from mypylib.word_bundle import export_words_bundle, get_word_bundle
 from mypylib.st_helper import (
     check_access,
     check_and_force_logout,
     configure_google_apis,
+    end_run,
     get_blob_container_client,
     get_blob_service_client,
+    get_mini_dict_replica,
     google_translate,
     load_vertex_model,
     select_word_image_urls,
@@ -186,38 +194,25 @@ PAYMENT_EDITABLE_COLS: list[str] = [
 
 
 def get_new_order_id():
-    db = st.session_state.dbi.db
-
-    # 获取用于生成订单编号的文档
-    doc_ref = db.collection("system").document("order_id_generator")
-
-    # 定义一个事务函数
-    @firestore.transactional
-    def update_order_id(transaction):
-        # 在事务中获取文档的内容
-        doc = doc_ref.get(transaction=transaction)
-
-        # 如果文档不存在，创建一个新的文档，设置 "last_order_id" 为 0
-        if not doc.exists:
-            transaction.set(doc_ref, {"last_order_id": "0"})
-            last_order_id = "0"
-        else:
-            # 获取 "last_order_id" 的值
-            last_order_id = doc.get("last_order_id")
-
-        # 将 "last_order_id" 转换为整数，然后加 1
-        new_order_id = str(int(last_order_id) + 1).zfill(10)
+    # 订单号按块租用后在本进程内分配，不必每次都通过事务争用同一个文档
+    return get_order_id_allocator(st.session_state.dbi.db).next_id()
 
-        # 在事务中更新文档，设置 "last_order_id" 为新的订单编号
-        transaction.update(doc_ref, {"last_order_id": new_order_id})
 
-        return new_order_id
-
-    # 开始事务
-    transaction = db.transaction()
-    new_order_id = update_order_id(transaction)
-
-    return new_order_id
+def load_payments_page(page: int):
+    """读取支付记录的第 page 页（从 0 开始），结果保存在 session_state 中。"""
+    cursors = st.session_state["payment_cursors"]
+    res = st.session_state.dbi.query_payments_page(
+        st.session_state["payment_query"], start_after=cursors[page]
+    )
+    if page + 1 == len(cursors):
+        cursors.append(res["cursor"])
+    if res["total"] is not None:
+        st.session_state["payment_total"] = res["total"]
+    st.session_state["payment_page"] = page
+    # 将每个文档转换为字典
+    st.session_state["queried_payments"] = [
+        {"order_id": doc.id, **doc.to_dict()} for doc in res["docs"]
+    ]
 
 
 def generate_timestamp(key: str, type: str, idx: int):
@@ -333,7 +328,7 @@ def init_mini_dict():
     mini_progress = st.progress(0)
 
     # 获取 mini_dict 集合中所有的文档名称
-    mini_dict_docs = [doc.id for doc in mini_dict_ref.stream()]
+    mini_dict_docs = {doc.id for doc in mini_dict_ref.stream()}
 
     for i, w in enumerate(words):
         update_and_display_progress(i + 1, len(words), mini_progress)
@@ -361,7 +356,8 @@ def init_mini_dict():
             "translation": translation,
             "level": get_lowest_cefr_level(w),
         }
-        mini_dict_ref.document(doc_name).set(p)
+        mini_dict_ref.document(doc_name).set(mini_dict_update_fields(p))
+        document_cache.invalidate("mini_dict", doc_name)
         logger.info(f"🎇 单词：{w} 完成")
         # 每次写入操作后休眠 0.5 秒
         time.sleep(0.5)
@@ -405,6 +401,7 @@ def _add_to_words(mini_dict_ref, words_ref, doc_name, target_language_code):
             target_language_code: {"translation": p["translation"]},
         }
         words_ref.document(doc_name).set(d)
+        document_cache.invalidate("words", doc_name)
         logger.info(f"🎇 单词：{doc_name} 完成")
         # 每次写入操作后休眠 0.5 秒
         # time.sleep(0.5)
@@ -415,18 +412,27 @@ def _add_to_words(mini_dict_ref, words_ref, doc_name, target_language_code):
 # region 简版词典辅助函数
 
 
-@st.cache_data(show_spinner="提取简版词典...", ttl=60 * 60 * 2)  # 缓存有效期为2小时
-def get_mini_dict_dataframe():
-    db = st.session_state.dbi.db
-    collection = db.collection("mini_dict")
-
-    # 从 Firestore 获取数据
-    docs = collection.get()
+@st.cache_data(max_entries=1, show_spinner="生成简版词典数据...")
+def _mini_dict_dataframe(version, revision):
+    # 参数仅用作缓存键，副本同步或本地写入后重新生成
+    return pd.DataFrame(get_mini_dict_replica().records())
 
-    # 将数据转换为 DataFrame
-    data = [{"word": doc.id, **doc.to_dict()} for doc in docs]
 
-    return pd.DataFrame(data)
+def get_mini_dict_dataframe():
+    # 从本地副本生成，无需读取整个集合
+    replica = get_mini_dict_replica()
+    return _mini_dict_dataframe(replica.version, replica.revision)
+
+
+def display_mini_dict_replica_status(elem):
+    status = get_mini_dict_replica().status()
+    version = status["version"].astimezone(tz) if status["version"] else "无"
+    synced_at = status["synced_at"].astimezone(tz) if status["synced_at"] else "无"
+    msg = f"简版词典副本：{status['size']} 个单词，版本：{version}，最近同步：{synced_at}"
+    if status["is_stale"]:
+        elem.warning(f"{msg}（已过时）")
+    else:
+        elem.info(msg)
 
 
 def display_mini_dict_changes(current_df, elem):
@@ -467,7 +473,9 @@ def save_dataframe_changes_to_database(current_df):
 
         # 更新文档
         doc_ref = collection.document(doc_name)
-        doc_ref.update(new_values)
+        doc_ref.update(mini_dict_update_fields(new_values))
+        get_mini_dict_replica().apply_local_write(doc_name, new_values)
+        document_cache.invalidate("mini_dict", doc_name)
         st.toast(f"更新简版词典，单词：{doc_name}", icon="🎉")
 
 
@@ -576,7 +584,9 @@ def process_images():
 
 # region 侧边栏
 
-menu = st.sidebar.selectbox("菜单", options=["支付管理", "处理反馈", "词典管理", "统计分析"])
+menu = st.sidebar.selectbox(
+    "菜单", options=["支付管理", "处理反馈", "词典管理", "数据维护", "统计分析"]
+)
 sidebar_status = st.sidebar.empty()
 check_and_force_logout(sidebar_status)
 
@@ -863,13 +873,27 @@ if menu == "支付管理":
                 # st.write(kwargs)
                 # for k, v in kwargs.items():
                 #     st.write(f"{k=}, {type(v)=}")
-                results = st.session_state.dbi.query_payments(kwargs)
-                # 将每个文档转换为字典
-                dicts = [{"order_id": doc.id, **doc.to_dict()} for doc in results]
-                st.write(f"{dicts=}")
-                st.session_state["queried_payments"] = dicts
+                st.session_state["payment_query"] = kwargs
+                # 各页的起始游标，第一页为 None
+                st.session_state["payment_cursors"] = [None]
+                load_payments_page(0)
 
         st.subheader("支付清单")
+        if "payment_cursors" in st.session_state:
+            page = st.session_state["payment_page"]
+            cursors = st.session_state["payment_cursors"]
+            nav_cols = st.columns([1, 1, 8])
+            if nav_cols[0].button("上一页", key="prev-payments-btn", disabled=page == 0):
+                load_payments_page(page - 1)
+                st.rerun()
+            if nav_cols[1].button(
+                "下一页", key="next-payments-btn", disabled=cursors[page + 1] is None
+            ):
+                load_payments_page(page + 1)
+                st.rerun()
+            nav_cols[2].caption(
+                f"第 {page + 1} 页，共约 {st.session_state['payment_total']} 条记录"
+            )
         df = pd.DataFrame(st.session_state.get("queried_payments", {}))
 
         placeholder = st.empty()
@@ -1036,6 +1060,12 @@ elif menu == "词典管理":
         if btn_cols[1].button("添加", key="add-btn-3", help="✨ 将简版词典单词添加到默认词典"):
             add_new_words_from_mini_dict_to_words()
 
+        replica_status = st.empty()
+        if btn_cols[2].button("刷新副本", key="refresh-replica-btn-3", help="✨ 从数据库全量刷新简版词典本地副本"):
+            with st.spinner("正在刷新简版词典副本..."):
+                get_mini_dict_replica().refresh(full=True)
+        display_mini_dict_replica_status(replica_status)
+
     # endregion
 
     # # region 编辑微型词典
@@ -1106,6 +1136,8 @@ elif menu == "词典管理":
                     logger.info(f"✅ 单词：{word} 已经有图片Urls，跳过")
                     continue
                 select_word_image_urls(q)
+                # 长时间运行，逐词提交排队的写入
+                st.session_state.dbi.commit_run()
                 end_time = time.time()  # 记录结束时间
                 elapsed_time = end_time - start_time  # 计算运行时间
                 # 确保不超限
@@ -1116,6 +1148,282 @@ elif menu == "词典管理":
 
 # endregion
 
+# region 数据维护
+
+elif menu == "数据维护":
+    maintenance_items = [
+        "个人词库迁移",
+        "服务期限校对",
+        "支付检索词",
+        "订单号审计",
+        "数据归档",
+        "唯一标记",
+        "令牌用量汇总",
+        "离线词典包",
+    ]
+    maintenance_tabs = st.tabs(maintenance_items)
+
+    # region 个人词库迁移
+
+    with maintenance_tabs[maintenance_items.index("个人词库迁移")]:
+        st.subheader("个人词库迁移", divider="rainbow", anchor=False)
+        st.text("将用户文档中的个人词库数组转换为按单词编号存储的压缩位图，减小用户文档体积")
+        migrate_progress = st.progress(0)
+        if st.button("开始迁移", key="migrate-vocabulary-btn", help="✨ 迁移所有用户的个人词库"):
+            migrated = st.session_state.dbi.migrate_all_personal_vocabularies(
+                lambda i, n: update_and_display_progress(i, n, migrate_progress)
+            )
+            st.success(f"已迁移 {migrated} 个用户的个人词库。")
+
+    # endregion
+
+    # region 服务期限校对
+
+    with maintenance_tabs[maintenance_items.index("服务期限校对")]:
+        st.subheader("服务期限校对", divider="rainbow", anchor=False)
+        st.text("根据已批准的支付记录重建用户文档中的服务到期时间（service_expiry_time）")
+        reconcile_progress = st.progress(0)
+        if st.button("开始校对", key="reconcile-expiry-btn", help="✨ 校对所有用户的服务到期时间"):
+            fixed = st.session_state.dbi.reconcile_service_expiry(
+                lambda i, n: update_and_display_progress(i, n, reconcile_progress)
+            )
+            st.success(f"已修正 {fixed} 个用户的服务到期时间。")
+
+    # endregion
+
+    # region 支付检索词
+
+    with maintenance_tabs[maintenance_items.index("支付检索词")]:
+        st.subheader("支付检索词", divider="rainbow", anchor=False)
+        st.text("为支付记录生成支付方式、备注的检索词（search_tokens），供支付管理模糊查询使用。完成前，模糊查询在其余条件的结果中逐条核对")
+        tokens_progress = st.progress(0)
+        if st.button("开始生成", key="backfill-tokens-btn", help="✨ 为所有支付记录重新生成检索词"):
+            updated = st.session_state.dbi.backfill_payment_search_tokens(
+                lambda i, n: update_and_display_progress(i, n, tokens_progress)
+            )
+            st.success(f"已更新 {updated} 条支付记录的检索词。")
+
+    # endregion
+
+    # region 订单号审计
+
+    with maintenance_tabs[maintenance_items.index("订单号审计")]:
+        st.subheader("订单号审计", divider="rainbow", anchor=False)
+        st.text("订单号按块租用，进程退出时未用完的订单号成为空号。此处列出各租约的使用情况")
+        if st.button("生成报告", key="audit-order-ids-btn", help="✨ 核对各租约中的空号"):
+            audit_df = pd.DataFrame(audit_order_id_gaps(st.session_state.dbi.db))
+            if audit_df.empty:
+                st.info("没有租约记录")
+            else:
+                st.dataframe(
+                    audit_df,
+                    column_config={
+                        "start": "起始订单号",
+                        "end": "结束订单号",
+                        "leased_at": "租用时间",
+                        "process": "进程",
+                        "used": "已使用",
+                        "gaps": "空号",
+                    },
+                    hide_index=True,
+                    use_container_width=True,
+                )
+
+    # endregion
+
+    # region 数据归档
+
+    with maintenance_tabs[maintenance_items.index("数据归档")]:
+        st.subheader("数据归档", divider="rainbow", anchor=False)
+        st.text("将超过保留期的登录事件、令牌使用记录归档为压缩 JSONL 文件，删除原文档并保留每日汇总")
+        archive_cols = st.columns(3)
+        archive_collection_name = archive_cols[0].selectbox(
+            "集合", list(RETENTION_SETTINGS.keys()), key="archive-collection"
+        )
+        retention_days = archive_cols[1].number_input(
+            "保留天数",
+            min_value=7,
+            value=RETENTION_SETTINGS[archive_collection_name]["days"],
+            key="archive-days",
+        )
+        archive_target = archive_cols[2].selectbox(
+            "归档位置", ["本地文件", "Azure Blob"], key="archive-target"
+        )
+        archive_progress = st.progress(0)
+        if st.button("开始归档", key="archive-btn", help="✨ 归档并删除超过保留期的文档"):
+            res = archive_collection(
+                st.session_state.dbi.db,
+                archive_collection_name,
+                int(retention_days),
+                get_blob_container_client("archive")
+                if archive_target == "Azure Blob"
+                else None,
+                lambda i, n: update_and_display_progress(i, n, archive_progress),
+            )
+            if res["count"]:
+                st.success(
+                    f"已归档 {res['count']} 个文档（{res['days']} 天），归档文件：{res['archive']}"
+                )
+            else:
+                st.info("没有超过保留期的文档")
+
+    # endregion
+
+    # region 唯一标记
+
+    with maintenance_tabs[maintenance_items.index("唯一标记")]:
+        st.subheader("唯一标记", divider="rainbow", anchor=False)
+        st.text("为已有用户补建 unique_phones、unique_emails 标记文档，注册时据此检查重复")
+        markers_progress = st.progress(0)
+        if st.button("开始补建", key="backfill-markers-btn", help="✨ 为所有用户补建唯一标记"):
+            duplicates = st.session_state.dbi.backfill_unique_markers(
+                lambda i, n: update_and_display_progress(i, n, markers_progress)
+            )
+            if duplicates:
+                st.warning(f"以下邮箱被多个用户使用，仅为第一个用户建立了标记：{duplicates}")
+            else:
+                st.success("已完成补建。")
+
+    # endregion
+
+    # region 令牌用量汇总
+
+    with maintenance_tabs[maintenance_items.index("令牌用量汇总")]:
+        st.subheader("令牌用量汇总", divider="rainbow", anchor=False)
+        st.text("根据 token_records 重新计算用户及全站的日、月令牌用量汇总，覆盖已有汇总文档")
+        rollups_progress = st.progress(0)
+        if st.button("开始计算", key="backfill-rollups-btn", help="✨ 重新计算令牌用量汇总"):
+            st.session_state.dbi.flush_token_records()
+            written = backfill_token_rollups(
+                st.session_state.dbi.db,
+                lambda i, n: update_and_display_progress(i, n, rollups_progress),
+            )
+            st.success(f"已写入 {written} 个汇总文档。")
+
+    # endregion
+
+    # region 离线词典包
+
+    with maintenance_tabs[maintenance_items.index("离线词典包")]:
+        st.subheader("离线词典包", divider="rainbow", anchor=False)
+        st.text("将 words 集合导出为压缩的 SQLite 离线包，随部署发布。查询单词时优先读取离线包，未收录的单词才查询数据库")
+        word_bundle = get_word_bundle()
+        if word_bundle is None:
+            st.info("尚未部署离线词典包")
+        else:
+            st.caption(f"当前版本：{word_bundle.version}，文档数：{len(word_bundle)}")
+        bundle_progress = st.progress(0)
+        if st.button("开始导出", key="export-words-bundle-btn", help="✨ 导出 words 集合并替换离线词典包"):
+            res = export_words_bundle(
+                st.session_state.dbi.db,
+                progress_callback=lambda i, n: update_and_display_progress(
+                    i, n, bundle_progress
+                ),
+            )
+            # 本进程改用新的离线包，其他进程重启后生效
+            get_word_bundle.cache_clear()
+            st.success(f"已导出 {res['count']} 个单词文档，版本：{res['version']}")
+
+    # endregion
+
+# endregion
+
+# region 统计分析
+
+elif menu == "统计分析":
+    stats_items = ["令牌用量", "RPC统计"]
+    stats_tabs = st.tabs(stats_items)
+
+    # region 令牌用量
+
+    with stats_tabs[stats_items.index("令牌用量")]:
+        st.subheader("令牌用量", divider="rainbow", anchor=False)
+        usage_cols = st.columns(3)
+        usage_period = usage_cols[0].radio(
+            "统计周期", ["按日", "按月"], horizontal=True, key="admin-usage-period"
+        )
+        usage_count = usage_cols[1].number_input(
+            "周期数",
+            min_value=1,
+            max_value=90 if usage_period == "按日" else 24,
+            value=30 if usage_period == "按日" else 12,
+            key="admin-usage-count",
+        )
+        usage_phone = usage_cols[2].text_input(
+            "手机号码", key="admin-usage-phone", help="✨ 留空显示全站用量"
+        )
+        usage_rows = get_token_usage(
+            st.session_state.dbi.db,
+            "day" if usage_period == "按日" else "month",
+            int(usage_count),
+            usage_phone or None,
+        )
+        usage_df = pd.DataFrame(
+            [row["by_type"] for row in usage_rows],
+            index=[row["date"] for row in usage_rows],
+        ).fillna(0)
+        if usage_df.empty:
+            st.info("期间内没有令牌使用记录")
+        else:
+            st.bar_chart(usage_df, height=300)
+            st.dataframe(
+                pd.DataFrame(usage_rows)[["date", "total_tokens", "record_count"]],
+                column_config={
+                    "date": "日期",
+                    "total_tokens": "令牌数",
+                    "record_count": "调用次数",
+                },
+                hide_index=True,
+                use_container_width=True,
+            )
+
+    # endregion
+
+    # region RPC统计
+
+    with stats_tabs[stats_items.index("RPC统计")]:
+        st.subheader("Firestore RPC 统计", divider="rainbow", anchor=False)
+        st.text("本进程自启动（或上次清零）以来经由 Firestore 客户端的调用，按页面、调用方、方法汇总")
+        st.caption(
+            "仅统计同步客户端。经由 AsyncDbInterface（异步客户端，run_concurrently）的读写不在此列，"
+            "例如单词页中副本未命中时的并发读取；这些读取也不计入会话日志。"
+        )
+        rpc_cols = st.columns([1, 1, 8])
+        if rpc_cols[0].button("刷新", key="refresh-rpc-btn"):
+            st.rerun()
+        if rpc_cols[1].button("清零", key="reset-rpc-btn", help="✨ 清零进程级 RPC 统计"):
+            rpc_stats.reset()
+        rpc_df = pd.DataFrame(rpc_stats.rows())
+        if rpc_df.empty:
+            st.info("没有记录")
+        else:
+            rpc_df["latency"] = (rpc_df["latency"] * 1000).round(0)
+            group_by = st.radio(
+                "汇总方式", ["page", "caller", "method"], horizontal=True, key="rpc-group-by"
+            )
+            st.bar_chart(
+                rpc_df.groupby(group_by)[["reads", "writes"]].sum(),
+                height=300,
+            )
+            st.dataframe(
+                rpc_df.sort_values("reads", ascending=False),
+                column_config={
+                    "page": "页面",
+                    "caller": "调用方",
+                    "method": "方法",
+                    "calls": "调用次数",
+                    "reads": "读取文档数",
+                    "writes": "写入次数",
+                    "latency": "累计耗时(ms)",
+                },
+                hide_index=True,
+                use_container_width=True,
+            )
+
+    # endregion
+
+# endregion
+
 # # region 转移数据库
 
 
@@ -1230,3 +1538,6 @@ elif menu == "词典管理":
 # # endregion
 
 # endregion
+
+# 提交本次运行中排队的写入，记录本次运行的 RPC 数量
+end_run()
@@ -0,0 +1,87 @@
+import pytest
+
+from mypylib.db_cache import (
+    MISSING,
+    DocumentCache,
+    normalize_field_mask,
+    project_fields,
+)
+
+
+@pytest.fixture
+def cache():
+    return DocumentCache({"users": (2, 60), "mini_dict": (10, 60)})
+
+
+def test_get_missing(cache):
+    assert cache.get("users", "13800000000") is MISSING
+    assert cache.get("unknown", "x") is MISSING
+
+
+def test_cache_none_for_nonexistent_doc(cache):
+    cache.set("users", "13800000000", None)
+    assert cache.get("users", "13800000000") is None
+
+
+def test_returned_dict_is_copy(cache):
+    cache.set("mini_dict", "apple", {"translation": "苹果"})
+    doc = cache.get("mini_dict", "apple")
+    doc["translation"] = "梨"
+    assert cache.get("mini_dict", "apple") == {"translation": "苹果"}
+
+
+def test_nested_values_are_not_shared(cache):
+    doc = {"image_urls": ["u1"], "en-US": {"noun": ["n"]}}
+    cache.set("mini_dict", "apple", doc)
+    doc["image_urls"].append("x")
+    cached = cache.get("mini_dict", "apple")
+    cached["image_urls"].sort(reverse=True)
+    cached["image_urls"].append("u2")
+    cached["en-US"]["noun"].append("m")
+    masked = cache.get("mini_dict", "apple", normalize_field_mask([("en-US", "noun")]))
+    masked["en-US"]["noun"].clear()
+    assert cache.get("mini_dict", "apple") == {
+        "image_urls": ["u1"],
+        "en-US": {"noun": ["n"]},
+    }
+
+
+def test_update_and_invalidate(cache):
+    cache.set("mini_dict", "apple", {"translation": "苹果"})
+    cache.update("mini_dict", "apple", {"image_urls": ["u"]})
+    assert cache.get("mini_dict", "apple") == {
+        "translation": "苹果",
+        "image_urls": ["u"],
+    }
+    cache.invalidate("mini_dict", "apple")
+    assert cache.get("mini_dict", "apple") is MISSING
+
+
+def test_lru_eviction(cache):
+    cache.set("users", "a", {})
+    cache.set("users", "b", {})
+    cache.get("users", "a")
+    cache.set("users", "c", {})
+    assert cache.get("users", "b") is MISSING
+    assert cache.get("users", "a") == {}
+
+
+def test_masked_entry_projected_from_full_doc(cache):
+    cache.set("users", "13800000000", {"total_tokens": 5, "personal_vocabulary": ["a"]})
+    mask = normalize_field_mask(["total_tokens"])
+    assert cache.get("users", "13800000000", mask) == {"total_tokens": 5}
+
+
+def test_masked_entry_invalidated_with_doc(cache):
+    mask = normalize_field_mask([("en-US", "noun"), "us_written"])
+    cache.set("mini_dict", "apple", {"us_written": "x"}, mask)
+    assert cache.get("mini_dict", "apple", mask) == {"us_written": "x"}
+    assert cache.get("mini_dict", "apple") is MISSING
+    cache.invalidate("mini_dict", "apple")
+    assert cache.get("mini_dict", "apple", mask) is MISSING
+
+
+def test_project_nested_fields():
+    data = {"en-US": {"noun": [1], "verb": [2]}, "us_written": "x"}
+    mask = normalize_field_mask([("en-US", "noun"), "uk_written"])
+    assert project_fields(data, mask) == {"en-US": {"noun": [1]}}
@@ -0,0 +1,95 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pytest
+
+from mypylib.deck_prefetch import DeckPrefetcher, script_thread_only
+
+
+def test_prefetch_runs_tasks_in_deck_order():
+    calls = []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        prefetcher = DeckPrefetcher(
+            ["b", "a", "b", "c"],
+            [lambda w: calls.append(("info", w)), lambda w: calls.append(("image", w))],
+            executor,
+        )
+    assert len(prefetcher) == 3
+    assert prefetcher.ready_count() == 3
+    assert calls == [
+        ("info", "b"),
+        ("image", "b"),
+        ("info", "a"),
+        ("image", "a"),
+        ("info", "c"),
+        ("image", "c"),
+    ]
+
+
+def test_failed_task_does_not_stop_others():
+    calls = []
+
+    def fail(word):
+        raise ValueError(word)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        prefetcher = DeckPrefetcher(["a"], [fail, calls.append], executor)
+    assert prefetcher.is_ready("a")
+    assert calls == ["a"]
+
+
+def test_cancel_skips_pending_words():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def task(word):
+        calls.append(word)
+        started.set()
+        release.wait()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        prefetcher = DeckPrefetcher(["a", "b", "c"], [task], executor)
+        started.wait()
+        prefetcher.cancel()
+        release.set()
+    assert calls == ["a"]
+    assert not prefetcher.is_ready("x")
+
+
+def test_script_thread_only_task_is_not_run_off_thread():
+    calls = []
+
+    @script_thread_only
+    def touches_session_state(word, dbi=None):
+        calls.append(word)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for task in (touches_session_state, partial(touches_session_state, dbi=1)):
+            with pytest.raises(ValueError):
+                DeckPrefetcher(["a"], [calls.append, task], executor)
+    assert calls == []
+
+
+def test_wait_blocks_only_for_running_word():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def task(word):
+        if word == "a":
+            started.set()
+            release.wait()
+        calls.append(word)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        prefetcher = DeckPrefetcher(["a", "b"], [task], executor)
+        started.wait()
+        # 尚未开始的单词不等待
+        assert not prefetcher.wait("b", timeout=0.01)
+        assert not prefetcher.wait("a", timeout=0.01)
+        release.set()
+        assert prefetcher.wait("a", timeout=5)
+    assert calls == ["a", "b"]
+    assert not prefetcher.wait("x")
@@ -0,0 +1,93 @@
+import json
+import random
+
+from mypylib.exercise_bank import (
+    ExerciseBank,
+    level_name,
+    load_exercise_bank,
+    option_letter,
+)
+
+
+def _write_exercises(exercise_dir):
+    exercise_dir.mkdir()
+    basic = [
+        {
+            "header": "英语语法入门练习题（一）",
+            "questions": [
+                {"question": "How ______ you?", "cn": "你好吗?", "options": ["A. is", "B. are"]},
+                {"question": "中文题目 ______.", "cn": "测试", "options": ["A. 甲", "B. 乙"]},
+            ],
+        },
+        {
+            "header": "英语语法入门练习题（二）",
+            "questions": [
+                {
+                    "question": "I want ______ goodbye.",
+                    "options": ["A. to say", "B. say"],
+                    "answer": "A. to say",
+                }
+            ],
+        },
+    ]
+    cet = [
+        {
+            "header": "英语四级词汇语法练习题 第041组 ",
+            "questions": [
+                {"question": "q1", "options": ["A. excess", "B. exceed"], "answer": " B"}
+            ],
+        }
+    ]
+    with open(exercise_dir / "00_语法入门练习题.json", "w", encoding="utf-8") as f:
+        json.dump(basic, f, ensure_ascii=False, indent=4)
+    with open(exercise_dir / "10_四级词汇语法练习题.json", "w", encoding="utf-8") as f:
+        json.dump(cet, f, ensure_ascii=False)
+
+
+def test_names_and_letters():
+    assert level_name("00_语法入门练习题.json") == "语法入门"
+    assert option_letter(" A. excess") == "A"
+    assert option_letter("c") == "C"
+
+
+def test_random_access_matches_files(tmp_path):
+    _write_exercises(tmp_path / "exercise")
+    bank = ExerciseBank.build(tmp_path / "exercise")
+    assert len(bank) == 4
+    assert bank.levels() == ["语法入门", "四级词汇语法"]
+    assert bank.question(1)["question"] == "中文题目 ______."
+    assert bank.question(2)["header"] == "英语语法入门练习题（二）"
+    assert bank.question(3)["level"] == "四级词汇语法"
+    assert [s["count"] for s in bank.sections("语法入门")] == [2, 1]
+
+
+def test_sample_within_level_and_section(tmp_path):
+    _write_exercises(tmp_path / "exercise")
+    bank = ExerciseBank.build(tmp_path / "exercise")
+    rng = random.Random(0)
+    assert sorted(bank.sample(10, "语法入门", rng=rng)) == [0, 1, 2]
+    assert bank.sample(10, section=1, rng=rng) == [2]
+    assert bank.sample(10, "四级词汇语法", rng=rng) == [3]
+
+
+def test_check_answer(tmp_path):
+    _write_exercises(tmp_path / "exercise")
+    bank = ExerciseBank.build(tmp_path / "exercise")
+    assert bank.check_answer(0, "B. are") is None
+    assert bank.check_answer(2, "A. to say") is True
+    assert bank.check_answer(3, "A. excess") is False
+    assert bank.check_answer(3, "B. exceed") is True
+
+
+def test_saved_index_is_reused_until_files_change(tmp_path):
+    exercise_dir = tmp_path / "exercise"
+    index_fp = tmp_path / "exercise_index.json"
+    _write_exercises(exercise_dir)
+    bank = load_exercise_bank(exercise_dir, index_fp)
+    assert index_fp.exists()
+    reloaded = load_exercise_bank(exercise_dir, index_fp)
+    assert reloaded.check_answer(2, "A") is True
+    assert reloaded.question(1) == bank.question(1)
+    with open(exercise_dir / "05_语法进阶练习题.json", "w", encoding="utf-8") as f:
+        json.dump([{"header": "h", "questions": [{"question": "q", "options": []}]}], f)
+    assert len(load_exercise_bank(exercise_dir, index_fp)) == 5
@@ -0,0 +1,55 @@
+import random
+
+from mypylib.pic_quiz import PicQuizIndex
+
+
+def _question(category, level, answer):
+    return {
+        "category": category,
+        "level": level,
+        "question": "Which word matches the image?",
+        "options": [answer, "x", "y"],
+        "image_fp": f"resource/quiz/images/{category}/{answer}.jpg",
+        "answer": answer,
+    }
+
+
+def _index():
+    return PicQuizIndex(
+        [
+            _question("animals-not-mammals", "1_1", "frog"),
+            _question("animals", "2_1", "bear"),
+            _question("animals", "1_1", "elephant"),
+            _question("sports", "1_1", "tennis"),
+        ]
+    )
+
+
+def test_categories_are_exact_not_prefix():
+    index = _index()
+    assert index.categories() == ["animals", "animals-not-mammals", "sports"]
+    assert index.count("animals") == 2
+    assert index.levels("animals") == ["1_1", "2_1"]
+    assert index.count("animals", "2_1") == 1
+    assert index.count("missing") == 0
+
+
+def test_sample_by_category_and_level():
+    index = _index()
+    rng = random.Random(0)
+    assert {q["answer"] for q in index.sample("animals", 10, rng=rng)} == {
+        "bear",
+        "elephant",
+    }
+    assert [q["answer"] for q in index.sample("animals", 10, "2_1", rng)] == ["bear"]
+    assert index.sample("missing", 3, rng=rng) == []
+
+
+def test_sample_does_not_mutate_shared_questions():
+    index = _index()
+    rng = random.Random(1)
+    picked = [index.sample("sports", 1, rng=rng)[0] for _ in range(10)]
+    assert {tuple(q["options"]) for q in picked} != {("tennis", "x", "y")}
+    picked[0]["options"].append("z")
+    assert index.sample("sports", 1, rng=rng)[0]["options"] != picked[0]["options"]
+    assert all(sorted(q["options"]) == ["tennis", "x", "y"] for q in picked[1:])
@@ -0,0 +1,53 @@
+from mypylib.srs import DAY, MIN_REVIEW_GAP, SrsScheduler
+
+
+def test_intervals_grow_on_correct_answers():
+    srs = SrsScheduler()
+    now = 1_000_000
+    assert srs.review(7, True, now)
+    assert srs.state[0]["due"] == now + DAY
+    now += DAY
+    srs.review(7, True, now)
+    assert srs.state[0]["due"] == now + 6 * DAY
+    now += 6 * DAY
+    srs.review(7, True, now)
+    assert srs.state[0]["interval"] == 15.0
+
+
+def test_wrong_answer_relearns_and_lowers_ease():
+    srs = SrsScheduler()
+    srs.review(3, True, 0)
+    srs.review(3, False, DAY)
+    item = srs.state[0]
+    assert item["reps"] == 0
+    assert item["lapses"] == 1
+    assert abs(item["ease"] - 2.3) < 1e-6
+
+
+def test_repeated_check_is_ignored():
+    srs = SrsScheduler()
+    assert srs.review(1, False, 100)
+    assert not srs.review(1, True, 100 + MIN_REVIEW_GAP - 1)
+
+
+def test_due_ids_in_due_order_and_skip_stale_entries():
+    srs = SrsScheduler()
+    for word_id in range(100):
+        srs.review(word_id, True, word_id * 1000)
+    # 重新复习后原堆条目失效
+    srs.review(0, True, 200_000)
+    now = 99 * 1000 + DAY
+    assert srs.due_ids(3, now) == [1, 2, 3]
+    # 取出后仍然到期
+    assert srs.due_ids(3, now) == [1, 2, 3]
+    assert 0 not in srs.due_ids(200, now)
+
+
+def test_round_trip_and_new_ids():
+    srs = SrsScheduler()
+    for word_id in (5, 9, 2):
+        srs.review(word_id, True, 0)
+    restored = SrsScheduler.from_bytes(srs.to_bytes())
+    assert len(restored) == 3
+    assert restored.new_ids([1, 2, 3, 9]).tolist() == [1, 3]
+    assert restored.due_ids(5, DAY) == [2, 5, 9]
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+from mypylib.token_rollups import aggregate_token_records, recent_dates
+
+
+def _record(phone_number, token_type, count, used_at):
+    return {
+        "phone_number": phone_number,
+        "token_type": token_type,
+        "used_token_count": count,
+        "used_at": used_at,
+    }
+
+
+def test_aggregate_by_user_and_type():
+    used_at = datetime(2024, 3, 1, 2, 0, tzinfo=timezone.utc)
+    rollups = aggregate_token_records(
+        [
+            _record("13800000000", "聊天机器人", 100, used_at),
+            _record("13800000000", "挑选图片", 20, used_at),
+            _record("13900000000", "聊天机器人", 5, used_at),
+        ]
+    )
+    day = rollups["user_13800000000_day_2024-03-01"]
+    assert day["total_tokens"] == 120
+    assert day["record_count"] == 2
+    assert day["by_type"] == {"聊天机器人": 100, "挑选图片": 20}
+    assert rollups["all_month_2024-03"]["total_tokens"] == 125
+    assert len(rollups) == 6
+
+
+def test_day_boundary_uses_beijing_time():
+    # 北京时间 2024-03-01 00:30
+    used_at = datetime(2024, 2, 29, 16, 30, tzinfo=timezone.utc)
+    rollups = aggregate_token_records([_record("13800000000", "聊天机器人", 1, used_at)])
+    assert "all_day_2024-03-01" in rollups
+    assert "all_month_2024-03" in rollups
+
+
+def test_recent_months_cross_year():
+    now = datetime(2024, 2, 10, tzinfo=timezone.utc)
+    assert recent_dates("month", 3, now) == ["2023-12", "2024-01", "2024-02"]
+    assert recent_dates("day", 2, now) == ["2024-02-09", "2024-02-10"]
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from mypylib.vocabulary_bitmap import (
+    VocabularyBitmap,
+    WordIdRegistry,
+    decode_vocabulary,
+    encode_vocabulary,
+)
+
+
+@pytest.fixture
+def registry():
+    return WordIdRegistry(["apple", "banana", "cherry", "date", "elder"])
+
+
+def test_split_unknown_words(registry):
+    ids, unknown = registry.split(["banana", "zebra", "apple"])
+    assert ids.tolist() == [1, 0]
+    assert unknown == ["zebra"]
+
+
+def test_bitmap_roundtrip(registry):
+    bitmap = VocabularyBitmap.from_ids(np.array([0, 3]), len(registry))
+    restored = VocabularyBitmap.from_bytes(bitmap.to_bytes(), len(registry))
+    assert restored == bitmap
+    assert 3 in restored and 1 not in restored
+    assert len(restored) == 2
+
+
+def test_bitmap_keeps_bits_beyond_registry():
+    bitmap = VocabularyBitmap.from_ids(np.array([1, 9]), 10)
+    restored = VocabularyBitmap.from_bytes(bitmap.to_bytes(), 5)
+    assert 9 in restored
+
+
+def test_set_operations():
+    a = VocabularyBitmap.from_ids(np.array([0, 1, 2]), 4)
+    b = VocabularyBitmap.from_ids(np.array([2, 5]), 6)
+    assert (a | b).ids().tolist() == [0, 1, 2, 5]
+    assert (a & b).ids().tolist() == [2]
+    assert (a - b).ids().tolist() == [0, 1]
+
+
+def test_encode_decode_vocabulary(registry):
+    fields = encode_vocabulary(["cherry", "apple", "zebra"], registry)
+    assert fields["vocabulary_overflow"] == ["zebra"]
+    assert sorted(decode_vocabulary(fields, registry)) == ["apple", "cherry", "zebra"]
@@ -0,0 +1,42 @@
+import sqlite3
+
+from mypylib.word_bundle import BUNDLE_FORMAT, WordBundle, decode_doc, encode_doc
+
+
+def _write_bundle(fp, docs, format=BUNDLE_FORMAT):
+    conn = sqlite3.connect(fp)
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE TABLE words (doc_name TEXT PRIMARY KEY, data BLOB NOT NULL)")
+    conn.executemany(
+        "INSERT INTO words VALUES (?, ?)",
+        [(name, encode_doc(doc)) for name, doc in docs.items()],
+    )
+    conn.executemany(
+        "INSERT INTO meta VALUES (?, ?)",
+        [("format", str(format)), ("version", "v1"), ("count", str(len(docs)))],
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_encode_roundtrip_keeps_chinese():
+    doc = {"zh-CN": {"translation": "苹果"}, "level": "A1"}
+    assert decode_doc(encode_doc(doc)) == doc
+
+
+def test_bundle_lookup(tmp_path):
+    fp = tmp_path / "words_bundle.sqlite"
+    _write_bundle(fp, {"apple": {"level": "A1"}, "a or an": {"level": "A1"}})
+    bundle = WordBundle.open(fp)
+    assert bundle.version == "v1"
+    assert len(bundle) == 2
+    assert bundle.get("a or an") == {"level": "A1"}
+    assert bundle.get("banana") is None
+    assert "apple" in bundle
+
+
+def test_missing_or_outdated_bundle_is_ignored(tmp_path):
+    assert WordBundle.open(tmp_path / "missing.sqlite") is None
+    fp = tmp_path / "old.sqlite"
+    _write_bundle(fp, {"apple": {}}, format=BUNDLE_FORMAT - 1)
+    assert WordBundle.open(fp) is None
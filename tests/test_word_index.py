@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from mypylib.vocabulary_bitmap import WordIdRegistry
+from mypylib.word_index import PERSONAL_LIST_NAME, SessionWordLists, WordIndex
+
+
+@pytest.fixture
+def index():
+    word_lists = {
+        "1-CEFR-A1": ["apple", "cat"],
+        "1-CEFR-B1": ["apple", "zebra"],
+        "4-coca20000": ["cat", "zebra", "ice cream", "a/an"],
+    }
+    return WordIndex.build(word_lists, WordIdRegistry(["cat", "apple"]))
+
+
+def test_ids_follow_registry(index):
+    assert index.id_of("cat") == 0
+    assert index.id_of("apple") == 1
+    # 未登记的单词按字母顺序排在后面
+    assert index.words[2:] == ["a/an", "ice cream", "zebra"]
+    assert index.ids_of(["zebra", "dog"]).tolist() == [4, -1]
+
+
+def test_lowest_level(index):
+    assert index.lowest_level("apple") == "A1"
+    assert index.lowest_level("zebra") == "B1"
+    assert index.lowest_level("ice cream") is None
+    ids = index.ids_of(["apple", "zebra", "dog"])
+    assert index.lowest_levels(ids).tolist() == [0, 2, -1]
+
+
+def test_lists(index):
+    assert index.list_words("1-CEFR-B1") == ["apple", "zebra"]
+    assert sorted(index.lists_of("cat")) == ["1-CEFR-A1", "4-coca20000"]
+    assert index.in_list(index.ids_of(["cat", "apple"]), "4-coca20000").tolist() == [
+        True,
+        False,
+    ]
+    assert sorted(index.unique_words(include_phrases=False)) == [
+        "a/an",
+        "apple",
+        "cat",
+        "zebra",
+    ]
+
+
+def test_save_and_load(index, tmp_path):
+    fp = tmp_path / "word_index.npz"
+    index.save(fp, "abc")
+    assert WordIndex.load(fp, "other") is None
+    loaded = WordIndex.load(fp, "abc")
+    assert loaded.words == index.words
+    assert loaded.word_lists() == index.word_lists()
+    assert np.array_equal(loaded.level_ids("A1"), index.level_ids("A1"))
+
+
+def test_filtered_views_are_shared(index):
+    view = index.view("4-coca20000", exclude_slash=True)
+    assert index.words_of(view) == ["cat", "zebra", "ice cream"]
+    assert index.view("4-coca20000", exclude_slash=True) is view
+    no_phrases = index.view("4-coca20000", exclude_slash=True, exclude_phrases=True)
+    assert index.words_of(no_phrases) == ["cat", "zebra"]
+
+
+def test_session_overlay(index):
+    lists = SessionWordLists(index)
+    assert PERSONAL_LIST_NAME not in lists.names()
+    lists.set_personal(["dog", "a/b"])
+    assert lists.names()[0] == PERSONAL_LIST_NAME
+    assert lists.count(PERSONAL_LIST_NAME) == 2
+    assert lists.sample(PERSONAL_LIST_NAME, 5, exclude_slash=True) == ["dog"]
+    assert sorted(lists.sample("4-coca20000", 10, exclude_slash=True)) == [
+        "cat",
+        "ice cream",
+        "zebra",
+    ]
+    lists.set_personal([])
+    assert PERSONAL_LIST_NAME not in lists
@@ -0,0 +1,59 @@
+from mypylib.word_search import WordSearchIndex, edit_distance
+
+
+def _index():
+    index = WordSearchIndex()
+    index.add_words(["apple", "apply", "application", "banana", "Monday"])
+    index.update_docs(
+        {
+            "apple": {"translation": "n. 苹果"},
+            "banana": {"translation": "n. 香蕉"},
+            "pineapple": {"translation": "n. 菠萝；凤梨"},
+            "Monday": {"translation": "n. 星期一"},
+        }
+    )
+    return index
+
+
+def test_edit_distance_counts_transposition_once():
+    assert edit_distance("recieve", "receive", 2) == 1
+    assert edit_distance("apple", "apply", 2) == 1
+    assert edit_distance("abc", "xyz", 2) == 3
+
+
+def test_prefix_is_case_insensitive_and_sorted():
+    index = _index()
+    assert index.prefix("APP") == ["apple", "application", "apply"]
+    assert index.prefix("mon") == ["Monday"]
+    assert index.prefix("x") == []
+
+
+def test_fuzzy_matches_typos():
+    index = _index()
+    matches = index.fuzzy("banaan")
+    assert matches[0] == ("banana", 1)
+    assert ("apple", 1) in index.fuzzy("aple")
+
+
+def test_reverse_by_chinese_translation():
+    index = _index()
+    assert index.reverse("苹果") == ["apple"]
+    assert index.reverse("梨") == ["pineapple"]
+    assert index.reverse("星期") == ["Monday"]
+
+
+def test_incremental_translation_update():
+    index = _index()
+    index.update_docs({"apple": {"translation": "n. 苹果公司"}, "banana": None})
+    assert index.reverse("公司") == ["apple"]
+    assert index.reverse("香蕉") == []
+    # 单词本身仍可按前缀检索
+    assert index.prefix("ban") == ["banana"]
+
+
+def test_search_combines_prefix_and_fuzzy():
+    index = _index()
+    results = index.search("appl")
+    assert [r["match"] for r in results[:3]] == ["前缀"] * 3
+    assert results[0] == {"word": "apple", "translation": "n. 苹果", "match": "前缀"}
+    assert index.search("香蕉")[0]["match"] == "译文"